@@ -0,0 +1,195 @@
+"""asyncio counterparts to the describe module
+
+Uses psycopg 3's AsyncConnection so describing tables doesn't block the
+event loop. The catalog queries and extract_* methods are shared with the
+synchronous TableDefinition and SchemaDefinition, so to_json() output is
+identical to the sync path.
+
+Usage
+---------
+db_conn = await psycopg.AsyncConnection.connect(dsn)
+definition = await AsyncTableDefinition.describe(schema, name, db_conn)
+
+"""
+import asyncio
+
+from psycopg import AsyncConnection
+from psycopg.rows import dict_row
+
+from describe import SchemaDefinition, TableDefinition, group_table_rows
+from queries import INFORMATION_SCHEMA, get_queries
+
+
+async def fetch_catalog_rows(db_conn: AsyncConnection,
+                             backend: str,
+                             query: str,
+                             namespaces: list,
+                             table_name: str = None) -> list:
+    where_dict = {"namespaces": namespaces, "table_name": table_name}
+
+    async with db_conn.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute(get_queries(backend)[query], where_dict)
+        return await cursor.fetchall()
+
+
+class AsyncTableDefinition(TableDefinition):
+    """Generate definitions for a table over an AsyncConnection
+
+    Construct with the describe() coroutine rather than directly, as
+    __init__ can't await the catalog queries.
+
+    Usage
+    ---------
+    db_conn = await psycopg.AsyncConnection.connect()
+    definition = await AsyncTableDefinition.describe(schema, name, db_conn)
+
+    """
+
+    @classmethod
+    async def describe(cls,
+                       schema: str,
+                       name: str,
+                       db_conn: AsyncConnection,
+                       backend: str = INFORMATION_SCHEMA):
+        definition = cls()
+        definition.namespace = schema
+        definition.name = name
+        definition.connection = db_conn
+        definition.backend = backend
+
+        if not await definition.check_table_exists():
+            raise NameError("The requested table does not exist: "
+                            "{}.{}".format(schema, name))
+
+        await definition.get_column_list()
+        await definition.get_index_list()
+        await definition.get_permission_list()
+        await definition.get_partition_list()
+        await definition.get_storage_list()
+
+        return definition
+
+    async def _fetch(self, query: str) -> list:
+        rows = await fetch_catalog_rows(self.connection,
+                                        self.backend,
+                                        query,
+                                        [self.namespace],
+                                        self.name)
+
+        return group_table_rows(rows).get((self.namespace, self.name),
+                                          list())
+
+    async def check_table_exists(self) -> bool:
+        return len(await self._fetch('tables')) == 1
+
+    async def get_column_list(self) -> list:
+        columns = await self._fetch('columns')
+        self.extract_column_definitions(columns)
+        return columns
+
+    async def get_index_list(self) -> list:
+        indexes = await self._fetch('indexes')
+        self.extract_index_definitions(indexes)
+        return indexes
+
+    async def get_permission_list(self) -> list:
+        permissions = await self._fetch('permissions')
+        self.extract_permission_definitions(permissions)
+        return permissions
+
+    async def get_partition_list(self) -> list:
+        partitions = await self._fetch('partitions')
+        self.extract_partition_definition(partitions)
+        return partitions
+
+    async def get_storage_list(self) -> list:
+        storage = await self._fetch('storage')
+        self.extract_storage_definition(storage)
+        return storage
+
+
+async def describe_schema_async(namespaces,
+                                db_conn: AsyncConnection,
+                                backend: str = INFORMATION_SCHEMA) -> list:
+    """
+    Describe every table in one or more schemas with a fixed number of
+    catalog queries, returning a list of TableDefinition's.
+    """
+
+    if isinstance(namespaces, str):
+        namespaces = [namespaces]
+
+    rows = dict()
+    for query in ('tables', 'columns', 'indexes', 'permissions',
+                  'partitions', 'storage'):
+        rows[query] = await fetch_catalog_rows(db_conn,
+                                               backend,
+                                               query,
+                                               list(namespaces))
+
+    schema = SchemaDefinition()
+    schema.namespaces = list(namespaces)
+    schema.connection = db_conn
+    schema.backend = backend
+
+    return schema.extract_table_definitions(rows['tables'],
+                                            rows['columns'],
+                                            rows['indexes'],
+                                            rows['permissions'],
+                                            rows['partitions'],
+                                            rows['storage'])
+
+
+async def describe_tables_async(tables: list,
+                                conninfo: str,
+                                concurrency: int = 4,
+                                backend: str = INFORMATION_SCHEMA) -> tuple:
+    """
+    Describe a list of (schema, table) pairs with at most `concurrency`
+    connections open at once.
+
+    Returns a tuple of the TableDefinition's that were described, in the
+    order the tables were requested, and a dict of the exceptions raised
+    for each (schema, table) that failed.
+    """
+
+    connections = asyncio.Queue()
+    for _ in range(min(concurrency, max(len(tables), 1))):
+        connections.put_nowait(await AsyncConnection.connect(conninfo))
+
+    async def describe(table: tuple) -> TableDefinition:
+        db_conn = await connections.get()
+        try:
+            definition = await AsyncTableDefinition.describe(
+                table[0], table[1], db_conn, backend)
+            definition.connection = None
+            return definition
+        finally:
+            try:
+                await db_conn.rollback()
+            except Exception:
+                # Replaced, so the tables after this one don't wait on or
+                # inherit a connection that can't roll back
+                await db_conn.close()
+                db_conn = await AsyncConnection.connect(conninfo)
+            finally:
+                connections.put_nowait(db_conn)
+
+    try:
+        results = await asyncio.gather(*[describe(table) for table in tables],
+                                       return_exceptions=True)
+    finally:
+        while not connections.empty():
+            await connections.get_nowait().close()
+
+    definitions = list()
+    failures = dict()
+
+    for table, result in zip(tables, results):
+        # CancelledError and the like are failures too, not definitions
+        if isinstance(result, BaseException):
+            failures[tuple(table)] = result
+        else:
+            definitions.append(result)
+
+    return definitions, failures
@@ -0,0 +1,317 @@
+"""asyncio counterparts to the compare, cost and executor modules
+
+Compares specs with the live tables, estimates the plan's cost and runs it
+over psycopg 3 AsyncConnections, so migrating doesn't block the event loop.
+Planning is shared with the synchronous path, and plans run as they do
+with execute_plan: a table's statements in dependency order on one
+connection, independent tables concurrently, each with its own
+lock_timeout and retries on lock contention.
+
+Usage
+---------
+results = await compare_schema_async(spec, db_conn, 'public')
+plan = plan_migration(results, concurrently=True)
+timings, failures = await execute_plan_async(plan, dsn, concurrency=8)
+
+"""
+import asyncio
+import random
+import time
+
+import psycopg
+from psycopg import AsyncConnection
+
+from async_describe import describe_schema_async
+from compare import as_table_definitions, compare_schemas
+from cost import (TABLE_SIZE_QUERY,
+                  VOLATILITY_QUERY,
+                  apply_plan_cost,
+                  plan_default_functions,
+                  plan_tables,
+                  read_table_sizes)
+from executor import (DEFAULT_LOCK_TIMEOUT,
+                      FAILED,
+                      OK,
+                      RETRY,
+                      RETRY_CODES,
+                      ROLLED_BACK,
+                      SKIPPED,
+                      TimingLog,
+                      dependency_graph,
+                      group_statements)
+from migrate import CREATE_INDEX, MigrationPlan, plan_migration, quote_table
+from queries import INFORMATION_SCHEMA
+
+
+async def compare_schema_async(spec,
+                               db_conn: AsyncConnection,
+                               namespace: str = 'public',
+                               backend: str = INFORMATION_SCHEMA) -> list:
+    """
+    Compare specs with the tables in a namespace, as CompareSchema does,
+    returning a PjsComparisonResult for each table that differs.
+    """
+
+    spec_definitions = as_table_definitions(spec)
+    for definition in spec_definitions:
+        definition.namespace = namespace
+
+    names = set(definition.name for definition in spec_definitions)
+    live_definitions = [
+        definition for definition in
+        await describe_schema_async(namespace, db_conn, backend)
+        if definition.name in names]
+
+    return compare_schemas(spec_definitions, live_definitions)
+
+
+async def estimate_plan_cost_async(plan: MigrationPlan,
+                                   db_conn: AsyncConnection) -> dict:
+    """
+    Set the cost and estimated_bytes of every statement in the plan, as
+    cost.estimate_plan_cost does.
+    """
+
+    functions = plan_default_functions(plan)
+    tables = plan_tables(plan)
+    found = dict()
+    sizes = dict()
+
+    async with db_conn.cursor() as cursor:
+        if functions:
+            await cursor.execute(VOLATILITY_QUERY,
+                                 {"functions": sorted(functions)})
+            found = dict(await cursor.fetchall())
+        if tables:
+            await cursor.execute(TABLE_SIZE_QUERY,
+                                 {"namespaces": [t[0] for t in tables],
+                                  "tables": [t[1] for t in tables]})
+            sizes = read_table_sizes(await cursor.fetchall())
+    await db_conn.rollback()
+
+    return apply_plan_cost(plan,
+                           sizes,
+                           db_conn.info.server_version,
+                           set(name for name in functions
+                               if found.get(name, True)))
+
+
+def retryable(error: Exception) -> bool:
+    return isinstance(error, psycopg.Error) and error.sqlstate in RETRY_CODES
+
+
+async def run_group(db_conn: AsyncConnection,
+                    group: list,
+                    attempt: int,
+                    timings: TimingLog):
+    """
+    Run a group of statements once, recording the timing of each.
+    """
+
+    transactional = group[0].transactional
+    await db_conn.set_autocommit(not transactional)
+    executed = list()
+
+    async with db_conn.cursor() as cursor:
+        for statement in group:
+            started_at = time.time()
+            try:
+                await cursor.execute(statement.sql)
+            except Exception as error:
+                if transactional:
+                    await db_conn.rollback()
+                status = RETRY if retryable(error) else FAILED
+                for previous, previous_started, duration in executed:
+                    timings.record(previous, ROLLED_BACK, attempt,
+                                   previous_started, duration)
+                timings.record(statement, status, attempt, started_at,
+                               time.time() - started_at, error)
+                raise
+            executed.append((statement, started_at,
+                             time.time() - started_at))
+
+        if transactional:
+            await db_conn.commit()
+
+    for statement, started_at, duration in executed:
+        timings.record(statement, OK, attempt, started_at, duration)
+
+
+async def clean_up_group(db_conn: AsyncConnection, group: list):
+    """
+    Drop any invalid index left by a concurrent build that failed, so it
+    can be built again.
+    """
+
+    for statement in group:
+        if statement.transactional:
+            continue
+        for action in statement.actions:
+            if action.kind != CREATE_INDEX:
+                continue
+            await db_conn.set_autocommit(True)
+            await db_conn.execute(
+                'DROP INDEX CONCURRENTLY IF EXISTS {}'.format(
+                    quote_table(statement.namespace, action.name)))
+
+
+async def run_table(db_conn: AsyncConnection,
+                    statements: list,
+                    lock_timeout,
+                    retries: int,
+                    backoff: float,
+                    timings: TimingLog):
+    """
+    Run one table's statements, retrying a group that fails on lock
+    contention as executor.run_table does.
+    """
+
+    await db_conn.set_autocommit(True)
+    await db_conn.execute("SELECT set_config('lock_timeout', %s, false)",
+                          (str(lock_timeout),))
+
+    groups = group_statements(statements)
+
+    try:
+        for index, group in enumerate(groups):
+            attempt = 0
+            while True:
+                try:
+                    await run_group(db_conn, group, attempt, timings)
+                    break
+                except Exception as error:
+                    if not retryable(error) or attempt >= retries:
+                        for statement in [statement for remaining
+                                          in groups[index + 1:]
+                                          for statement in remaining]:
+                            timings.record(statement, SKIPPED)
+                        raise
+                    await asyncio.sleep(backoff * 2 ** attempt
+                                        * random.uniform(0.5, 1.5))
+                    await clean_up_group(db_conn, group)
+                    attempt += 1
+    finally:
+        await db_conn.set_autocommit(True)
+        await db_conn.execute('RESET lock_timeout')
+
+
+def check_graph(graph: dict):
+    """
+    Raise a NameError if tables depend on tables that aren't in the plan,
+    or on each other in a cycle.
+    """
+
+    for key, dependencies in graph.items():
+        missing = dependencies - set(graph.keys())
+        if missing:
+            raise NameError("{}.{} depends on tables that aren't in the "
+                            "plan: {}".format(key[0], key[1], sorted(missing)))
+
+    finished = set()
+    pending = set(graph.keys())
+    while pending:
+        ready = set(key for key in pending if graph[key] <= finished)
+        if not ready:
+            raise NameError("The plan's tables have a circular "
+                            "dependency: {}".format(sorted(pending)))
+        finished |= ready
+        pending -= ready
+
+
+async def execute_plan_async(plan: MigrationPlan,
+                             conninfo: str,
+                             concurrency: int = 4,
+                             lock_timeout=DEFAULT_LOCK_TIMEOUT,
+                             table_lock_timeouts: dict = None,
+                             retries: int = 3,
+                             backoff: float = 0.5,
+                             log=None) -> tuple:
+    """
+    Run a plan with at most `concurrency` connections open at once. A table
+    only starts once every table it depends on has finished.
+
+    Arguments and the returned timing records and failures are as for
+    executor.execute_plan.
+    """
+
+    table_lock_timeouts = table_lock_timeouts or dict()
+    statements, graph = dependency_graph(plan)
+    check_graph(graph)
+
+    timings = TimingLog(log)
+    failures = dict()
+    finished = dict((key, asyncio.Event()) for key in statements.keys())
+
+    connections = asyncio.Queue()
+    for _ in range(min(concurrency, max(len(statements), 1))):
+        connections.put_nowait(await AsyncConnection.connect(conninfo))
+
+    async def migrate(key: tuple):
+        try:
+            for dependency in graph[key]:
+                await finished[dependency].wait()
+
+            failed = graph[key] & set(failures.keys())
+            if failed:
+                failures[key] = NameError("Skipped as {}.{} failed".format(
+                    *min(failed)))
+                for statement in statements[key]:
+                    timings.record(statement, SKIPPED)
+                return
+
+            db_conn = await connections.get()
+            try:
+                await run_table(db_conn,
+                                statements[key],
+                                table_lock_timeouts.get(key, lock_timeout),
+                                retries,
+                                backoff,
+                                timings)
+            except Exception as error:
+                failures[key] = error
+            finally:
+                connections.put_nowait(db_conn)
+        finally:
+            finished[key].set()
+
+    try:
+        await asyncio.gather(*[migrate(key) for key in statements.keys()])
+    finally:
+        while not connections.empty():
+            await connections.get_nowait().close()
+
+    return timings.records, failures
+
+
+async def migrate_async(spec,
+                        conninfo: str,
+                        namespace: str = 'public',
+                        concurrency: int = 4,
+                        concurrently: bool = False,
+                        max_rewrite_bytes: int = None,
+                        backend: str = INFORMATION_SCHEMA,
+                        **kwargs) -> tuple:
+    """
+    Compare specs with the live tables, plan and cost the migration, and
+    run it with execute_plan_async, passing on any other keyword arguments.
+    If max_rewrite_bytes is set, a NameError is raised before anything runs
+    when the plan would rewrite more than that. Seed files aren't loaded;
+    use seed.seed_new_tables for that.
+
+    Returns a tuple of the MigrationPlan, its timing records and failures.
+    """
+
+    async with await AsyncConnection.connect(conninfo) as db_conn:
+        results = await compare_schema_async(spec, db_conn, namespace, backend)
+        plan = plan_migration(results, concurrently=concurrently)
+        await estimate_plan_cost_async(plan, db_conn)
+
+    if max_rewrite_bytes is not None:
+        plan.check_budget(max_rewrite_bytes)
+
+    timings, failures = await execute_plan_async(plan,
+                                                 conninfo,
+                                                 concurrency,
+                                                 **kwargs)
+
+    return plan, timings, failures
@@ -0,0 +1,112 @@
+"""Measure rows converted per second by parse_with_function pipelines
+
+Compares resolving and calling each field's parser per value, the
+column-wise comprehension sync used before, and the converters from
+compile_batch_converter in rows and columns mode. Rows are converted from
+text, as a CSV or API source returns them, and again already typed, as a
+database source returns them.
+
+Usage
+---------
+python benchmarks/bench_convert.py --rows 200000
+
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from convert import (COLUMNS,  # noqa: E402
+                     ROWS,
+                     TYPE_PARSERS,
+                     compile_batch_converter,
+                     resolve_parser)
+from describe import ColumnDefinition  # noqa: E402
+
+COLUMNS_SPEC = [ColumnDefinition(name='id', type='bigint'),
+                ColumnDefinition(name='count', type='int',
+                                 parse_with_function='int'),
+                ColumnDefinition(name='amount', type='numeric',
+                                 parse_with_function='numeric'),
+                ColumnDefinition(name='created_at', type='timestamp',
+                                 parse_with_function='timestamp'),
+                ColumnDefinition(name='label', type='text',
+                                 parse_with_function='text')]
+
+
+def text_rows(count: int) -> list:
+    start = datetime(2020, 1, 1)
+    return [(i,
+             str(i % 1000),
+             '{}.{:02d}'.format(i, i % 100),
+             (start + timedelta(seconds=i)).isoformat(' '),
+             None if i % 10 == 0 else 'label {}'.format(i))
+            for i in range(count)]
+
+
+def typed_rows(count: int) -> list:
+    start = datetime(2020, 1, 1)
+    return [(i,
+             i % 1000,
+             Decimal(i) / 100,
+             start + timedelta(seconds=i),
+             None if i % 10 == 0 else 'label {}'.format(i))
+            for i in range(count)]
+
+
+def per_value(rows: list) -> list:
+    converted = list()
+    for row in rows:
+        values = list()
+        for column, value in zip(COLUMNS_SPEC, row):
+            if column.parse_with_function and value is not None:
+                value = resolve_parser(column.parse_with_function)[0](value)
+            values.append(value)
+        converted.append(tuple(values))
+    return converted
+
+
+def comprehension(rows: list) -> list:
+    parsers = [TYPE_PARSERS[column.parse_with_function][0]
+               if column.parse_with_function else None
+               for column in COLUMNS_SPEC]
+    columns = list(zip(*rows))
+    columns = [values if parser is None else
+               [None if value is None else parser(value) for value in values]
+               for parser, values in zip(parsers, columns)]
+    return list(zip(*columns))
+
+
+def rate(function, rows: list) -> float:
+    start = time.perf_counter()
+    function(rows)
+    return len(rows) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    converters = [
+        ('per value, resolved per call', per_value),
+        ('column comprehension', comprehension),
+        ('compiled, rows mode', compile_batch_converter(COLUMNS_SPEC, ROWS)),
+        ('compiled, columns mode',
+         compile_batch_converter(COLUMNS_SPEC, COLUMNS)),
+    ]
+
+    for label, rows in (('text', text_rows(args.rows)),
+                        ('typed', typed_rows(args.rows))):
+        print("{} rows:".format(label.capitalize()))
+        for name, function in converters:
+            print("  {:<30} {:>10.0f} rows/s".format(name,
+                                                     rate(function, rows)))
+
+
+if __name__ == '__main__':
+    main()
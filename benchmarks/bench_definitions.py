@@ -0,0 +1,155 @@
+"""Measure the memory held by the definitions of a large catalog
+
+Builds a synthetic catalog of TableDefinition's, by default 10,000 tables
+of 50 columns each with two indexes and two grants, once with the slotted
+definitions from describe.py and once with dict backed classes laid out
+as the definitions were before, and reports the memory each holds. The
+catalog is then built for three databases, as when comparing environments,
+with and without a catalog.Catalog interning the definitions.
+
+Usage
+---------
+python benchmarks/bench_definitions.py --tables 10000 --columns 50
+
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from catalog import Catalog  # noqa: E402
+from describe import (ColumnDefinition,  # noqa: E402
+                      IndexDefinition,
+                      PermissionDefinition,
+                      PrimaryKeyDefinition,
+                      TableDefinition)
+
+TYPES = ['bigint', 'int', 'text', 'varchar', 'numeric', 'timestamp']
+GRANTS = ['SELECT', 'INSERT', 'UPDATE', 'DELETE']
+
+
+class DictColumn:
+    def __init__(self, **kwargs):
+        self.name = kwargs.get('name')
+        self.type = kwargs.get('type')
+        self.identity = kwargs.get('identity', False)
+        self.nullable = kwargs.get('nullable', False)
+        self.max_length = kwargs.get('max_length', None)
+        self.default_value = kwargs.get('default_value', None)
+        self.primary = kwargs.get('primary', False)
+        self.parse_with_function = kwargs.get('parse_with_function', None)
+
+
+class DictIndex:
+    def __init__(self, **kwargs):
+        self.name = kwargs.get('name')
+        self.fields = kwargs.get('fields', list())
+        self.unique = kwargs.get('unique', False)
+        self.type = kwargs.get('type', None)
+
+
+class DictPermission:
+    def __init__(self, role_or_user: str, grants: list):
+        self.name = role_or_user
+        self.grants = grants
+
+
+class DictPrimaryKey:
+    def __init__(self, field: str = None, constraint: str = None):
+        self.fields = [field]
+        self.constraint_name = constraint
+        self.table_definition = None
+
+
+SLOTTED = (ColumnDefinition, IndexDefinition, PermissionDefinition,
+           PrimaryKeyDefinition)
+DICT_BACKED = (DictColumn, DictIndex, DictPermission, DictPrimaryKey)
+
+
+def build_catalog(classes: tuple, tables: int, columns: int) -> list:
+    column_class, index_class, permission_class, primary_key_class = classes
+    catalog = list()
+
+    for table in range(tables):
+        definition = TableDefinition()
+        definition.namespace = 'public'
+        definition.name = 'table_{}'.format(table)
+        definition.column_definitions = [
+            column_class(name='column_{}'.format(column),
+                         type=TYPES[column % len(TYPES)],
+                         nullable=column % 2 == 0,
+                         primary=column == 0)
+            for column in range(columns)]
+        definition.index_definitions = [
+            index_class(name='{}_index_{}'.format(definition.name, index),
+                        fields=['column_{}'.format(index + 1)],
+                        type='btree')
+            for index in range(2)]
+        definition.permission_definitions = [
+            permission_class('role_{}'.format(role), GRANTS[:role + 1])
+            for role in range(2)]
+        definition.primary_key_definition = primary_key_class(
+            'column_0', definition.name + '_pkey')
+        catalog.append(definition)
+
+    return catalog
+
+
+def build_databases(tables: int, columns: int, interned: bool) -> list:
+    catalog = Catalog()
+    databases = list()
+
+    for database in ('dev', 'staging', 'prod'):
+        definitions = build_catalog(SLOTTED, tables, columns)
+        if interned:
+            definitions = catalog.add(database, definitions)
+        databases.append(definitions)
+
+    return databases
+
+
+def measure(build) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    catalog = build()
+    seconds = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del catalog
+
+    return size, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tables', type=int, default=10000)
+    parser.add_argument('--columns', type=int, default=50)
+    args = parser.parse_args()
+
+    print("{} tables, {} columns".format(args.tables,
+                                         args.tables * args.columns))
+
+    builds = [
+        ('dict backed', lambda: build_catalog(DICT_BACKED, args.tables,
+                                              args.columns)),
+        ('slotted', lambda: build_catalog(SLOTTED, args.tables,
+                                          args.columns)),
+        ('slotted, 3 databases',
+         lambda: build_databases(args.tables, args.columns, False)),
+        ('interned, 3 databases',
+         lambda: build_databases(args.tables, args.columns, True)),
+    ]
+
+    for name, build in builds:
+        size, seconds = measure(build)
+        print("{:<22} {:>8.1f} MB {:>8.2f}s".format(
+            name, size / 2 ** 20, seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Measure the cold start cost of importing jsonspec
+
+Each run imports jsonspec in a fresh interpreter, from a working directory
+other than the repository root, and reports the median wall time of the
+import alongside whether pjs.schema or jsonschema were loaded by it.
+
+Usage
+---------
+python benchmarks/bench_import.py --runs 20
+
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+IMPORT_SCRIPT = """
+import sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import jsonspec
+elapsed = time.perf_counter() - start
+print(elapsed,
+      jsonspec.get_pjs_schema.cache_info().currsize,
+      'jsonschema' in sys.modules)
+"""
+
+
+def import_once(cwd: str) -> list:
+    output = subprocess.check_output(
+        [sys.executable, '-c', IMPORT_SCRIPT.format(root=REPO_ROOT)],
+        cwd=cwd)
+
+    elapsed, schema_loaded, jsonschema_loaded = output.decode().split()
+    return [float(elapsed), schema_loaded != '0', jsonschema_loaded == 'True']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cwd:
+        runs = [import_once(cwd) for _ in range(args.runs)]
+
+    print("import jsonspec       {:8.2f}ms median over {} runs".format(
+        statistics.median(run[0] for run in runs) * 1000, args.runs))
+    print("pjs.schema loaded     {}".format(any(run[1] for run in runs)))
+    print("jsonschema imported   {}".format(any(run[2] for run in runs)))
+
+
+if __name__ == '__main__':
+    main()
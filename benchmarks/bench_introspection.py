@@ -0,0 +1,114 @@
+"""Compare the information_schema and pg_catalog introspection backends
+
+Builds a scratch schema with several thousand tables, then times describing
+the whole schema, and a sample of single tables, with each backend.
+
+Usage
+---------
+DB_USER=postgres DB_PASS=test DB_HOST=localhost DB_PORT=5433 DB_NAME=pjs \\
+    python benchmarks/bench_introspection.py --tables 5000
+
+"""
+import argparse
+import os
+import sys
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from describe import SchemaDefinition, TableDefinition  # noqa: E402
+from queries import INFORMATION_SCHEMA, PG_CATALOG  # noqa: E402
+
+BENCH_SCHEMA = 'pjs_bench_introspection'
+
+
+def get_connection():
+    return psycopg2.connect(user=os.environ["DB_USER"],
+                            password=os.environ["DB_PASS"],
+                            host=os.environ["DB_HOST"],
+                            port=os.environ["DB_PORT"],
+                            database=os.environ["DB_NAME"])
+
+
+def drop_catalog(db_conn, tables: int):
+    cursor = db_conn.cursor()
+
+    for i in range(tables):
+        cursor.execute("DROP TABLE IF EXISTS {}.table_{}".format(
+            BENCH_SCHEMA, i))
+        if i % 100 == 0:
+            db_conn.commit()
+
+    cursor.execute("DROP SCHEMA IF EXISTS {} CASCADE".format(BENCH_SCHEMA))
+    db_conn.commit()
+    cursor.close()
+
+
+def build_catalog(db_conn, tables: int):
+    drop_catalog(db_conn, tables)
+
+    cursor = db_conn.cursor()
+    cursor.execute("CREATE SCHEMA {}".format(BENCH_SCHEMA))
+
+    for i in range(tables):
+        cursor.execute("""CREATE TABLE {0}.table_{1} (
+            id bigint not null,
+            label varchar(64),
+            amount numeric(10, 2) default 0,
+            created_at timestamp with time zone default now(),
+            CONSTRAINT table_{1}_pkey PRIMARY KEY (id)
+        );
+        CREATE INDEX table_{1}_created_at
+            ON {0}.table_{1} USING btree (created_at);
+        GRANT SELECT ON {0}.table_{1} TO PUBLIC;""".format(BENCH_SCHEMA, i))
+
+        # Commit in batches to stay under max_locks_per_transaction
+        if i % 100 == 0:
+            db_conn.commit()
+
+    db_conn.commit()
+    cursor.close()
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tables', type=int, default=5000)
+    parser.add_argument('--sample', type=int, default=50)
+    parser.add_argument('--keep', action='store_true',
+                        help='Keep the scratch schema after running')
+    args = parser.parse_args()
+
+    db_conn = get_connection()
+    build_catalog(db_conn, args.tables)
+
+    try:
+        sample = ['table_{}'.format(i)
+                  for i in range(0, args.tables,
+                                 max(1, args.tables // args.sample))]
+
+        print("{} tables, {} sampled".format(args.tables, len(sample)))
+        for backend in (INFORMATION_SCHEMA, PG_CATALOG):
+            schema_time = timed(SchemaDefinition,
+                                BENCH_SCHEMA, db_conn, backend)
+            table_time = sum(timed(TableDefinition,
+                                   BENCH_SCHEMA, name, db_conn, backend)
+                             for name in sample) / len(sample)
+
+            print("{:<20} schema {:8.3f}s  per table {:8.4f}s".format(
+                backend, schema_time, table_time))
+    finally:
+        if not args.keep:
+            drop_catalog(db_conn, args.tables)
+        db_conn.close()
+
+
+if __name__ == '__main__':
+    main()
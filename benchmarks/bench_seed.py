@@ -0,0 +1,103 @@
+"""Measure seed loading throughput and peak memory
+
+Writes a seed file of generated rows, then times seed_table loading it
+with COPY, and measures the peak memory traced while loading it again.
+Peak memory should stay flat as --rows grows.
+
+Usage
+---------
+DB_USER=postgres DB_PASS=test DB_HOST=localhost DB_PORT=5433 DB_NAME=pjs \\
+    python benchmarks/bench_seed.py --rows 1000000
+
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from describe import ColumnDefinition, TableDefinition  # noqa: E402
+from seed import seed_table  # noqa: E402
+
+BENCH_SCHEMA = 'pjs_bench_seed'
+
+
+def get_connection():
+    return psycopg2.connect(user=os.environ["DB_USER"],
+                            password=os.environ["DB_PASS"],
+                            host=os.environ["DB_HOST"],
+                            port=os.environ["DB_PORT"],
+                            database=os.environ["DB_NAME"])
+
+
+def write_seed_file(path: str, rows: int):
+    with open(path, 'w') as handle:
+        handle.write('[\n')
+        for i in range(rows):
+            handle.write(('' if i == 0 else ',\n') + json.dumps(
+                {"id": i,
+                 "label": "label {}".format(i),
+                 "amount": i * 0.5,
+                 "data": {"index": i, "tags": ["a", "b"]}}))
+        handle.write('\n]\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    definition = TableDefinition()
+    definition.name = 'seeded'
+    definition.column_definitions = [
+        ColumnDefinition(name='id', type='bigint'),
+        ColumnDefinition(name='label', type='text'),
+        ColumnDefinition(name='amount', type='numeric'),
+        ColumnDefinition(name='data', type='jsonb'),
+    ]
+
+    db_conn = get_connection()
+    cursor = db_conn.cursor()
+    cursor.execute("DROP SCHEMA IF EXISTS {} CASCADE".format(BENCH_SCHEMA))
+    cursor.execute("CREATE SCHEMA {}".format(BENCH_SCHEMA))
+    cursor.execute("CREATE TABLE {}.seeded (id bigint, label text, "
+                   "amount numeric, data jsonb)".format(BENCH_SCHEMA))
+    db_conn.commit()
+
+    handle, path = tempfile.mkstemp(suffix='.json')
+    os.close(handle)
+
+    try:
+        write_seed_file(path, args.rows)
+        size = os.path.getsize(path)
+
+        start = time.perf_counter()
+        rows = seed_table(definition, db_conn, path, BENCH_SCHEMA)
+        elapsed = time.perf_counter() - start
+        db_conn.rollback()
+
+        # Tracing slows loading down, so memory is measured separately
+        tracemalloc.start()
+        seed_table(definition, db_conn, path, BENCH_SCHEMA)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        db_conn.rollback()
+
+        print("{} rows, {:.1f} MB seed file".format(rows, size / 1024 ** 2))
+        print("{:.0f} rows/s, {:.1f} MB/s".format(
+            rows / elapsed, size / 1024 ** 2 / elapsed))
+        print("Peak traced memory {:.2f} MB".format(peak / 1024 ** 2))
+    finally:
+        os.remove(path)
+        cursor.execute("DROP SCHEMA {} CASCADE".format(BENCH_SCHEMA))
+        db_conn.commit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Measure how many specs per second can be validated against pjs.schema
+
+Compares jsonschema.validate, which checks the meta-schema and builds a new
+validator on every call, with jsonspec.validate_schema using the cached
+jsonschema validator and the fastjsonschema fast path.
+
+Usage
+---------
+python benchmarks/bench_validation.py --specs 2000
+
+"""
+import argparse
+import os
+import sys
+import time
+
+import jsonschema
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import jsonspec  # noqa: E402
+
+SAMPLE_SPEC = os.path.join(os.path.dirname(__file__), '..',
+                           'test/sample_json/valid_schema.json')
+
+
+def rate(function, specs: list) -> float:
+    start = time.perf_counter()
+    for spec in specs:
+        function(spec)
+    return len(specs) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--specs', type=int, default=2000)
+    args = parser.parse_args()
+
+    specs = [jsonspec.load_file(SAMPLE_SPEC) for _ in range(args.specs)]
+
+    results = [
+        ('jsonschema.validate',
+         lambda spec: jsonschema.validate(spec, jsonspec.PJS_SCHEMA)),
+        ('validate_schema (cached)',
+         lambda spec: jsonspec.validate_schema(spec, fast=False)),
+    ]
+
+    if jsonspec.get_fast_validator() is not None:
+        results.append(('validate_schema (fast)',
+                        lambda spec: jsonspec.validate_schema(spec)))
+    else:
+        print("fastjsonschema is not installed, skipping the fast path")
+
+    for name, function in results:
+        print("{:<28} {:>10.0f} specs/s".format(name, rate(function, specs)))
+
+
+if __name__ == '__main__':
+    main()
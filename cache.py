@@ -0,0 +1,202 @@
+"""On disk cache of described schemas
+
+Describing a large schema is expensive, but its DDL rarely changes. The
+CatalogCache stores the TableDefinition.to_json() output for each database
+and list of namespaces, alongside a fingerprint of the catalog rows that
+DDL touches. Checking the fingerprint is a single query, so an unchanged
+schema costs one round trip instead of a full describe.
+
+Usage
+---------
+cache = CatalogCache('/var/cache/pjs', max_entries=64)
+tables = cache.describe_schema('public', db_conn)
+
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+from psycopg2.extensions import connection
+
+from describe import SchemaDefinition
+from queries import INFORMATION_SCHEMA
+
+# Any DDL on a relation rewrites its pg_class row, or the pg_attribute,
+# pg_attrdef or pg_constraint rows that belong to it, giving them a new
+# xmin. Hashing the xmin of every row in the namespaces is far cheaper
+# than reading the information_schema views, and changes with every DDL.
+FINGERPRINT_QUERY = """SELECT md5(concat_ws('|',
+        (SELECT
+            string_agg(concat_ws(',', c.oid, c.relfilenode, c.xmin), ';'
+                       ORDER BY c.oid)
+         FROM pg_class c
+         JOIN pg_namespace n ON n.oid = c.relnamespace
+         WHERE n.nspname = ANY(%(namespaces)s)),
+        (SELECT
+            string_agg(concat_ws(',', a.attrelid, a.attnum, a.xmin), ';'
+                       ORDER BY a.attrelid, a.attnum)
+         FROM pg_attribute a
+         JOIN pg_class c ON c.oid = a.attrelid
+         JOIN pg_namespace n ON n.oid = c.relnamespace
+         WHERE n.nspname = ANY(%(namespaces)s)),
+        (SELECT
+            string_agg(concat_ws(',', d.oid, d.xmin), ';' ORDER BY d.oid)
+         FROM pg_attrdef d
+         JOIN pg_class c ON c.oid = d.adrelid
+         JOIN pg_namespace n ON n.oid = c.relnamespace
+         WHERE n.nspname = ANY(%(namespaces)s)),
+        (SELECT
+            string_agg(concat_ws(',', k.oid, k.xmin), ';' ORDER BY k.oid)
+         FROM pg_constraint k
+         JOIN pg_namespace n ON n.oid = k.connamespace
+         WHERE n.nspname = ANY(%(namespaces)s))
+    ))"""
+
+
+def get_catalog_fingerprint(db_conn: connection, namespaces: list) -> str:
+    cursor = db_conn.cursor()
+    cursor.execute(FINGERPRINT_QUERY, {"namespaces": list(namespaces)})
+    fingerprint = cursor.fetchone()[0]
+    cursor.close()
+
+    return fingerprint
+
+
+class CatalogCache:
+    """Cache described schemas on disk, keyed on a catalog fingerprint
+
+    Parameters
+    ----------
+    directory : str
+        The directory to store cache entries in. Created if missing.
+    max_entries : int
+        The most entries to keep. The least recently used entries are
+        evicted once this is exceeded.
+
+    """
+
+    def __init__(self, directory: str, max_entries: int = 128):
+        if max_entries < 1:
+            raise NameError("A CatalogCache must allow at least one entry")
+
+        self.directory = directory
+        self.max_entries = max_entries
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get_key(self,
+                db_conn: connection,
+                namespaces: list,
+                backend: str = INFORMATION_SCHEMA,
+                set_defaults: bool = False) -> str:
+        params = db_conn.get_dsn_parameters()
+        identity = [params.get('host'),
+                    params.get('port'),
+                    params.get('dbname'),
+                    backend,
+                    set_defaults,
+                    sorted(namespaces)]
+
+        return hashlib.sha1(json.dumps(identity).encode()).hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.json')
+
+    def describe_schema(self,
+                        namespaces,
+                        db_conn: connection,
+                        backend: str = INFORMATION_SCHEMA,
+                        set_defaults: bool = False) -> list:
+        """
+        Return the to_json() of every table in the namespaces, from the
+        cache when the catalog fingerprint is unchanged, otherwise by
+        describing the schema and storing the result.
+        """
+
+        if isinstance(namespaces, str):
+            namespaces = [namespaces]
+
+        key = self.get_key(db_conn, namespaces, backend, set_defaults)
+        fingerprint = get_catalog_fingerprint(db_conn, namespaces)
+
+        entry = self.read(key)
+        if entry is not None and entry.get('fingerprint') == fingerprint:
+            return entry.get('tables')
+
+        tables = SchemaDefinition(namespaces, db_conn, backend) \
+            .to_json(set_defaults)
+
+        self.write(key, dict(fingerprint=fingerprint, tables=tables))
+
+        return tables
+
+    def read(self, key: str) -> dict:
+        path = self.get_path(key)
+
+        try:
+            with open(path) as handle:
+                entry = json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+        # Record the hit so eviction drops the least recently used entries
+        os.utime(path)
+
+        return entry
+
+    def write(self, key: str, entry: dict):
+        handle, temp_path = tempfile.mkstemp(dir=self.directory,
+                                             suffix='.tmp')
+        with os.fdopen(handle, 'w') as temp_file:
+            json.dump(entry, temp_file)
+
+        os.replace(temp_path, self.get_path(key))
+
+        self.evict()
+
+    def entries(self) -> list:
+        """
+        List the cache entry paths, least recently used first.
+        """
+
+        paths = [os.path.join(self.directory, name)
+                 for name in os.listdir(self.directory)
+                 if name.endswith('.json')]
+
+        return sorted(paths, key=os.path.getmtime)
+
+    def evict(self):
+        entries = self.entries()
+
+        for path in entries[:max(0, len(entries) - self.max_entries)]:
+            os.remove(path)
+
+    def invalidate(self,
+                   db_conn: connection = None,
+                   namespaces=None,
+                   backend: str = INFORMATION_SCHEMA,
+                   set_defaults: bool = False):
+        """
+        Remove the entry for a database and namespaces, or every entry
+        when called without a connection.
+        """
+
+        if db_conn is None:
+            for path in self.entries():
+                os.remove(path)
+            return
+
+        if namespaces is None:
+            raise NameError("namespaces are required to invalidate a "
+                            "single cache entry")
+
+        if isinstance(namespaces, str):
+            namespaces = [namespaces]
+
+        key = self.get_key(db_conn, namespaces, backend, set_defaults)
+
+        try:
+            os.remove(self.get_path(key))
+        except FileNotFoundError:
+            pass
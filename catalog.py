@@ -0,0 +1,187 @@
+"""Hold the described tables of several databases with shared definitions
+
+Comparing the same schemas across environments holds a near identical
+copy of every definition per database. A Catalog interns the strings and
+lists definitions are built from, and keeps one instance of each distinct
+ColumnDefinition, IndexDefinition and PermissionDefinition, shared by every
+table and database it appears in. Memory then grows with the number of
+distinct definitions, and tables whose definitions are all shared are
+found equal by identity without a structural diff.
+
+Definitions added to a catalog are shared, so treat them as read only and
+replace rather than change them.
+
+Usage
+---------
+catalog = Catalog()
+catalog.describe('staging', 'public', staging_conn)
+catalog.describe('prod', 'public', prod_conn)
+for result in catalog.compare('staging', 'prod'):
+    print(result.name, result.changed_fields)
+
+"""
+import sys
+
+from psycopg2.extensions import connection
+
+from compare import compare_tables
+from describe import SchemaDefinition, TableDefinition
+from queries import INFORMATION_SCHEMA
+
+
+class Catalog:
+    """Intern table definitions across databases
+
+    Attributes
+    ----------
+    databases : dict
+        The TableDefinition's added for each database name
+    definitions : dict
+        The shared instance of each distinct column, index and permission
+        definition, keyed by itself
+
+    """
+
+    def __init__(self):
+        self.databases = dict()
+        self.definitions = dict()
+        self.lists = dict()
+
+    def intern_value(self, value):
+        """
+        Intern a string, or a list of strings such as an index's fields or
+        a grant list, returning the shared copy.
+        """
+
+        if isinstance(value, str):
+            return sys.intern(value)
+
+        if isinstance(value, list):
+            value = [sys.intern(item) if isinstance(item, str) else item
+                     for item in value]
+            return self.lists.setdefault(tuple(value), value)
+
+        return value
+
+    def intern_attributes(self, definition):
+        for name in type(definition).__slots__:
+            if name == 'table_definition':
+                continue
+            setattr(definition, name,
+                    self.intern_value(getattr(definition, name)))
+
+        return definition
+
+    def intern(self, definition):
+        """
+        Return the shared instance of a column, index or permission
+        definition, adding it when it hasn't been seen before.
+        """
+
+        shared = self.definitions.get(definition)
+        if shared is not None:
+            return shared
+
+        self.intern_attributes(definition)
+        self.definitions[definition] = definition
+
+        return definition
+
+    def intern_table(self, definition: TableDefinition) -> TableDefinition:
+        definition.namespace = self.intern_value(definition.namespace)
+        definition.name = self.intern_value(definition.name)
+        definition.column_definitions = [
+            self.intern(column) for column in definition.column_definitions]
+        definition.index_definitions = [
+            self.intern(index) for index in definition.index_definitions]
+        definition.permission_definitions = [
+            self.intern(permission)
+            for permission in definition.permission_definitions]
+
+        # A primary key refers back to its table, so only its values are
+        # shared
+        self.intern_attributes(definition.primary_key_definition)
+
+        return definition
+
+    def add(self, database: str, definitions: list) -> list:
+        """
+        Intern a list of TableDefinition's and add them to a database,
+        returning them.
+        """
+
+        tables = self.databases.setdefault(database, list())
+        for definition in definitions:
+            tables.append(self.intern_table(definition))
+
+        return definitions
+
+    def describe(self,
+                 database: str,
+                 namespaces,
+                 db_conn: connection,
+                 backend: str = INFORMATION_SCHEMA) -> list:
+        """
+        Describe every table in one or more schemas with a SchemaDefinition
+        and add them to a database.
+        """
+
+        return self.add(database, SchemaDefinition(namespaces,
+                                                   db_conn,
+                                                   backend).table_definitions)
+
+    def get_tables(self, database: str) -> list:
+        if database not in self.databases.keys():
+            raise NameError("The catalog has no database named "
+                            "{}".format(database))
+
+        return self.databases[database]
+
+    def compare(self, spec_database: str, live_database: str) -> list:
+        """
+        Compare the tables of two databases, matched by schema and table
+        name, as compare.compare_schemas does. Tables whose definitions are
+        all shared are equal without being diffed.
+
+        Returns a PjsComparisonResult for every table that differs.
+        """
+
+        spec_tables = {(definition.namespace, definition.name): definition
+                       for definition in self.get_tables(spec_database)}
+        live_tables = {(definition.namespace, definition.name): definition
+                       for definition in self.get_tables(live_database)}
+
+        results = list()
+
+        for key in sorted(set(spec_tables.keys()) | set(live_tables.keys())):
+            spec = spec_tables.get(key)
+            live = live_tables.get(key)
+            if spec is not None and live is not None \
+                    and shares_definitions(spec, live):
+                continue
+
+            result = compare_tables(spec, live)
+            if result:
+                results.append(result)
+
+        return results
+
+
+def same_members(spec_members: list, live_members: list) -> bool:
+    return (len(spec_members) == len(live_members)
+            and all(spec is live
+                    for spec, live in zip(spec_members, live_members)))
+
+
+def shares_definitions(spec: TableDefinition, live: TableDefinition) -> bool:
+    """
+    If two interned tables hold the same definitions, in the same order.
+    """
+
+    return (spec.primary_key_definition == live.primary_key_definition
+            and spec.partition_definition == live.partition_definition
+            and spec.storage_definition == live.storage_definition
+            and same_members(spec.column_definitions, live.column_definitions)
+            and same_members(spec.index_definitions, live.index_definitions)
+            and same_members(spec.permission_definitions,
+                             live.permission_definitions))
@@ -0,0 +1,609 @@
+"""Compare table definitions to find the changes between them
+
+Definitions are reduced to a canonical form and hashed, per table and per
+column. Unchanged tables, the common case, are recognised from their table
+digest alone; a structural diff only runs where digests differ.
+
+Usage
+---------
+result = compare_tables(spec_definition, live_definition)
+if result:
+    print(result.new_fields, result.changed_fields)
+
+db_conn = psycopg2.connect()
+comparison = CompareSchema(JsonSpec(filepath='my_table.json'), db_conn)
+
+"""
+import hashlib
+import json
+import re
+from datetime import date
+
+from psycopg2.extensions import connection
+
+from describe import SchemaDefinition, TableDefinition
+from jsonspec import JsonSpec, validate_schema
+from partition import expired_partitions, template_partitions
+from queries import INFORMATION_SCHEMA
+
+ALL_GRANTS = ("DELETE",
+              "INSERT",
+              "REFERENCES",
+              "SELECT",
+              "TRIGGER",
+              "TRUNCATE",
+              "UPDATE")
+
+DEFAULT_TABLESPACE = 'pg_default'
+
+BOOLEAN_PARAMETERS = {'on': 'true', 'off': 'false'}
+
+# The parts of an index that can be changed without rebuilding it
+INDEX_STORAGE = ('parameters', 'tablespace')
+
+TYPE_ALIASES = {
+    'integer': 'int',
+    'int4': 'int',
+    'int8': 'bigint',
+    'int2': 'smallint',
+    'character varying': 'varchar',
+    'character': 'char',
+    'bool': 'boolean',
+    'decimal': 'numeric',
+    'float8': 'double precision',
+    'float4': 'real',
+    'timestamp without time zone': 'timestamp',
+    'timestamptz': 'timestamp with time zone',
+    'time without time zone': 'time',
+    'timetz': 'time with time zone',
+}
+
+
+def normalise_type(type: str, max_length: int = None) -> str:
+    """
+    Reduce a column type to one spelling, folding max_length into the type
+    so 'varchar' with a max_length of 64 matches 'character varying(64)'.
+    """
+
+    type = ' '.join(type.lower().split())
+    modifier = ''
+
+    if '(' in type:
+        type, modifier = type.split('(', 1)
+        type = type.strip()
+        modifier = '(' + modifier.replace(' ', '')
+    elif max_length:
+        modifier = '({})'.format(max_length)
+
+    return TYPE_ALIASES.get(type, type) + modifier
+
+
+# A quoted literal followed by casts, as catalogs describe string defaults
+CAST_LITERAL = re.compile(r"^('(?:[^']|'')*')"
+                          r"(?:\s*::\s*[a-z_][a-z0-9_ ]*(?:\([0-9, ]*\))?"
+                          r"(?:\[\])*)+$", re.IGNORECASE)
+NUMBER = re.compile(r"^'(-?[0-9]+(?:\.[0-9]+)?)'$")
+
+
+def normalise_default(default_value: str) -> str:
+    """
+    Reduce a default to one spelling. Casts on a literal are dropped, so the
+    live 'x'::character varying matches a spec's 'x', and a quoted number
+    matches the bare number.
+    """
+
+    if default_value is None:
+        return None
+
+    default_value = default_value.strip()
+    literal = CAST_LITERAL.match(default_value)
+    if literal:
+        default_value = literal.group(1)
+    number = NUMBER.match(default_value)
+    if number:
+        return number.group(1)
+
+    # Function calls and keywords are case insensitive, literals are not
+    if "'" in default_value or '"' in default_value:
+        return default_value
+
+    return default_value.strip().lower()
+
+
+def normalise_parameter(value) -> str:
+    """
+    Reduce a storage parameter's value to one spelling, so a spec's 70 or
+    false matches the live '70' or 'off'.
+    """
+
+    value = str(value).strip().lower()
+    value = BOOLEAN_PARAMETERS.get(value, value)
+
+    try:
+        return repr(float(value))
+    except ValueError:
+        return value
+
+
+def normalise_tablespace(tablespace: str) -> str:
+    """
+    The database's default tablespace is None, however it is spelled.
+    """
+
+    return None if tablespace in (None, DEFAULT_TABLESPACE) else tablespace
+
+
+def canonical_parameters(parameters: dict) -> dict:
+    return {name: normalise_parameter(value)
+            for name, value in parameters.items()}
+
+
+def expand_grants(grants: list) -> list:
+    if 'ALL' in grants:
+        return list(ALL_GRANTS)
+
+    return sorted(set(grants))
+
+
+def canonical_column(column, primary_fields: list) -> dict:
+    return dict(
+        type=normalise_type(column.type, column.max_length),
+        nullable=bool(column.nullable
+                      and not column.primary
+                      and column.name not in primary_fields),
+        default_value=normalise_default(column.default_value),
+        identity=bool(column.identity)
+    )
+
+
+def canonical_index(index) -> dict:
+    return dict(
+        type=index.type or 'btree',
+        unique=bool(index.unique),
+        fields=list(index.fields),
+        include=list(index.include),
+        predicate=' '.join(index.predicate.split())
+        if index.predicate else None,
+        opclasses=dict(index.opclasses),
+        parameters=canonical_parameters(index.parameters),
+        tablespace=normalise_tablespace(index.tablespace)
+    )
+
+
+def index_structure(index) -> dict:
+    """
+    The canonical index without its storage, which changes in place.
+    """
+
+    canonical = canonical_index(index)
+    for name in INDEX_STORAGE:
+        canonical.pop(name)
+
+    return canonical
+
+
+def canonical_storage(storage) -> dict:
+    return dict(parameters=canonical_parameters(storage.parameters),
+                tablespace=normalise_tablespace(storage.tablespace),
+                unlogged=bool(storage.unlogged))
+
+
+def canonical_partition(partition) -> dict:
+    if partition is None:
+        return None
+
+    return dict(strategy=partition.strategy, fields=list(partition.fields))
+
+
+def canonical_table(definition: TableDefinition) -> dict:
+    """
+    Reduce a TableDefinition to plain, comparable structures. The index
+    backing the primary key is left out, as it is only described on live
+    tables, as are partitions, which are compared with their template.
+    """
+
+    primary_key = definition.primary_key_definition
+    primary_fields = sorted(primary_key.fields)
+    constraint_name = primary_key.constraint_name
+    if constraint_name is None and primary_fields:
+        constraint_name = definition.name + '_pkey'
+
+    return dict(
+        columns={column.name: canonical_column(column, primary_fields)
+                 for column in definition.column_definitions},
+        primary_key=dict(fields=primary_fields, constraint=constraint_name),
+        indexes={index.name: canonical_index(index)
+                 for index in definition.index_definitions
+                 if index.name != constraint_name},
+        permissions={permission.name: expand_grants(permission.grants)
+                     for permission in definition.permission_definitions},
+        partition=canonical_partition(definition.partition_definition),
+        storage=canonical_storage(definition.storage_definition)
+    )
+
+
+def digest(canonical) -> str:
+    return hashlib.sha1(json.dumps(canonical, sort_keys=True)
+                        .encode()).hexdigest()
+
+
+def table_digests(canonical: dict) -> dict:
+    """
+    Digest a canonical table, along with each of its columns, indexes and
+    permissions.
+    """
+
+    return dict(
+        table=digest(canonical),
+        columns={name: digest(column)
+                 for name, column in canonical['columns'].items()},
+        indexes={name: digest(index)
+                 for name, index in canonical['indexes'].items()},
+        permissions={name: digest(grants)
+                     for name, grants in canonical['permissions'].items()},
+    )
+
+
+class PjsComparisonResult:
+    """The changes needed to turn a live table into its spec
+
+    Attributes
+    ----------
+    spec : TableDefinition
+        The desired definition, None when the table should be removed
+    live : TableDefinition
+        The existing definition, None when the table is new
+    new_table, removed_table : bool
+        If the table only exists in the spec, or only in the database
+    new_fields, removed_fields : list
+        ColumnDefinition's only in the spec, or only in the database
+    changed_fields : list
+        (spec, live) ColumnDefinition pairs that differ
+    new_indexes, missing_indexes, changed_indexes : list
+        IndexDefinition's, and (spec, live) pairs, as for fields
+    changed_index_storage : list
+        (spec, live) IndexDefinition pairs that only differ in their
+        storage parameters or tablespace, and are altered in place
+    new_permissions, missing_permissions, changed_permissions : list
+        PermissionDefinition's, and (spec, live) pairs, as for fields
+    primary_key_changed : bool
+        If the primary key fields or constraint name differ
+    partition_changed : bool
+        If the partitioning strategy or key differ
+    new_partitions : dict
+        The partitions the spec's template calls for that don't exist yet,
+        as a dict of name to bound
+    expired_partitions : list
+        The names of partitions older than the spec's retention
+    storage_changed : bool
+        If the table's storage parameters, tablespace or persistence
+        differ
+
+    """
+
+    def __init__(self,
+                 spec: TableDefinition = None,
+                 live: TableDefinition = None):
+        self.spec = spec
+        self.live = live
+
+        self.new_table = live is None and spec is not None
+        self.removed_table = spec is None and live is not None
+
+        self.new_fields = list()
+        self.removed_fields = list()
+        self.changed_fields = list()
+        self.new_indexes = list()
+        self.missing_indexes = list()
+        self.changed_indexes = list()
+        self.changed_index_storage = list()
+        self.new_permissions = list()
+        self.missing_permissions = list()
+        self.changed_permissions = list()
+        self.primary_key_changed = False
+        self.partition_changed = False
+        self.new_partitions = dict()
+        self.expired_partitions = list()
+        self.storage_changed = False
+
+    @property
+    def name(self) -> str:
+        return (self.spec if self.spec is not None else self.live).name
+
+    @property
+    def namespace(self) -> str:
+        return (self.live if self.live is not None else self.spec).namespace
+
+    def __bool__(self) -> bool:
+        return bool(self.new_table
+                    or self.removed_table
+                    or self.new_fields
+                    or self.removed_fields
+                    or self.changed_fields
+                    or self.new_indexes
+                    or self.missing_indexes
+                    or self.changed_indexes
+                    or self.changed_index_storage
+                    or self.new_permissions
+                    or self.missing_permissions
+                    or self.changed_permissions
+                    or self.primary_key_changed
+                    or self.partition_changed
+                    or self.new_partitions
+                    or self.expired_partitions
+                    or self.storage_changed)
+
+
+def diff_members(spec_members: list,
+                 live_members: list,
+                 spec_digests: dict,
+                 live_digests: dict) -> tuple:
+    """
+    Split named definitions into those only in the spec, those only live,
+    and (spec, live) pairs whose digests differ.
+    """
+
+    spec_by_name = {member.name: member for member in spec_members
+                    if member.name in spec_digests}
+    live_by_name = {member.name: member for member in live_members
+                    if member.name in live_digests}
+
+    new = [member for name, member in spec_by_name.items()
+           if name not in live_by_name]
+    removed = [member for name, member in live_by_name.items()
+               if name not in spec_by_name]
+    changed = [(member, live_by_name[name])
+               for name, member in spec_by_name.items()
+               if name in live_by_name
+               and spec_digests[name] != live_digests[name]]
+
+    return new, removed, changed
+
+
+def compare_partitions(result: PjsComparisonResult, today: date = None):
+    """
+    Find the partitions to create and expire from the spec's template, as
+    of today.
+    """
+
+    partition = result.spec.partition_definition
+    if partition is None:
+        return
+
+    existing = dict()
+    if result.live is not None and result.live.partition_definition:
+        existing = result.live.partition_definition.partitions
+
+    result.new_partitions = {
+        name: bound for name, bound in
+        template_partitions(partition, result.spec.name, today).items()
+        if name not in existing.keys()}
+    result.expired_partitions = expired_partitions(partition,
+                                                   result.spec.name,
+                                                   existing.keys(),
+                                                   today)
+
+
+def compare_tables(spec: TableDefinition,
+                   live: TableDefinition,
+                   spec_digests: dict = None,
+                   live_digests: dict = None,
+                   today: date = None) -> PjsComparisonResult:
+    """
+    Compare a spec TableDefinition with a live one. Either may be None for
+    a new or removed table. Precomputed table_digests may be passed in.
+    Partitions are planned from the spec's template as of today.
+    """
+
+    result = PjsComparisonResult(spec, live)
+    if spec is not None:
+        compare_partitions(result, today)
+    if spec is None or live is None:
+        return result
+
+    spec_canonical = canonical_table(spec)
+    live_canonical = canonical_table(live)
+    spec_digests = spec_digests or table_digests(spec_canonical)
+    live_digests = live_digests or table_digests(live_canonical)
+
+    if spec_digests['table'] == live_digests['table']:
+        return result
+
+    result.new_fields, result.removed_fields, result.changed_fields \
+        = diff_members(spec.column_definitions,
+                       live.column_definitions,
+                       spec_digests['columns'],
+                       live_digests['columns'])
+
+    result.new_indexes, result.missing_indexes, result.changed_indexes \
+        = diff_members(spec.index_definitions,
+                       live.index_definitions,
+                       spec_digests['indexes'],
+                       live_digests['indexes'])
+
+    # Indexes that only differ in storage are altered, not rebuilt
+    result.changed_index_storage = [
+        (spec_index, live_index)
+        for spec_index, live_index in result.changed_indexes
+        if index_structure(spec_index) == index_structure(live_index)]
+    result.changed_indexes = [
+        (spec_index, live_index)
+        for spec_index, live_index in result.changed_indexes
+        if index_structure(spec_index) != index_structure(live_index)]
+
+    result.new_permissions, result.missing_permissions, \
+        result.changed_permissions \
+        = diff_members(spec.permission_definitions,
+                       live.permission_definitions,
+                       spec_digests['permissions'],
+                       live_digests['permissions'])
+
+    result.primary_key_changed = (spec_canonical['primary_key']
+                                  != live_canonical['primary_key'])
+    result.partition_changed = (spec_canonical['partition']
+                                != live_canonical['partition'])
+    result.storage_changed = (spec_canonical['storage']
+                              != live_canonical['storage'])
+
+    return result
+
+
+def compare_schemas(spec_definitions: list,
+                    live_definitions: list) -> list:
+    """
+    Compare lists of spec and live TableDefinition's, matched by name.
+
+    Returns a PjsComparisonResult for every table that differs, including
+    tables only in the spec or only live, ordered by table name.
+    """
+
+    spec_by_name = {definition.name: definition
+                    for definition in spec_definitions}
+    live_by_name = {definition.name: definition
+                    for definition in live_definitions}
+
+    results = list()
+
+    for name in sorted(set(spec_by_name.keys()) | set(live_by_name.keys())):
+        result = compare_tables(spec_by_name.get(name),
+                                live_by_name.get(name))
+        if result:
+            results.append(result)
+
+    return results
+
+
+def as_table_definitions(spec) -> list:
+    """
+    Accept a TableDefinition, a JsonSpec, a spec dict, or a list or dict of
+    any of these, and return a list of TableDefinition's.
+    """
+
+    if isinstance(spec, dict) and 'schema' not in spec.keys():
+        spec = list(spec.values())
+    if not isinstance(spec, (list, tuple)):
+        spec = [spec]
+
+    definitions = list()
+
+    for item in spec:
+        if isinstance(item, JsonSpec):
+            item = item.TableDefinition
+        elif isinstance(item, dict):
+            validate_schema(item)
+            item = JsonSpec().load_schema(item)
+
+        definitions.append(item)
+
+    return definitions
+
+
+class CompareSchema:
+    """Compare specs with the tables that exist in a database
+
+    The live tables are described with a single SchemaDefinition, so the
+    cost of comparing doesn't grow with round trips per table. Only the
+    tables named in the spec are compared; tables in the database without a
+    spec are left alone.
+
+    Parameters
+    ----------
+    spec : TableDefinition, JsonSpec, dict or list
+        The desired table definitions
+    db_conn : connection
+        A psycopg2.connection object
+    namespace : str
+        The DB schema the tables live in
+    backend : str
+        The catalog to introspect, as for TableDefinition
+
+    Attributes
+    ----------
+    results : list
+        A PjsComparisonResult for each table that differs from its spec
+
+    Usage
+    ---------
+    migrations = CompareSchema(spec, db_conn)
+    print(migrations.plan().to_sql())
+    migrations.run()
+
+    """
+
+    def __init__(self,
+                 spec,
+                 db_conn: connection,
+                 namespace: str = 'public',
+                 backend: str = INFORMATION_SCHEMA):
+        self.connection = db_conn
+        self.namespace = namespace
+        self.spec_definitions = as_table_definitions(spec)
+
+        for definition in self.spec_definitions:
+            definition.namespace = namespace
+
+        names = set(definition.name for definition in self.spec_definitions)
+        self.live_definitions = [
+            definition for definition in
+            SchemaDefinition(namespace, db_conn, backend).table_definitions
+            if definition.name in names]
+
+        self.results = compare_schemas(self.spec_definitions,
+                                       self.live_definitions)
+
+    def plan(self,
+             concurrently: bool = False,
+             default_privileges: list = None):
+        """
+        Plan the migration that brings the compared tables to their specs,
+        returning a migrate.MigrationPlan with the cost of each statement
+        estimated. With concurrently, indexes are built without blocking
+        writes. default_privileges, a list of PermissionDefinition's, are
+        the privileges tables created in the namespace by the connected
+        user are given from then on; the live defaults are reconciled with
+        them first.
+        """
+
+        from cost import estimate_plan_cost
+        from migrate import plan_migration
+        from permissions import (get_default_privileges,
+                                 plan_default_privileges)
+
+        plan = plan_migration(self.results, concurrently=concurrently)
+
+        if default_privileges is not None:
+            plan.statements = plan_default_privileges(
+                self.namespace,
+                default_privileges,
+                get_default_privileges(self.connection, self.namespace)
+            ) + plan.statements
+
+        estimate_plan_cost(plan, self.connection)
+
+        return plan
+
+    def run(self,
+            max_rewrite_bytes: int = None,
+            concurrently: bool = False,
+            seed: bool = True,
+            default_privileges: list = None):
+        """
+        Migrate the compared tables to their specs. If max_rewrite_bytes is
+        set, a NameError is raised before anything runs when the plan would
+        rewrite more than that. With seed, tables that are created are
+        primed from their seed file. default_privileges are reconciled as
+        for plan.
+        """
+
+        plan = self.plan(concurrently, default_privileges)
+        if max_rewrite_bytes is not None:
+            plan.check_budget(max_rewrite_bytes)
+
+        plan.run(self.connection)
+
+        if seed:
+            from seed import seed_new_tables
+
+            seed_new_tables(self.results, self.connection)
+
+        return plan
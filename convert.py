@@ -0,0 +1,227 @@
+"""Convert synced rows with each field's parse_with_function
+
+A table's parsers are resolved once into a converter for whole batches of
+rows. By default rows are converted by a single generated function that
+unpacks each row and calls only the parsers of the fields that have one,
+with every parser bound as a local name. In columns mode each column of a
+batch is converted at once instead, which lets the common type parsers
+skip columns the source already returns in the right type.
+
+Usage
+---------
+convert = compile_batch_converter(definition.column_definitions)
+rows = convert(rows)
+
+"""
+import builtins
+import importlib
+from datetime import datetime
+from decimal import Decimal
+
+ROWS = 'rows'
+COLUMNS = 'columns'
+
+
+def batch_parser(function):
+    """
+    Mark a parse_with_function as taking a whole column of values at once,
+    e.g. a vectorised numpy function, rather than one value at a time.
+    """
+
+    function.pjs_batch = True
+    return function
+
+
+def parse_timestamp(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+
+    value = str(value).strip()
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+
+    return datetime.fromisoformat(value)
+
+
+# parse_with_function names for the common types, and the type each gives
+TYPE_PARSERS = {
+    'int': (int, int),
+    'numeric': (Decimal, Decimal),
+    'timestamp': (parse_timestamp, datetime),
+    'text': (str, str),
+}
+
+
+def resolve_function(name: str):
+    """
+    Resolve a parse_with_function name, either a builtin such as 'int', an
+    attribute of one such as 'str.upper', or a dotted import path such as
+    'decimal.Decimal'.
+    """
+
+    parts = name.split('.')
+
+    if hasattr(builtins, parts[0]):
+        target, parts = getattr(builtins, parts[0]), parts[1:]
+    else:
+        for index in range(len(parts) - 1, 0, -1):
+            try:
+                target = importlib.import_module('.'.join(parts[:index]))
+            except ImportError:
+                continue
+            parts = parts[index:]
+            break
+        else:
+            raise NameError("Can't resolve parse_with_function "
+                            "{}".format(name))
+
+    try:
+        for part in parts:
+            target = getattr(target, part)
+    except AttributeError:
+        raise NameError("Can't resolve parse_with_function "
+                        "{}".format(name))
+
+    if not callable(target):
+        raise NameError("parse_with_function {} isn't callable".format(name))
+
+    return target
+
+
+def resolve_parser(name: str) -> tuple:
+    """
+    Resolve a parse_with_function to its function and the type it
+    returns, when it is one of TYPE_PARSERS, otherwise None.
+    """
+
+    if name in TYPE_PARSERS.keys():
+        return TYPE_PARSERS[name]
+
+    return resolve_function(name), None
+
+
+def batch_values(function, result_type: type = None):
+    """
+    Wrap a function of one value as a parser of a column of values. NULLs
+    are never parsed, and with a result_type a column that is already of
+    that type is returned as it is.
+    """
+
+    def parse(values: list) -> list:
+        if result_type is not None:
+            types = set(map(type, values))
+            types.discard(type(None))
+            if types <= {result_type}:
+                return values
+
+        if None in values:
+            return [None if value is None else function(value)
+                    for value in values]
+
+        return list(map(function, values))
+
+    return parse
+
+
+def compile_row_converter(columns: list):
+    """
+    Build a function converting one row, a sequence of values in column
+    order, to a tuple. Fields without a parse_with_function are passed
+    through untouched. Returns None when no field has one.
+
+    Batch parsers can't convert a single row, and raise a NameError.
+    """
+
+    names = ['v{}'.format(index) for index in range(len(columns))]
+    values = list(names)
+    parsers = dict()
+
+    for index, column in enumerate(columns):
+        if not column.parse_with_function:
+            continue
+
+        function, _ = resolve_parser(column.parse_with_function)
+        if getattr(function, 'pjs_batch', False):
+            raise NameError("parse_with_function {} only converts whole "
+                            "columns".format(column.parse_with_function))
+
+        parsers['p{}'.format(index)] = function
+        values[index] = 'None if {0} is None else p{1}({0})'.format(
+            names[index], index)
+
+    if not parsers:
+        return None
+
+    # Parsers are bound as default arguments, so they are local lookups
+    source = 'def convert(row, {}):\n    {}, = row\n    return ({},)\n'.format(
+        ', '.join('{0}={0}'.format(name) for name in parsers.keys()),
+        ', '.join(names),
+        ', '.join(values))
+
+    namespace = dict(parsers)
+    exec(source, namespace)
+
+    return namespace['convert']
+
+
+def column_converters(columns: list) -> list:
+    """
+    A parser of a column of values for each column, or None for columns
+    without a parse_with_function.
+    """
+
+    converters = list()
+
+    for column in columns:
+        if not column.parse_with_function:
+            converters.append(None)
+            continue
+
+        function, result_type = resolve_parser(column.parse_with_function)
+        if getattr(function, 'pjs_batch', False):
+            converters.append(function)
+        else:
+            converters.append(batch_values(function, result_type))
+
+    return converters
+
+
+def compile_batch_converter(columns: list, mode: str = None):
+    """
+    Build a function converting a list of rows with each column's
+    parse_with_function, returning a list of tuples.
+
+    mode is either ROWS, converting a row at a time with
+    compile_row_converter, or COLUMNS, converting a column at a time. It
+    defaults to COLUMNS when any field has a batch parser, otherwise ROWS.
+    Rows are returned as they are when no field has a parse_with_function.
+    """
+
+    converters = column_converters(columns)
+
+    if not any(converters):
+        return lambda rows: rows
+
+    if mode is None:
+        mode = COLUMNS if any(getattr(converter, 'pjs_batch', False)
+                              for converter in converters) else ROWS
+
+    if mode == ROWS:
+        convert_row = compile_row_converter(columns)
+        return lambda rows: list(map(convert_row, rows))
+
+    if mode != COLUMNS:
+        raise NameError("Unknown conversion mode: {}. Expected one of "
+                        "{}, {}".format(mode, ROWS, COLUMNS))
+
+    def convert(rows: list) -> list:
+        if not rows:
+            return rows
+
+        values = [list(column) for column in zip(*rows)]
+        values = [column if converter is None else converter(column)
+                  for converter, column in zip(converters, values)]
+
+        return list(zip(*values))
+
+    return convert
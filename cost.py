@@ -0,0 +1,313 @@
+"""Estimate what a migration plan costs before it runs
+
+Each MigrationStatement is classified as metadata-only, needing a scan of
+the table, or rewriting the whole table, and sized from the pg_class
+statistics of the table it touches. A plan can then be rejected when it
+would rewrite more than a budget.
+
+Usage
+---------
+plan = plan_migration(comparison.results)
+estimate_plan_cost(plan, db_conn)
+plan.check_budget(max_rewrite_bytes=10 * 1024 ** 3)
+
+"""
+import re
+
+from psycopg2.extensions import connection
+
+from compare import normalise_type
+from describe import IndexDefinition
+from migrate import (METADATA_ONLY,
+                     SCAN_NEEDED,
+                     FULL_REWRITE,
+                     COSTS,
+                     ADD_COLUMN,
+                     ADD_PRIMARY_KEY,
+                     ALTER_TYPE,
+                     CREATE_INDEX,
+                     SET_LOGGED,
+                     SET_NOT_NULL,
+                     SET_TABLESPACE,
+                     SET_UNLOGGED,
+                     MigrationPlan,
+                     MigrationStatement)
+
+TABLE_SIZE_QUERY = """SELECT
+        n.nspname AS table_schema,
+        c.relname AS table_name,
+        c.relpages,
+        greatest(c.reltuples, 0)::BIGINT AS reltuples,
+        current_setting('block_size')::INT AS block_size,
+        pg_total_relation_size(c.oid) AS total_bytes
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN unnest(%(namespaces)s::TEXT[], %(tables)s::TEXT[])
+        AS t(table_schema, table_name)
+        ON t.table_schema = n.nspname AND t.table_name = c.relname
+    WHERE c.relkind IN ('r', 'p', 'm')"""
+
+VOLATILITY_QUERY = """SELECT
+        proname,
+        bool_or(provolatile = 'v') AS volatile
+    FROM pg_proc
+    WHERE proname = ANY(%(functions)s)
+    GROUP BY proname"""
+
+# Used when there is no connection to look volatility up in pg_proc
+VOLATILE_FUNCTIONS = frozenset(['random',
+                                'clock_timestamp',
+                                'timeofday',
+                                'nextval',
+                                'gen_random_uuid',
+                                'uuid_generate_v1',
+                                'uuid_generate_v1mc',
+                                'uuid_generate_v4'])
+
+# Binary coercible types, which can be widened without a rewrite
+VARIABLE_LENGTH_TYPES = ('varchar', 'varbit', 'bit varying')
+
+FUNCTION_CALL = re.compile(r'([a-z_][a-z0-9_$]*)\s*\(', re.IGNORECASE)
+
+
+def default_functions(default_value: str) -> set:
+    if default_value is None:
+        return set()
+
+    return set(name.lower()
+               for name in FUNCTION_CALL.findall(default_value))
+
+
+def is_volatile_default(default_value: str,
+                        volatile_functions=VOLATILE_FUNCTIONS) -> bool:
+    """
+    A default is volatile when it calls any volatile function, and has to
+    be evaluated for every existing row.
+    """
+
+    return bool(default_functions(default_value) & set(volatile_functions))
+
+
+def split_type(type: str) -> tuple:
+    """
+    Split a normalised type into its name and a tuple of int modifiers.
+    """
+
+    if '(' not in type:
+        return type, ()
+
+    name, modifier = type.split('(', 1)
+    try:
+        return name, tuple(int(part)
+                           for part in modifier.rstrip(')').split(','))
+    except ValueError:
+        return type, ()
+
+
+def is_widening(old_type: str, new_type: str) -> bool:
+    """
+    If changing old_type to new_type is binary coercible, and so only
+    changes the catalog, e.g. varchar(32) to varchar(64) or to text.
+    """
+
+    old_name, old_modifier = split_type(old_type)
+    new_name, new_modifier = split_type(new_type)
+
+    if old_name in VARIABLE_LENGTH_TYPES + ('text',) and new_name == 'text':
+        return True
+
+    if old_name == 'text' and new_name == 'varchar':
+        return not new_modifier
+
+    if old_name == new_name and old_name in VARIABLE_LENGTH_TYPES:
+        return not new_modifier or (bool(old_modifier)
+                                    and new_modifier[0] >= old_modifier[0])
+
+    if old_name == new_name == 'numeric':
+        if not new_modifier:
+            return True
+        if not old_modifier:
+            return False
+        old_scale = old_modifier[1] if len(old_modifier) > 1 else 0
+        new_scale = new_modifier[1] if len(new_modifier) > 1 else 0
+        return (new_scale == old_scale
+                and new_modifier[0] >= old_modifier[0])
+
+    return False
+
+
+def classify_action(action,
+                    server_version: int = 110000,
+                    volatile_functions=VOLATILE_FUNCTIONS) -> str:
+    """
+    Classify a MigrationAction as METADATA_ONLY, SCAN_NEEDED or
+    FULL_REWRITE. server_version is in the server_version_num format.
+    """
+
+    if action.kind == ADD_COLUMN:
+        column = action.spec
+        if column.identity:
+            return FULL_REWRITE
+        if column.default_value is None:
+            # NOT NULL without a default can only be checked with a scan
+            return METADATA_ONLY if column.nullable else SCAN_NEEDED
+        # PostgreSQL 11 stores non-volatile defaults in the catalog
+        if server_version < 110000 or is_volatile_default(
+                column.default_value, volatile_functions):
+            return FULL_REWRITE
+        return METADATA_ONLY
+
+    if action.kind == ALTER_TYPE:
+        old_type = normalise_type(action.live.type, action.live.max_length)
+        new_type = normalise_type(action.spec.type, action.spec.max_length)
+        return METADATA_ONLY if is_widening(old_type, new_type) \
+            else FULL_REWRITE
+
+    if action.kind in (SET_NOT_NULL, CREATE_INDEX, ADD_PRIMARY_KEY):
+        return SCAN_NEEDED
+
+    # Moving an index copies only the index, costed as a scan of its table
+    if action.kind == SET_TABLESPACE:
+        return SCAN_NEEDED if isinstance(action.spec, IndexDefinition) \
+            else FULL_REWRITE
+
+    if action.kind in (SET_LOGGED, SET_UNLOGGED):
+        return FULL_REWRITE
+
+    return METADATA_ONLY
+
+
+def classify_statement(statement: MigrationStatement,
+                       server_version: int = 110000,
+                       volatile_functions=VOLATILE_FUNCTIONS) -> str:
+    """
+    A statement costs as much as its most expensive action.
+    """
+
+    costs = [classify_action(action, server_version, volatile_functions)
+             for action in statement.actions]
+
+    return max(costs, key=COSTS.index, default=METADATA_ONLY)
+
+
+def read_table_sizes(rows) -> dict:
+    sizes = dict()
+    for (schema, name, relpages, reltuples,
+         block_size, total_bytes) in rows:
+        sizes[(schema, name)] = dict(relpages=relpages,
+                                     reltuples=reltuples,
+                                     bytes=relpages * block_size,
+                                     total_bytes=total_bytes)
+
+    return sizes
+
+
+def get_table_sizes(db_conn: connection, tables: list) -> dict:
+    """
+    Fetch the pg_class size estimate of a list of (schema, table) pairs in
+    one query, returning a dict of (schema, table) to a dict of relpages,
+    reltuples, bytes of the heap and total_bytes including its indexes and
+    TOAST.
+    """
+
+    if not tables:
+        return dict()
+
+    cursor = db_conn.cursor()
+    cursor.execute(TABLE_SIZE_QUERY,
+                   {"namespaces": [table[0] for table in tables],
+                    "tables": [table[1] for table in tables]})
+    sizes = read_table_sizes(cursor.fetchall())
+    cursor.close()
+
+    return sizes
+
+
+def get_volatile_functions(db_conn: connection, functions: set) -> set:
+    """
+    Look up which of the named functions are volatile. Functions that
+    aren't found are assumed to be volatile.
+    """
+
+    if not functions:
+        return set()
+
+    cursor = db_conn.cursor()
+    cursor.execute(VOLATILITY_QUERY, {"functions": sorted(functions)})
+    found = dict(cursor.fetchall())
+    cursor.close()
+
+    return set(name for name in functions if found.get(name, True))
+
+
+def plan_default_functions(plan: MigrationPlan) -> set:
+    """
+    The functions called by the defaults of the columns a plan adds.
+    """
+
+    functions = set()
+    for statement in plan:
+        for action in statement.actions:
+            if action.kind == ADD_COLUMN:
+                functions |= default_functions(action.spec.default_value)
+
+    return functions
+
+
+def plan_tables(plan: MigrationPlan) -> list:
+    """
+    The (schema, table) pairs a plan's statements apply to, leaving out
+    statements for several tables or a whole schema.
+    """
+
+    return sorted(set((statement.namespace, statement.table)
+                      for statement in plan
+                      if statement.table is not None))
+
+
+def apply_plan_cost(plan: MigrationPlan,
+                    sizes: dict,
+                    server_version: int,
+                    volatile_functions: set) -> dict:
+    """
+    Set the cost and estimated_bytes of every statement in the plan from
+    fetched table sizes, returning a dict of the total for each cost.
+    """
+
+    totals = dict((cost, 0) for cost in COSTS)
+
+    for statement in plan:
+        statement.cost = classify_statement(statement,
+                                            server_version,
+                                            volatile_functions)
+
+        # A rewrite also rebuilds every index and the TOAST relation
+        size = sizes.get((statement.namespace, statement.table))
+        if statement.cost == METADATA_ONLY or size is None:
+            statement.estimated_bytes = 0
+        elif statement.cost == FULL_REWRITE:
+            statement.estimated_bytes = size['total_bytes']
+        else:
+            statement.estimated_bytes = size['bytes']
+
+        totals[statement.cost] += statement.estimated_bytes
+
+    return totals
+
+
+def estimate_plan_cost(plan: MigrationPlan, db_conn: connection) -> dict:
+    """
+    Set the cost and estimated_bytes of every statement in the plan, with
+    one query for table sizes and one for default volatility.
+
+    Returns a dict of the total estimated bytes for each cost.
+    """
+
+    volatile_functions = get_volatile_functions(db_conn,
+                                                plan_default_functions(plan))
+    sizes = get_table_sizes(db_conn, plan_tables(plan))
+
+    return apply_plan_cost(plan,
+                           sizes,
+                           db_conn.server_version,
+                           volatile_functions)
@@ -1,8 +1,12 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from psycopg2.extras import RealDictCursor
 from psycopg2.extensions import connection
-import re
+from psycopg2.pool import AbstractConnectionPool, ThreadedConnectionPool
 from typing import overload
 
+from queries import INFORMATION_SCHEMA, get_queries
+
 DEFAULT_SCHEMA = 'https://github.com/Swift-Jr/python-pjs/blob/master/pjs.schema'  # noqa: E501
 
 
@@ -22,6 +26,9 @@ class TableDefinition:
         The name of the table to describe
     db_conn : connection
         A psycopg2.connection object
+    backend : str
+        The catalog to introspect, either 'information_schema' (default)
+        or 'pg_catalog'. Both produce identical definitions.
 
     Attributes
     ----------
@@ -37,22 +44,51 @@ class TableDefinition:
         A list of IndexDefinition's for the table
     permission_definitions : list
         A list of PermissionDefinition's for the table
+    partition_definition : PartitionDefinition
+        How the table is partitioned, with its child partitions, or None
+        when it isn't partitioned
+    storage_definition : StorageDefinition
+        The table's storage parameters, tablespace and persistence
+    seed : str
+        The path of a JSON file to prime the table with when it is created,
+        only set for specs
+    source : str
+        The Airflow connection and object name to sync data from, as
+        'connection.object', only set for specs
+    query : str
+        The path of a SQL file to sync data with, in place of selecting
+        from the source object, only set for specs
+    watermark_fields : list
+        The fields an incremental sync pages through the source by, empty
+        for a full sync, only set for specs
+    reconcile_every : int
+        The number of incremental syncs between full reconciliations, only
+        set for specs
 
     """
 
     def __init__(self,
                  schema: str = None,
                  name: str = None,
-                 db_conn: connection = None):
+                 db_conn: connection = None,
+                 backend: str = INFORMATION_SCHEMA):
 
         self.primary_key_definition = PrimaryKeyDefinition()
         self.column_definitions = list()
         self.index_definitions = list()
         self.permission_definitions = list()
+        self.partition_definition = None
+        self.storage_definition = StorageDefinition()
+        self.seed = None
+        self.source = None
+        self.query = None
+        self.watermark_fields = list()
+        self.reconcile_every = None
 
         self.name = name
         self.namespace = schema
         self.connection = db_conn
+        self.backend = backend
 
         if (self.name is None
                 and self.namespace is None
@@ -72,26 +108,22 @@ class TableDefinition:
         self.get_column_list()
         self.get_index_list()
         self.get_permission_list()
+        self.get_partition_list()
+        self.get_storage_list()
 
-    def check_table_exists(self) -> bool:
-        where_dict = {"table_schema": self.namespace, "table_name": self.name}
-
-        cursor = self.connection.cursor()
-        cursor.execute("""
-                        SELECT
-                            COUNT(*)
-                        FROM
-                            information_schema.tables
-                        WHERE
-                            table_schema = %(table_schema)s
-                            AND table_name = %(table_name)s
-                        """,
-                       where_dict)
-
-        result = cursor.fetchone()[0] == 1
+    def _fetch(self, query: str) -> list:
+        where_dict = {"namespaces": [self.namespace], "table_name": self.name}
+
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(get_queries(self.backend)[query], where_dict)
+        rows = cursor.fetchall()
         cursor.close()
 
-        return result
+        return group_table_rows(rows).get((self.namespace, self.name),
+                                          list())
+
+    def check_table_exists(self) -> bool:
+        return len(self._fetch('tables')) == 1
 
     def get_column_list(self) -> list:
         """
@@ -99,57 +131,7 @@ class TableDefinition:
         schema.table in the database connected to.
         """
 
-        where_dict = {"table_schema": self.namespace, "table_name": self.name}
-
-        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-
-        cursor.execute("""SELECT
-                            c.column_name,
-                            c.is_nullable::TEXT = 'YES' AS is_nullable,
-                            CASE
-                                WHEN c.domain_name is not null
-                                    THEN domain_name
-                                WHEN c.data_type='character varying'
-                                    THEN 'varchar('||
-                                        c.character_maximum_length||')'
-                                WHEN c.data_type='integer'
-                                    THEN 'int'
-                                WHEN c.data_type='numeric'
-                                    THEN 'numeric('||c.numeric_precision||'
-                                                    ,'||c.numeric_scale||')'
-                                WHEN c.data_type='timestamp without time zone'
-                                    THEN 'timestamp'
-                                ELSE c.data_type
-                            end as data_type,
-                            c.character_maximum_length,
-                            c.is_identity::TEXT = 'YES' AS is_identity,
-                            c.column_default,
-                            keys.constraint_name,
-                            cons.constraint_type::TEXT = 'PRIMARY KEY'::TEXT
-                                AS is_primary_key
-                        FROM
-                            information_schema.columns c
-                        LEFT JOIN
-                            information_schema.key_column_usage keys
-                            ON
-                                c.column_name = keys.column_name
-                                AND c.table_name = keys.table_name
-                                AND c.table_schema  = keys.table_schema
-                        LEFT JOIN information_schema.table_constraints cons
-                            ON
-                                cons.constraint_name = keys.constraint_name
-                                AND cons.table_name  = c.table_name
-                                AND cons.table_schema = c.table_schema
-                        WHERE
-                            c.table_schema = %(table_schema)s
-                            AND c.table_name = %(table_name)s
-                        ORDER BY
-                            c.column_name""",
-                       where_dict)
-
-        columns = cursor.fetchall()
-
-        cursor.close()
+        columns = self._fetch('columns')
 
         self.extract_column_definitions(columns)
 
@@ -188,23 +170,7 @@ class TableDefinition:
         schema.table in the database connected to.
         """
 
-        where_dict = {"table_schema": self.namespace, "table_name": self.name}
-
-        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-
-        cursor.execute("""SELECT
-                           indexname,
-                           indexdef
-                       FROM
-                            pg_indexes
-                       WHERE
-                            schemaname = %(table_schema)s
-                            AND tablename = %(table_name)s""",
-                       where_dict)
-
-        indexes = cursor.fetchall()
-
-        cursor.close()
+        indexes = self._fetch('indexes')
 
         self.extract_index_definitions(indexes)
 
@@ -214,50 +180,29 @@ class TableDefinition:
         self.index_definitions = list()
 
         for index in indexes:
-            index_str = index.get('indexdef')
-
             index_definition = IndexDefinition(
                 name=index.get('indexname'),
-                unique='UNIQUE' in index_str
+                fields=list(index.get('fields')),
+                unique=index.get('is_unique'),
+                type=index.get('method'),
+                include=list(index.get('include') or list()),
+                predicate=index.get('predicate'),
+                opclasses=dict(index.get('opclasses') or dict()),
+                parameters=parse_storage_parameters(index.get('parameters')),
+                tablespace=index.get('tablespace')
             )
 
-            if 'btree' in index_str:
-                index_definition.set_type('btree')
-
-            fields = re.findall(r'\((.*?)\)', index_str)
-            index_definition.set_fields(fields[0].split(', '))
-
             self.index_definitions.append(index_definition)
 
         return self.index_definitions
 
-    def get_permission_list(self) -> None:
+    def get_permission_list(self) -> list:
         """
         Get a list of permissions for the specified
         schema.table in the database connected to.
         """
 
-        where_dict = {"table_schema": self.namespace, "table_name": self.name}
-
-        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-
-        cursor.execute("""SELECT
-                            grantee,
-                            privilege_type
-                        FROM
-                            information_schema.role_table_grants
-                        WHERE
-                            grantee NOT in('postgres', 'PUBLIC')
-                            AND table_schema = %(table_schema)s
-                            AND table_name = %(table_name)s
-                        ORDER BY
-                            grantee,
-                            privilege_type""",
-                       where_dict)
-
-        permissions = cursor.fetchall()
-
-        cursor.close()
+        permissions = self._fetch('permissions')
 
         self.extract_permission_definitions(permissions)
 
@@ -284,6 +229,55 @@ class TableDefinition:
 
         return self.permission_definitions
 
+    def get_partition_list(self) -> list:
+        """
+        Get the partition key and child partitions of the specified
+        schema.table, if it is partitioned, in the database connected to.
+        """
+
+        partitions = self._fetch('partitions')
+
+        self.extract_partition_definition(partitions)
+
+        return partitions
+
+    def extract_partition_definition(self, partitions: list):
+        self.partition_definition = None
+
+        for partition in partitions:
+            self.partition_definition = PartitionDefinition(
+                strategy=partition.get('strategy'),
+                fields=list(partition.get('partition_key')),
+                partitions=dict(zip(partition.get('partitions'),
+                                    partition.get('bounds')))
+            )
+
+        return self.partition_definition
+
+    def get_storage_list(self) -> list:
+        """
+        Get the storage parameters, tablespace and persistence of the
+        specified schema.table in the database connected to.
+        """
+
+        storage = self._fetch('storage')
+
+        self.extract_storage_definition(storage)
+
+        return storage
+
+    def extract_storage_definition(self, storage: list):
+        self.storage_definition = StorageDefinition()
+
+        for row in storage:
+            self.storage_definition = StorageDefinition(
+                parameters=parse_storage_parameters(row.get('parameters')),
+                tablespace=row.get('tablespace'),
+                unlogged=row.get('unlogged')
+            )
+
+        return self.storage_definition
+
     def to_json(self, set_defaults: bool = False):
         column_schema = dict()
         for column in self.column_definitions:
@@ -303,18 +297,372 @@ class TableDefinition:
 
         json = dict(
             name=self.name,
-            schema=column_schema,
-            primary_key=self.primary_key_definition.to_json(self),
-            indexes=index_schema,
-            permissions=permission_schema
+            schema=column_schema
         )
 
+        # A table without a primary key has no fields to describe
+        if len(self.primary_key_definition.fields) > 0:
+            json['primary_key'] = self.primary_key_definition.to_json(self)
+
+        # pjs.schema doesn't allow empty indexes or permissions
+        if index_schema:
+            json['indexes'] = index_schema
+        if permission_schema:
+            json['permissions'] = permission_schema
+
+        if self.partition_definition is not None:
+            json['partition'] = self.partition_definition.to_json()
+
+        storage_schema = self.storage_definition.to_json()
+        if storage_schema:
+            json['storage'] = storage_schema
+
         json['$schema'] = DEFAULT_SCHEMA
 
         return json
 
 
-class PrimaryKeyDefinition:
+class SchemaDefinition:
+    """Generate definitions for every table in one or more schemas
+
+    The catalog is read with one set based query each for the tables,
+    columns, indexes, permissions, partitions and storage, regardless of how
+    many tables the schemas contain. The rows are then fanned out to a
+    TableDefinition per table using the TableDefinition.extract_* methods.
+    Child partitions are collapsed into their parent's PartitionDefinition
+    rather than described as tables.
+
+    Usage
+    ---------
+    db_conn = psycopg2.connect()
+    definition = SchemaDefinition(['public', 'staging'], db_conn)
+
+    Parameters
+    ----------
+    namespaces : str or list
+        The DB schema, or list of DB schemas, to describe
+    db_conn : connection
+        A psycopg2.connection object
+    backend : str
+        The catalog to introspect, either 'information_schema' (default)
+        or 'pg_catalog'
+
+    Attributes
+    ----------
+    namespaces : list
+        The DB schemas described
+    table_definitions : list
+        A list of TableDefinition's, ordered by schema and table name
+
+    """
+
+    def __init__(self,
+                 namespaces=None,
+                 db_conn: connection = None,
+                 backend: str = INFORMATION_SCHEMA):
+        if isinstance(namespaces, str):
+            namespaces = [namespaces]
+
+        self.namespaces = list(namespaces or list())
+        self.connection = db_conn
+        self.backend = backend
+        self.table_definitions = list()
+
+        if len(self.namespaces) == 0 and self.connection is None:
+            return
+
+        if len(self.namespaces) == 0 or self.connection is None:
+            raise NameError("namespaces and connection are "
+                            "required to describe a schema")
+
+        tables = self.get_table_list()
+        self.extract_table_definitions(tables,
+                                       self.get_column_list(),
+                                       self.get_index_list(),
+                                       self.get_permission_list(),
+                                       self.get_partition_list(),
+                                       self.get_storage_list())
+
+    def _fetch(self, query: str) -> list:
+        where_dict = {"namespaces": self.namespaces, "table_name": None}
+
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(get_queries(self.backend)[query], where_dict)
+        rows = cursor.fetchall()
+        cursor.close()
+
+        return rows
+
+    def get_table_list(self) -> list:
+        """
+        Get a list of tables in the described schemas.
+        """
+
+        return self._fetch('tables')
+
+    def get_column_list(self) -> list:
+        """
+        Get the columns of every table in the described schemas, in the
+        same shape as TableDefinition.get_column_list.
+        """
+
+        return self._fetch('columns')
+
+    def get_index_list(self) -> list:
+        """
+        Get the indexes of every table in the described schemas, in the
+        same shape as TableDefinition.get_index_list.
+        """
+
+        return self._fetch('indexes')
+
+    def get_permission_list(self) -> list:
+        """
+        Get the grants on every table in the described schemas, in the
+        same shape as TableDefinition.get_permission_list.
+        """
+
+        return self._fetch('permissions')
+
+    def get_partition_list(self) -> list:
+        """
+        Get the partitioned tables in the described schemas and their
+        child partitions, in the same shape as
+        TableDefinition.get_partition_list.
+        """
+
+        return self._fetch('partitions')
+
+    def get_storage_list(self) -> list:
+        """
+        Get the storage parameters, tablespace and persistence of the
+        tables in the described schemas that set any, in the same shape as
+        TableDefinition.get_storage_list.
+        """
+
+        return self._fetch('storage')
+
+    def extract_table_definitions(self,
+                                  tables: list,
+                                  columns: list,
+                                  indexes: list,
+                                  permissions: list,
+                                  partitions: list = None,
+                                  storage: list = None,
+                                  failures: dict = None) -> list:
+        """
+        Fan schema wide catalog rows out to a TableDefinition per table.
+        Given a failures dict, a table that can't be described records its
+        exception under (schema, table) and is left out, rather than
+        raising and losing the rest of the schema.
+        """
+
+        self.table_definitions = list()
+
+        grouped_columns = group_table_rows(columns)
+        grouped_indexes = group_table_rows(indexes)
+        grouped_permissions = group_table_rows(permissions)
+        grouped_partitions = group_table_rows(partitions or list())
+        grouped_storage = group_table_rows(storage or list())
+
+        for table in tables:
+            key = (table.get('table_schema'), table.get('table_name'))
+
+            definition = TableDefinition()
+            definition.namespace, definition.name = key
+            definition.connection = self.connection
+            definition.backend = self.backend
+
+            try:
+                definition.extract_column_definitions(
+                    grouped_columns.get(key, list()))
+                definition.extract_index_definitions(
+                    grouped_indexes.get(key, list()))
+                definition.extract_permission_definitions(
+                    grouped_permissions.get(key, list()))
+                definition.extract_partition_definition(
+                    grouped_partitions.get(key, list()))
+                definition.extract_storage_definition(
+                    grouped_storage.get(key, list()))
+            except Exception as error:
+                if failures is None:
+                    raise
+                failures[key] = error
+                continue
+
+            self.table_definitions.append(definition)
+
+        return self.table_definitions
+
+    def get_table_definition(self,
+                             name: str,
+                             namespace: str = None) -> TableDefinition:
+        for definition in self.table_definitions:
+            if (definition.name == name
+                    and namespace in (None, definition.namespace)):
+                return definition
+
+        raise NameError("The requested table was not described: "
+                        "{}.{}".format(namespace, name))
+
+    def to_json(self, set_defaults: bool = False) -> list:
+        return [definition.to_json(set_defaults)
+                for definition in self.table_definitions]
+
+
+def parse_storage_value(value: str):
+    """
+    Read a storage parameter's value back as the boolean, int or float it
+    was set with, or a string otherwise.
+    """
+
+    if value.lower() in ('true', 'on'):
+        return True
+    if value.lower() in ('false', 'off'):
+        return False
+
+    for number in (int, float):
+        try:
+            return number(value)
+        except ValueError:
+            pass
+
+    return value
+
+
+def parse_storage_parameters(parameters: list) -> dict:
+    """
+    Read reloptions, a list of 'name=value' strings, into a dict.
+    """
+
+    parsed = dict()
+    for parameter in parameters or list():
+        name, value = parameter.split('=', 1)
+        parsed[name] = parse_storage_value(value)
+
+    return parsed
+
+
+def group_table_rows(rows: list) -> dict:
+    """
+    Group schema wide catalog rows by (table_schema, table_name), removing
+    those keys so each group matches the rows of a single table query.
+    """
+
+    grouped = dict()
+
+    for row in rows:
+        row = dict(row)
+        key = (row.pop('table_schema'), row.pop('table_name'))
+
+        if key not in grouped.keys():
+            grouped[key] = list()
+
+        grouped[key].append(row)
+
+    return grouped
+
+
+def describe_schema(namespaces,
+                    db_conn: connection,
+                    backend: str = INFORMATION_SCHEMA) -> list:
+    """
+    Describe every table in one or more schemas with a fixed number of
+    catalog queries, returning a list of TableDefinition's.
+    """
+
+    return SchemaDefinition(namespaces, db_conn, backend).table_definitions
+
+
+def describe_tables(tables: list,
+                    pool: AbstractConnectionPool = None,
+                    dsn: str = None,
+                    workers: int = 4,
+                    backend: str = INFORMATION_SCHEMA) -> tuple:
+    """
+    Describe a list of (schema, table) pairs concurrently, one connection
+    per worker.
+
+    Either pass a ThreadedConnectionPool, which is left open and caps
+    `workers` at its maxconn, or a dsn from which a pool of `workers`
+    connections is created and closed again.
+
+    Returns a tuple of the TableDefinition's that were described, in the
+    order the tables were requested, and a dict of the exceptions raised
+    for each (schema, table) that failed. A failing table never aborts the
+    rest of the batch.
+    """
+
+    if pool is None and dsn is None:
+        raise NameError("A connection pool or dsn is required to "
+                        "describe tables in parallel")
+
+    owns_pool = pool is None
+    if owns_pool:
+        pool = ThreadedConnectionPool(1, workers, dsn)
+
+    # getconn raises rather than waits once the pool is exhausted
+    workers = min(workers, pool.maxconn)
+
+    def describe(table: tuple) -> TableDefinition:
+        db_conn = pool.getconn()
+        try:
+            definition = TableDefinition(table[0], table[1], db_conn, backend)
+            definition.connection = None
+            return definition
+        finally:
+            db_conn.rollback()
+            pool.putconn(db_conn)
+
+    definitions = list()
+    failures = dict()
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [(tuple(table), executor.submit(describe, table))
+                       for table in tables]
+
+            for table, future in futures:
+                try:
+                    definitions.append(future.result())
+                except Exception as error:
+                    failures[table] = error
+    finally:
+        if owns_pool:
+            pool.closeall()
+
+    return definitions, failures
+
+
+class Definition(ABC):
+    """
+    Equality and hashing by value for the definitions of a table's parts,
+    so they can be compared directly and used as set members or dict keys.
+    Definitions are slotted to keep large catalogs compact. Don't change a
+    definition while it is in a set or used as a key.
+    """
+
+    __slots__ = ()
+
+    @abstractmethod
+    def key(self) -> tuple:
+        """
+        The values that identify the definition, compared and hashed in
+        place of the definition itself.
+        """
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.key() == other.key()
+
+    def __hash__(self):
+        return hash((type(self).__name__,) + self.key())
+
+
+class PrimaryKeyDefinition(Definition):
+    __slots__ = ('fields', 'constraint_name', 'table_definition')
+
     def __init__(self,
                  field: str = None,
                  constraint: str = None,
@@ -330,6 +678,9 @@ class PrimaryKeyDefinition:
         elif table_definition:
             self.set_name(table_definition.name + '_pkey')
 
+    def key(self) -> tuple:
+        return (tuple(self.fields), self.constraint_name)
+
     def set_name(self, name: str):
         self.constraint_name = name
 
@@ -356,7 +707,10 @@ class PrimaryKeyDefinition:
         return json
 
 
-class ColumnDefinition:
+class ColumnDefinition(Definition):
+    __slots__ = ('name', 'type', 'identity', 'nullable', 'max_length',
+                 'default_value', 'primary', 'parse_with_function')
+
     @overload
     def __init__(self,
                  name: str,
@@ -365,7 +719,8 @@ class ColumnDefinition:
                  nullable: bool = False,
                  max_length: int = None,
                  default_value: str = None,
-                 primary: bool = False):
+                 primary: bool = False,
+                 parse_with_function: str = None):
         ...
 
     def __init__(self, **kwargs):
@@ -375,11 +730,18 @@ class ColumnDefinition:
             raise NameError('Name and type are mandatory requirements for a '
                             'ColumnDefinition')
 
-        self.identity = kwargs.get('nullable', False)
+        self.identity = kwargs.get('identity',
+                                   kwargs.get('is_identity', False))
         self.nullable = kwargs.get('nullable', False)
         self.max_length = kwargs.get('max_length', None)
         self.default_value = kwargs.get('default_value', None)
         self.primary = kwargs.get('primary', False)
+        self.parse_with_function = kwargs.get('parse_with_function', None)
+
+    def key(self) -> tuple:
+        return (self.name, self.type, self.identity, self.nullable,
+                self.max_length, self.default_value, self.primary,
+                self.parse_with_function)
 
     def set_primary(self):
         self.primary = True
@@ -393,6 +755,8 @@ class ColumnDefinition:
             schema['max_length'] = self.max_length
         if self.default_value or set_defaults:
             schema['default_value'] = self.default_value
+        if self.parse_with_function:
+            schema['parse_with_function'] = self.parse_with_function
 
         json = dict()
         json[self.name] = schema
@@ -400,13 +764,31 @@ class ColumnDefinition:
         return json
 
 
-class IndexDefinition:
+class IndexDefinition(Definition):
+    """
+    An index's type is its access method, such as btree or gin. Its fields
+    are column names, or expressions in parentheses such as
+    '(lower(label))'. include lists the columns of an INCLUDE clause,
+    predicate is the WHERE clause of a partial index and opclasses maps
+    fields to any operator class other than the default. parameters are
+    its storage parameters, such as fillfactor, and tablespace is None for
+    the database's default.
+    """
+
+    __slots__ = ('name', 'fields', 'unique', 'type', 'include', 'predicate',
+                 'opclasses', 'parameters', 'tablespace')
+
     @overload
     def __init__(self,
                  name: str,
                  fields: list = list(),
                  unique: bool = True,
-                 type: str = 'btree'):
+                 type: str = 'btree',
+                 include: list = list(),
+                 predicate: str = None,
+                 opclasses: dict = dict(),
+                 parameters: dict = dict(),
+                 tablespace: str = None):
         ...
 
     def __init__(self, **kwargs):
@@ -418,6 +800,17 @@ class IndexDefinition:
         self.fields = kwargs.get('fields', list())
         self.unique = kwargs.get('unique', False)
         self.type = kwargs.get('type', None)
+        self.include = kwargs.get('include', list())
+        self.predicate = kwargs.get('predicate', None)
+        self.opclasses = kwargs.get('opclasses', dict())
+        self.parameters = kwargs.get('parameters', dict())
+        self.tablespace = kwargs.get('tablespace', None)
+
+    def key(self) -> tuple:
+        return (self.name, tuple(self.fields), self.unique, self.type,
+                tuple(self.include), self.predicate,
+                tuple(sorted(self.opclasses.items())),
+                tuple(sorted(self.parameters.items())), self.tablespace)
 
     def set_type(self, type: str):
         self.type = type
@@ -435,6 +828,16 @@ class IndexDefinition:
         if self.unique or set_defaults:
             schema['unique'] = self.unique
         schema['fields'] = self.fields
+        if self.include:
+            schema['include'] = self.include
+        if self.predicate:
+            schema['predicate'] = self.predicate
+        if self.opclasses:
+            schema['opclasses'] = self.opclasses
+        if self.parameters:
+            schema['parameters'] = self.parameters
+        if self.tablespace:
+            schema['tablespace'] = self.tablespace
 
         json = dict()
         json[self.name] = schema
@@ -442,11 +845,16 @@ class IndexDefinition:
         return json
 
 
-class PermissionDefinition:
+class PermissionDefinition(Definition):
+    __slots__ = ('name', 'grants')
+
     def __init__(self, role_or_user: str, grants: list):
         self.name = role_or_user
         self.grants = grants
 
+    def key(self) -> tuple:
+        return (self.name, tuple(self.grants))
+
     def to_json(self):
         json = dict()
         if len(self.grants) == 7:
@@ -455,3 +863,96 @@ class PermissionDefinition:
             json[self.name] = self.grants
 
         return json
+
+
+class PartitionDefinition(Definition):
+    """
+    strategy is range, list or hash, and fields the partition key. Specs
+    may add a template for the partitions to keep: a range interval of
+    day, week, month or year, with the number of upcoming partitions to
+    premake, the past partitions to retain and whether to detach or drop
+    expired ones, or a hash modulus. Described tables have their child
+    partitions, as a dict of name to bound.
+    """
+
+    __slots__ = ('strategy', 'fields', 'interval', 'premake', 'retention',
+                 'expire', 'modulus', 'partitions')
+
+    @overload
+    def __init__(self,
+                 strategy: str,
+                 fields: list,
+                 interval: str = None,
+                 premake: int = None,
+                 retention: int = None,
+                 expire: str = 'detach',
+                 modulus: int = None,
+                 partitions: dict = dict()):
+        ...
+
+    def __init__(self, **kwargs):
+        self.strategy = kwargs.get('strategy')
+        self.fields = kwargs.get('fields')
+        if self.strategy is None or not self.fields:
+            raise NameError('Strategy and fields are mandatory requirements '
+                            'for a PartitionDefinition')
+
+        self.interval = kwargs.get('interval', None)
+        self.premake = kwargs.get('premake', None)
+        self.retention = kwargs.get('retention', None)
+        self.expire = kwargs.get('expire', 'detach')
+        self.modulus = kwargs.get('modulus', None)
+        self.partitions = kwargs.get('partitions', dict())
+
+    def key(self) -> tuple:
+        return (self.strategy, tuple(self.fields), self.interval, self.premake,
+                self.retention, self.expire, self.modulus,
+                tuple(sorted(self.partitions.items())))
+
+    def to_json(self):
+        json = dict(strategy=self.strategy, fields=self.fields)
+        for name in ('interval', 'premake', 'retention', 'modulus'):
+            if getattr(self, name) is not None:
+                json[name] = getattr(self, name)
+        if self.retention is not None:
+            json['expire'] = self.expire
+
+        return json
+
+
+class StorageDefinition(Definition):
+    """
+    parameters are a table's storage parameters, such as fillfactor or
+    autovacuum_vacuum_scale_factor, with those of its TOAST table prefixed
+    with toast. tablespace is None for the database's default, and
+    unlogged tables skip the write-ahead log.
+    """
+
+    __slots__ = ('parameters', 'tablespace', 'unlogged')
+
+    @overload
+    def __init__(self,
+                 parameters: dict = dict(),
+                 tablespace: str = None,
+                 unlogged: bool = False):
+        ...
+
+    def __init__(self, **kwargs):
+        self.parameters = kwargs.get('parameters', dict())
+        self.tablespace = kwargs.get('tablespace', None)
+        self.unlogged = kwargs.get('unlogged', False)
+
+    def key(self) -> tuple:
+        return (tuple(sorted(self.parameters.items())), self.tablespace,
+                self.unlogged)
+
+    def to_json(self):
+        json = dict()
+        if self.parameters:
+            json['parameters'] = self.parameters
+        if self.tablespace:
+            json['tablespace'] = self.tablespace
+        if self.unlogged:
+            json['unlogged'] = self.unlogged
+
+        return json
@@ -0,0 +1,376 @@
+"""Run a MigrationPlan across a pool of connections
+
+Statements are grouped by table. A table's statements run in the order of
+their depends_on graph on a single connection, while tables that don't
+depend on each other run concurrently. Each table runs with its own
+lock_timeout, and work that fails waiting on a lock is retried with
+exponential backoff rather than queueing behind long running queries.
+
+Every statement executed is timed, and the timings are returned and can be
+written to a log as JSON lines.
+
+Usage
+---------
+plan = plan_migration(comparison.results, concurrently=True)
+with open('migration.log', 'a') as log:
+    timings, failures = execute_plan(plan,
+                                     dsn='dbname=warehouse',
+                                     workers=8,
+                                     lock_timeout='2s',
+                                     log=log)
+
+"""
+import json
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+import psycopg2
+from psycopg2 import errorcodes
+from psycopg2.pool import AbstractConnectionPool, ThreadedConnectionPool
+
+from migrate import CREATE_INDEX, MigrationPlan, quote_table
+
+DEFAULT_LOCK_TIMEOUT = '5s'
+
+# Errors caused by contention, where running again may succeed
+RETRY_CODES = (errorcodes.LOCK_NOT_AVAILABLE, errorcodes.DEADLOCK_DETECTED)
+
+# Statuses recorded in the timing log
+OK = 'ok'
+RETRY = 'retry'
+FAILED = 'failed'
+ROLLED_BACK = 'rolled_back'
+SKIPPED = 'skipped'
+
+
+def table_key(statement) -> tuple:
+    return (statement.namespace, statement.table)
+
+
+def order_statements(statements: list) -> list:
+    """
+    Sort statements so each runs after those it depends on, otherwise
+    keeping their order. Dependencies outside the list are ignored.
+    """
+
+    position = {id(statement): index
+                for index, statement in enumerate(statements)}
+    remaining = list(statements)
+    done = set()
+    ordered = list()
+
+    while remaining:
+        ready = [statement for statement in remaining
+                 if all(id(dependency) in done
+                        or id(dependency) not in position
+                        for dependency in statement.depends_on)]
+        if not ready:
+            raise NameError("The statements for {}.{} have a circular "
+                            "dependency".format(*table_key(remaining[0])))
+
+        statement = min(ready, key=lambda item: position[id(item)])
+        remaining.remove(statement)
+        done.add(id(statement))
+        ordered.append(statement)
+
+    return ordered
+
+
+def dependency_graph(plan: MigrationPlan) -> tuple:
+    """
+    Group a plan's statements by table.
+
+    Returns a dict of (schema, table) to the table's statements in the
+    order they must run, and a dict of (schema, table) to the set of other
+    tables that must finish first.
+    """
+
+    statements = dict()
+    for statement in plan:
+        statements.setdefault(table_key(statement), list()).append(statement)
+
+    graph = dict()
+    for key in statements.keys():
+        statements[key] = order_statements(statements[key])
+        graph[key] = set(table_key(dependency)
+                         for statement in statements[key]
+                         for dependency in statement.depends_on
+                         if table_key(dependency) != key)
+
+    return statements, graph
+
+
+def group_statements(statements: list) -> list:
+    """
+    Split statements into the units that run and are retried together: a
+    run of transactional statements shares one transaction, others run
+    alone outside of a transaction block.
+    """
+
+    groups = list()
+
+    for statement in statements:
+        if statement.transactional and groups and groups[-1][0].transactional:
+            groups[-1].append(statement)
+        else:
+            groups.append([statement])
+
+    return groups
+
+
+class TimingLog:
+    """Collect a record of every statement run, optionally writing each one
+    to a file as a line of JSON
+
+    Each record holds the statement's namespace, table, sql, cost,
+    attempt, started_at, duration in seconds, status and any error.
+    """
+
+    def __init__(self, log=None):
+        self.log = log
+        self.records = list()
+        self.lock = threading.Lock()
+
+    def record(self,
+               statement,
+               status: str,
+               attempt: int = 0,
+               started_at: float = None,
+               duration: float = None,
+               error: Exception = None):
+        record = dict(
+            namespace=statement.namespace,
+            table=statement.table,
+            sql=statement.sql,
+            cost=statement.cost,
+            attempt=attempt,
+            started_at=None if started_at is None else datetime.fromtimestamp(
+                started_at, timezone.utc).isoformat(),
+            duration=duration,
+            status=status,
+            error=None if error is None else str(error).strip()
+        )
+
+        with self.lock:
+            self.records.append(record)
+            if self.log is not None:
+                self.log.write(json.dumps(record) + '\n')
+                self.log.flush()
+
+
+def run_group(db_conn, group: list, attempt: int, timings: TimingLog):
+    """
+    Run a group of statements once, recording the timing of each.
+    """
+
+    transactional = group[0].transactional
+    db_conn.autocommit = not transactional
+    cursor = db_conn.cursor()
+    executed = list()
+
+    try:
+        for statement in group:
+            started_at = time.time()
+            try:
+                cursor.execute(statement.sql)
+            except Exception as error:
+                if transactional:
+                    db_conn.rollback()
+                status = RETRY if retryable(error) else FAILED
+                for previous, previous_started, duration in executed:
+                    timings.record(previous, ROLLED_BACK, attempt,
+                                   previous_started, duration)
+                timings.record(statement, status, attempt, started_at,
+                               time.time() - started_at, error)
+                raise
+            executed.append((statement, started_at,
+                             time.time() - started_at))
+
+        if transactional:
+            db_conn.commit()
+    finally:
+        cursor.close()
+
+    for statement, started_at, duration in executed:
+        timings.record(statement, OK, attempt, started_at, duration)
+
+
+def retryable(error: Exception) -> bool:
+    return isinstance(error, psycopg2.Error) and error.pgcode in RETRY_CODES
+
+
+def clean_up_group(db_conn, group: list):
+    """
+    Drop any invalid index left by a concurrent build that failed, so it
+    can be built again.
+    """
+
+    for statement in group:
+        if statement.transactional:
+            continue
+        for action in statement.actions:
+            if action.kind != CREATE_INDEX:
+                continue
+            db_conn.autocommit = True
+            cursor = db_conn.cursor()
+            cursor.execute('DROP INDEX CONCURRENTLY IF EXISTS {}'.format(
+                quote_table(statement.namespace, action.name)))
+            cursor.close()
+
+
+def run_table(db_conn,
+              statements: list,
+              lock_timeout,
+              retries: int,
+              backoff: float,
+              timings: TimingLog):
+    """
+    Run one table's statements, retrying a group that fails on lock
+    contention up to `retries` times, waiting `backoff` seconds before the
+    first retry and twice as long before each one after.
+    """
+
+    cursor = db_conn.cursor()
+    cursor.execute("SELECT set_config('lock_timeout', %s, false)",
+                   (str(lock_timeout),))
+    cursor.close()
+    db_conn.commit()
+
+    groups = group_statements(statements)
+
+    try:
+        for index, group in enumerate(groups):
+            attempt = 0
+            while True:
+                try:
+                    run_group(db_conn, group, attempt, timings)
+                    break
+                except Exception as error:
+                    if not retryable(error) or attempt >= retries:
+                        for statement in [statement for remaining
+                                          in groups[index + 1:]
+                                          for statement in remaining]:
+                            timings.record(statement, SKIPPED)
+                        raise
+                    time.sleep(backoff * 2 ** attempt
+                               * random.uniform(0.5, 1.5))
+                    clean_up_group(db_conn, group)
+                    attempt += 1
+    finally:
+        db_conn.autocommit = True
+        cursor = db_conn.cursor()
+        cursor.execute('RESET lock_timeout')
+        cursor.close()
+        db_conn.autocommit = False
+
+
+def execute_plan(plan: MigrationPlan,
+                 pool: AbstractConnectionPool = None,
+                 dsn: str = None,
+                 workers: int = 4,
+                 lock_timeout=DEFAULT_LOCK_TIMEOUT,
+                 table_lock_timeouts: dict = None,
+                 retries: int = 3,
+                 backoff: float = 0.5,
+                 log=None) -> tuple:
+    """
+    Run a plan with up to `workers` tables migrating at once, each on its
+    own connection. A table only starts once every table it depends on
+    has finished.
+
+    Either pass a ThreadedConnectionPool, which is left open and caps
+    `workers` at its maxconn, or a dsn from which a pool of `workers`
+    connections is created and closed again.
+
+    lock_timeout applies to every table, unless overridden for a
+    (schema, table) in table_lock_timeouts. Values are as for the
+    lock_timeout setting, e.g. 500 or '2s'. Timing records are written to
+    log, a writable file, as lines of JSON when it is given.
+
+    Returns a tuple of the timing records for every statement, in the order
+    they finished, and a dict of the exception raised for each (schema,
+    table) that failed. Tables depending on a failed table are skipped and
+    listed as failures too.
+    """
+
+    if pool is None and dsn is None:
+        raise NameError("A connection pool or dsn is required to "
+                        "execute a plan in parallel")
+
+    table_lock_timeouts = table_lock_timeouts or dict()
+    statements, graph = dependency_graph(plan)
+    timings = TimingLog(log)
+    failures = dict()
+
+    for key, dependencies in graph.items():
+        missing = dependencies - set(graph.keys())
+        if missing:
+            raise NameError("{}.{} depends on tables that aren't in the "
+                            "plan: {}".format(key[0], key[1], sorted(missing)))
+
+    owns_pool = pool is None
+    if owns_pool:
+        pool = ThreadedConnectionPool(1, workers, dsn)
+
+    # getconn raises rather than waits once the pool is exhausted
+    workers = min(workers, pool.maxconn)
+
+    def migrate(key: tuple):
+        db_conn = pool.getconn()
+        try:
+            run_table(db_conn,
+                      statements[key],
+                      table_lock_timeouts.get(key, lock_timeout),
+                      retries,
+                      backoff,
+                      timings)
+        finally:
+            pool.putconn(db_conn)
+
+    pending = list(statements.keys())
+    finished = set()
+    running = dict()
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while pending or running:
+                # Skipping a table can skip tables before it in the list
+                skipped = True
+                while skipped:
+                    skipped = False
+                    for key in list(pending):
+                        failed = graph[key] & set(failures.keys())
+                        if failed:
+                            pending.remove(key)
+                            failures[key] = NameError(
+                                "Skipped as {}.{} failed".format(
+                                    *min(failed)))
+                            for statement in statements[key]:
+                                timings.record(statement, SKIPPED)
+                            skipped = True
+                        elif graph[key] <= finished:
+                            pending.remove(key)
+                            running[executor.submit(migrate, key)] = key
+
+                if not running:
+                    if pending:
+                        raise NameError("The plan's tables have a circular "
+                                        "dependency: {}".format(pending))
+                    break
+
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    try:
+                        future.result()
+                        finished.add(key)
+                    except Exception as error:
+                        failures[key] = error
+    finally:
+        if owns_pool:
+            pool.closeall()
+
+    return timings.records, failures
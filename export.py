@@ -0,0 +1,410 @@
+"""Export a whole database into spec files
+
+Each namespace is described with the set based SchemaDefinition queries,
+and its tables are written to one spec file each under
+<output>/<namespace>/<table>.json as they are converted. Namespaces are
+exported concurrently, one connection per worker.
+
+Files are written with sorted keys and a fixed indent, so exporting an
+unchanged table produces an identical file, which is left untouched. Each
+file is written aside and moved into place, so an interrupted export
+never leaves a partial spec behind.
+
+A manifest in the output directory records the catalog fingerprint and
+tables of every namespace exported. An export resumes by skipping the
+namespaces whose fingerprint hasn't changed, and removes the spec files it
+wrote earlier for tables that have since been dropped. A table that can't
+be described is reported and recorded in the manifest, while the rest of
+its namespace is still exported.
+
+Usage
+---------
+report = export_schema('specs', ['public', 'staging'],
+                       dsn='dbname=warehouse', workers=4)
+
+python export.py 'dbname=warehouse' specs --namespace public --workers 4
+
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.extensions import connection
+from psycopg2.pool import AbstractConnectionPool, ThreadedConnectionPool
+
+from cache import get_catalog_fingerprint
+from describe import SchemaDefinition
+from queries import BACKENDS, INFORMATION_SCHEMA
+
+MANIFEST_NAME = 'pjs-export.manifest'
+
+# Every schema holding a table, other than the system catalogs
+NAMESPACES_QUERY = """SELECT
+        n.nspname::TEXT
+    FROM pg_namespace n
+    WHERE n.nspname <> 'information_schema'
+        AND n.nspname NOT LIKE 'pg\\_%'
+        AND EXISTS (SELECT 1 FROM pg_class c
+                    WHERE c.relnamespace = n.oid
+                        AND c.relkind IN ('r', 'p'))
+    ORDER BY
+        n.nspname::TEXT"""
+
+
+class ExportReport:
+    """The outcome of an export_schema
+
+    Attributes
+    ----------
+    written : list
+        The spec files created or changed
+    unchanged : list
+        The spec files whose contents were already up to date
+    removed : list
+        The spec files removed as their table no longer exists
+    skipped : list
+        The namespaces whose catalog hadn't changed since the last export
+    failures : dict
+        The exception raised for each namespace that failed to export
+    table_failures : dict
+        The exception raised for each (namespace, table) that failed to
+        export, while the rest of its namespace was exported
+
+    """
+
+    def __init__(self):
+        self.written = list()
+        self.unchanged = list()
+        self.removed = list()
+        self.skipped = list()
+        self.failures = dict()
+        self.table_failures = dict()
+
+    @property
+    def is_valid(self) -> bool:
+        return len(self.failures) == 0 and len(self.table_failures) == 0
+
+    def __str__(self) -> str:
+        lines = ["{} written, {} unchanged, {} removed, "
+                 "{} namespaces skipped".format(len(self.written),
+                                                len(self.unchanged),
+                                                len(self.removed),
+                                                len(self.skipped))]
+        lines += ["{}: {}: {}".format(namespace, type(error).__name__, error)
+                  for namespace, error in sorted(self.failures.items())]
+        lines += ["{}.{}: {}: {}".format(namespace, table,
+                                         type(error).__name__, error)
+                  for (namespace, table), error
+                  in sorted(self.table_failures.items())]
+
+        return '\n'.join(lines)
+
+
+def get_namespaces(db_conn: connection) -> list:
+    """
+    List every schema in the database that holds a table.
+    """
+
+    cursor = db_conn.cursor()
+    cursor.execute(NAMESPACES_QUERY)
+    namespaces = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+
+    return namespaces
+
+
+def format_spec(spec: dict) -> str:
+    """
+    Serialise a spec the same way every time, so re-exporting an unchanged
+    table gives an identical file.
+    """
+
+    return json.dumps(spec, indent=4, sort_keys=True) + '\n'
+
+
+def write_file(path: str, text: str) -> bool:
+    """
+    Write text to a file, unless it already holds exactly that text. The
+    text is written aside and moved into place, so readers never see a
+    partial file. Returns whether the file was written.
+    """
+
+    try:
+        with open(path) as handle:
+            if handle.read() == text:
+                return False
+    except OSError:
+        pass
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'w') as temp_file:
+            temp_file.write(text)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+    return True
+
+
+def read_manifest(output: str) -> dict:
+    try:
+        with open(os.path.join(output, MANIFEST_NAME)) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return dict()
+
+
+def drop_none(value):
+    """
+    Remove the None values from a spec, which pjs.schema doesn't allow but
+    to_json(set_defaults=True) writes for unset attributes.
+    """
+
+    if isinstance(value, dict):
+        return {key: drop_none(item) for key, item in value.items()
+                if item is not None}
+
+    return value
+
+
+def describe_namespace(db_conn: connection,
+                       namespace: str,
+                       backend: str = INFORMATION_SCHEMA) -> tuple:
+    """
+    Describe every table in a namespace with the set based SchemaDefinition
+    queries. Returns a tuple of the TableDefinition's, and a dict of the
+    exception raised for each table name that couldn't be described.
+    """
+
+    schema = SchemaDefinition()
+    schema.namespaces = [namespace]
+    schema.connection = db_conn
+    schema.backend = backend
+
+    failures = dict()
+    schema.extract_table_definitions(schema.get_table_list(),
+                                     schema.get_column_list(),
+                                     schema.get_index_list(),
+                                     schema.get_permission_list(),
+                                     schema.get_partition_list(),
+                                     schema.get_storage_list(),
+                                     failures)
+
+    return (schema.table_definitions,
+            {table: error for (_, table), error in failures.items()})
+
+
+def export_namespace(db_conn: connection,
+                     output: str,
+                     namespace: str,
+                     backend: str = INFORMATION_SCHEMA,
+                     set_defaults: bool = False,
+                     previous: dict = None) -> tuple:
+    """
+    Write a spec file for every table in a namespace, removing those
+    written by a previous export, described by its manifest entry, for
+    tables that no longer exist. A table that fails is recorded, and its
+    spec file from any earlier export is left as it was.
+
+    Returns a tuple of the namespace's new manifest entry, the lists of
+    spec files written, unchanged and removed, and a dict of the exception
+    raised for each table name that failed.
+    """
+
+    fingerprint = get_catalog_fingerprint(db_conn, [namespace])
+    definitions, failures = describe_namespace(db_conn, namespace, backend)
+
+    directory = os.path.join(output, namespace)
+    written = list()
+    unchanged = list()
+    removed = list()
+
+    for definition in definitions:
+        path = os.path.join(directory, definition.name + '.json')
+        try:
+            text = format_spec(drop_none(definition.to_json(set_defaults)))
+        except Exception as error:
+            failures[definition.name] = error
+            continue
+
+        if write_file(path, text):
+            written.append(path)
+        else:
+            unchanged.append(path)
+
+    # Failed tables still exist, so their spec files are kept
+    tables = sorted(set(definition.name for definition in definitions)
+                    | set(failures.keys()))
+    for table in (previous or dict()).get('tables', list()):
+        path = os.path.join(directory, table + '.json')
+        if table not in tables and os.path.exists(path):
+            os.remove(path)
+            removed.append(path)
+
+    entry = dict(fingerprint=fingerprint, tables=tables)
+    if failures:
+        entry['failures'] = {
+            table: "{}: {}".format(type(error).__name__, error)
+            for table, error in failures.items()}
+
+    return entry, written, unchanged, removed, failures
+
+
+def export_schema(output: str,
+                  namespaces=None,
+                  pool: AbstractConnectionPool = None,
+                  dsn: str = None,
+                  workers: int = 4,
+                  backend: str = INFORMATION_SCHEMA,
+                  set_defaults: bool = False,
+                  resume: bool = True) -> ExportReport:
+    """
+    Export every table in one or more namespaces, or in the whole database
+    when namespaces is None, to spec files under output, exporting up to
+    `workers` namespaces concurrently.
+
+    Either pass a ThreadedConnectionPool, which is left open and caps
+    `workers` at its maxconn, or a dsn from which a pool of `workers`
+    connections is created and closed again.
+
+    With resume, namespaces whose catalog fingerprint matches the manifest
+    are skipped, as long as their spec files are all still there and none
+    of their tables failed. The manifest is saved as each namespace
+    finishes, so an interrupted export carries on where it stopped. A
+    failing table or namespace never aborts the rest.
+    """
+
+    if pool is None and dsn is None:
+        raise NameError("A connection pool or dsn is required to "
+                        "export a schema")
+
+    if isinstance(namespaces, str):
+        namespaces = [namespaces]
+
+    owns_pool = pool is None
+    if owns_pool:
+        pool = ThreadedConnectionPool(1, workers, dsn)
+
+    # getconn raises rather than waits once the pool is exhausted
+    workers = min(workers, pool.maxconn)
+
+    options = dict(backend=backend, set_defaults=set_defaults)
+    manifest = read_manifest(output)
+    if manifest.get('options') != options:
+        manifest = dict()
+    manifest['options'] = options
+    manifest.setdefault('namespaces', dict())
+
+    report = ExportReport()
+    lock = threading.Lock()
+
+    def save_manifest():
+        write_file(os.path.join(output, MANIFEST_NAME),
+                   format_spec(manifest))
+
+    def export(namespace: str):
+        previous = manifest['namespaces'].get(namespace)
+
+        db_conn = pool.getconn()
+        try:
+            if (resume and previous is not None
+                    and not previous.get('failures')
+                    and previous.get('fingerprint')
+                    == get_catalog_fingerprint(db_conn, [namespace])
+                    and all(os.path.exists(os.path.join(
+                        output, namespace, table + '.json'))
+                        for table in previous.get('tables', list()))):
+                with lock:
+                    report.skipped.append(namespace)
+                return
+
+            entry, written, unchanged, removed, failures = \
+                export_namespace(db_conn, output, namespace, backend,
+                                 set_defaults, previous)
+        finally:
+            db_conn.rollback()
+            pool.putconn(db_conn)
+
+        with lock:
+            report.written += written
+            report.unchanged += unchanged
+            report.removed += removed
+            for table, error in failures.items():
+                report.table_failures[(namespace, table)] = error
+            manifest['namespaces'][namespace] = entry
+            save_manifest()
+
+    try:
+        if namespaces is None:
+            db_conn = pool.getconn()
+            try:
+                namespaces = get_namespaces(db_conn)
+            finally:
+                db_conn.rollback()
+                pool.putconn(db_conn)
+
+        os.makedirs(output, exist_ok=True)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [(namespace, executor.submit(export, namespace))
+                       for namespace in sorted(set(namespaces))]
+
+            for namespace, future in futures:
+                try:
+                    future.result()
+                except Exception as error:
+                    report.failures[namespace] = error
+    finally:
+        if owns_pool:
+            pool.closeall()
+
+    # Keep the lists in a stable order however the workers finished
+    report.written.sort()
+    report.unchanged.sort()
+    report.removed.sort()
+    report.skipped.sort()
+
+    return report
+
+
+def main(args: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Export the tables of a database into pjs spec files")
+    parser.add_argument('dsn', help="The libpq connection string")
+    parser.add_argument('output', help="The directory to write specs to")
+    parser.add_argument('--namespace', action='append', dest='namespaces',
+                        help="A schema to export, repeat for several. "
+                             "Defaults to every schema with a table")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="The number of schemas to export at once")
+    parser.add_argument('--backend', choices=sorted(BACKENDS.keys()),
+                        default=INFORMATION_SCHEMA,
+                        help="The catalog to introspect")
+    parser.add_argument('--set-defaults', action='store_true',
+                        help="Write every attribute, including defaults")
+    parser.add_argument('--restart', action='store_true',
+                        help="Export every schema, even if unchanged")
+    options = parser.parse_args(args)
+
+    report = export_schema(options.output,
+                           options.namespaces,
+                           dsn=options.dsn,
+                           workers=options.workers,
+                           backend=options.backend,
+                           set_defaults=options.set_defaults,
+                           resume=not options.restart)
+    print(report)
+
+    return 0 if report.is_valid else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,136 @@
+import fnmatch
+import hashlib
 import json
-
-from jsonschema import validate
+import marshal
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
 from describe import (TableDefinition,
                       ColumnDefinition,
                       IndexDefinition,
+                      PartitionDefinition,
                       PermissionDefinition,
-                      PrimaryKeyDefinition)
+                      PrimaryKeyDefinition,
+                      StorageDefinition)
+
+PJS_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'pjs.schema')
+PJS_SCHEMA_CACHE_PATH = os.path.join(os.path.dirname(PJS_SCHEMA_PATH),
+                                     '__pycache__',
+                                     'pjs.schema.marshal')
+
+
+def __getattr__(name: str):
+    # PJS_SCHEMA is loaded on first access rather than at import
+    if name == 'PJS_SCHEMA':
+        return get_pjs_schema()
+
+    raise AttributeError("module {!r} has no attribute {!r}".format(
+        __name__, name))
+
+
+@lru_cache(maxsize=None)
+def get_pjs_schema() -> dict:
+    """
+    Load pjs.schema from alongside this module, on first use only.
+
+    A marshalled copy is kept in __pycache__ and reused while the size and
+    mtime of pjs.schema are unchanged, skipping the JSON parse on later
+    process starts. The copy is best effort; pjs.schema is read directly if
+    it can't be used or written.
+    """
+
+    stat = os.stat(PJS_SCHEMA_PATH)
+    source = [stat.st_mtime_ns, stat.st_size]
+
+    try:
+        with open(PJS_SCHEMA_CACHE_PATH, 'rb') as handle:
+            cached_source, schema = marshal.load(handle)
+        if cached_source == source:
+            return schema
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    schema = load_file(PJS_SCHEMA_PATH)
+
+    # Written aside and moved into place, as other processes may be reading
+    try:
+        directory = os.path.dirname(PJS_SCHEMA_CACHE_PATH)
+        os.makedirs(directory, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                marshal.dump([source, schema], temp_file)
+            os.replace(temp_path, PJS_SCHEMA_CACHE_PATH)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+    except OSError:
+        pass
+
+    return schema
+
+
+@lru_cache(maxsize=None)
+def get_validator():
+    """
+    Build the jsonschema validator for PJS_SCHEMA once, checking the
+    meta-schema on the first call only.
+    """
+
+    from jsonschema import validators
+
+    pjs_schema = get_pjs_schema()
+    validator_class = validators.validator_for(pjs_schema)
+    validator_class.check_schema(pjs_schema)
+
+    return validator_class(pjs_schema)
+
+
+@lru_cache(maxsize=None)
+def get_fast_validator():
+    """
+    Compile PJS_SCHEMA with fastjsonschema when it is installed, otherwise
+    return None. Defaults are not applied, so specs aren't modified.
+    """
+
+    try:
+        import fastjsonschema
+    except ImportError:
+        return None
+
+    return fastjsonschema.compile(get_pjs_schema(), use_default=False)
+
+
+def validate_schema(schema: str, fast: bool = True):
+    """
+    Validate a spec against PJS_SCHEMA, raising a jsonschema
+    ValidationError if it is invalid.
 
+    When fast is set and fastjsonschema is installed, valid specs are
+    accepted by the generated validator. Invalid specs are always re-checked
+    with jsonschema, so the error raised is the same either way.
+    """
+
+    fast_validator = get_fast_validator() if fast else None
+
+    if fast_validator is not None:
+        from fastjsonschema import JsonSchemaException
+
+        try:
+            fast_validator(schema)
+            return True
+        except JsonSchemaException:
+            pass
+
+    from jsonschema.exceptions import best_match
+
+    error = best_match(get_validator().iter_errors(schema))
+    if error is not None:
+        raise error
 
-def validate_schema(schema: str):
-    validate(schema, PJS_SCHEMA)
     return True
 
 
@@ -27,9 +147,6 @@ def load_file(path: str, as_json: bool = True) -> str:
     return text
 
 
-PJS_SCHEMA = load_file('pjs.schema')
-
-
 class JsonSpec:
     def __init__(self,
                  filepath: str = None,
@@ -37,8 +154,10 @@ class JsonSpec:
 
         self.is_valid = False
         self.TableDefinition = None
+        self.filepath = filepath
+        json_specification = None
 
-        if filepath is not None:
+        if filepath is not None and text is None:
             json_specification = load_file(filepath)
 
         if text is not None:
@@ -56,25 +175,56 @@ class JsonSpec:
 
         definition.name = json_spec.get('name')
 
+        # Specs loaded from a file without a name are named after the file
+        if definition.name is None and self.filepath is not None:
+            definition.name = os.path.splitext(
+                os.path.basename(self.filepath))[0]
+
         for field_name, field_spec in json_spec.get('schema').items():
             definition.column_definitions \
                 .append(self.load_field(field_name, field_spec))
 
-        for index_name, index_spec in json_spec.get('indexes').items():
+        for index_name, index_spec in json_spec.get('indexes',
+                                                    dict()).items():
             definition.index_definitions \
                 .append(self.load_index(index_name, index_spec))
 
-        for perm_name, perm_spec in json_spec.get('permissions').items():
+        for perm_name, perm_spec in json_spec.get('permissions',
+                                                  dict()).items():
             definition.permission_definitions \
                 .append(self.load_permission(perm_name, perm_spec))
 
-        definition.primary_key_definition \
-            = self.load_primarykey(json_spec.get('primary_key'), definition)
+        if json_spec.get('primary_key') is not None:
+            definition.primary_key_definition = self.load_primarykey(
+                json_spec.get('primary_key'), definition)
+
+        if json_spec.get('partition') is not None:
+            definition.partition_definition = self.load_partition(
+                json_spec.get('partition'))
+
+        if json_spec.get('storage') is not None:
+            definition.storage_definition = self.load_storage(
+                json_spec.get('storage'))
+
+        # Seed and query files are relative to the spec file
+        definition.seed = self.resolve_path(json_spec.get('seed'))
+        definition.query = self.resolve_path(json_spec.get('query'))
+        definition.source = json_spec.get('source')
+
+        incremental = json_spec.get('incremental', dict())
+        definition.watermark_fields = list(incremental.get('fields', list()))
+        definition.reconcile_every = incremental.get('reconcile_every')
 
         self.TableDefinition = definition
 
         return self.TableDefinition
 
+    def resolve_path(self, path: str) -> str:
+        if path is None or self.filepath is None:
+            return path
+
+        return os.path.join(os.path.dirname(self.filepath), path)
+
     def load_field(self, name, spec) -> ColumnDefinition:
         return ColumnDefinition(name=name, **spec)
 
@@ -84,8 +234,247 @@ class JsonSpec:
     def load_permission(self, name, grants) -> PermissionDefinition:
         return PermissionDefinition(role_or_user=name, grants=grants)
 
+    def load_partition(self, spec) -> PartitionDefinition:
+        return PartitionDefinition(**spec)
+
+    def load_storage(self, spec) -> StorageDefinition:
+        return StorageDefinition(**spec)
+
     def load_primarykey(self, spec, table) -> PrimaryKeyDefinition:
-        key = PrimaryKeyDefinition(table_definition=table)
+        key = PrimaryKeyDefinition(constraint=spec.get('constraint'),
+                                   table_definition=table)
         for field in spec.get('fields'):
             key.add_field(field)
         return key
+
+
+class SpecLoadReport:
+    """The errors found while loading a directory of specs
+
+    Attributes
+    ----------
+    errors : dict
+        The error message for each spec file that failed to load
+    duplicates : dict
+        The spec files for each table name declared by more than one file
+
+    """
+
+    def __init__(self):
+        self.errors = dict()
+        self.duplicates = dict()
+
+    @property
+    def is_valid(self) -> bool:
+        return len(self.errors) == 0 and len(self.duplicates) == 0
+
+    def __str__(self) -> str:
+        lines = ["{}: {}".format(path, error)
+                 for path, error in sorted(self.errors.items())]
+        lines += ["Duplicate table {}: {}".format(name, ', '.join(paths))
+                  for name, paths in sorted(self.duplicates.items())]
+
+        return '\n'.join(lines)
+
+
+def find_spec_files(path: str, pattern: str = '*.json') -> list:
+    """
+    Find every spec file under a directory, in a deterministic order.
+    """
+
+    spec_files = list()
+
+    for directory, directories, files in os.walk(path):
+        directories.sort()
+        for name in sorted(fnmatch.filter(files, pattern)):
+            spec_files.append(os.path.join(directory, name))
+
+    return spec_files
+
+
+def load_spec_file(path: str) -> tuple:
+    """
+    Parse, validate and load a single spec file, returning its path, the
+    TableDefinition and an error message. Exceptions are returned as
+    messages so failures can be sent back from a worker process.
+    """
+
+    try:
+        definition = JsonSpec(filepath=path).TableDefinition
+    except Exception as error:
+        return path, None, "{}: {}".format(type(error).__name__, error)
+
+    return path, definition, None
+
+
+def load_spec_directory(path: str,
+                        workers: int = None,
+                        pattern: str = '*.json') -> tuple:
+    """
+    Load every spec file under a directory across a pool of worker
+    processes.
+
+    Returns a tuple of a
+    dict of table name to TableDefinition, and a SpecLoadReport of the files
+    that failed to load and the table names declared more than once. Only
+    the first file, in path order, declaring a table is kept.
+    """
+
+    spec_files = find_spec_files(path, pattern)
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(spec_files) < 2:
+        results = [load_spec_file(spec_file) for spec_file in spec_files]
+    else:
+        chunksize = max(1, len(spec_files) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(load_spec_file,
+                                        spec_files,
+                                        chunksize=chunksize))
+
+    definitions = dict()
+    declared_by = dict()
+    report = SpecLoadReport()
+
+    for spec_file, definition, error in results:
+        if error is not None:
+            report.errors[spec_file] = error
+            continue
+
+        if definition.name in definitions.keys():
+            report.duplicates[definition.name] = declared_by[definition.name]
+            report.duplicates[definition.name].append(spec_file)
+            continue
+
+        definitions[definition.name] = definition
+        declared_by[definition.name] = [spec_file]
+
+    return definitions, report
+
+
+class SpecChanges:
+    """The tables added, modified and removed by a SpecRegistry.refresh
+
+    Attributes
+    ----------
+    added : list
+        Names of tables declared for the first time
+    modified : list
+        Names of tables whose spec changed
+    removed : list
+        Names of tables no longer declared by any spec
+
+    """
+
+    def __init__(self):
+        self.added = list()
+        self.modified = list()
+        self.removed = list()
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.modified or self.removed)
+
+
+class SpecRegistry:
+    """Keep a directory of specs loaded, re-loading only changed files
+
+    Each file's mtime and size are remembered, along with a hash of its
+    content. A refresh only reads files whose mtime or size changed, and
+    only re-parses and re-validates those whose content hash changed.
+
+    Usage
+    ---------
+    registry = SpecRegistry('specs/')
+    changes = registry.refresh()
+    for name in changes.added + changes.modified:
+        compare(registry.definitions[name], ...)
+
+    Attributes
+    ----------
+    definitions : dict
+        The TableDefinition for each table name
+    report : SpecLoadReport
+        The errors and duplicates found by the last refresh. A file that
+        fails to load keeps its last good definition.
+
+    """
+
+    def __init__(self, path: str, pattern: str = '*.json'):
+        self.path = path
+        self.pattern = pattern
+        self.files = dict()
+        self.definitions = dict()
+        self.report = SpecLoadReport()
+
+    def refresh(self) -> SpecChanges:
+        changes = SpecChanges()
+        self.report = SpecLoadReport()
+        spec_files = find_spec_files(self.path, self.pattern)
+
+        for spec_file in set(self.files.keys()) - set(spec_files):
+            name = self.files.pop(spec_file).get('name')
+            if name in self.definitions.keys():
+                del self.definitions[name]
+                changes.removed.append(name)
+
+        for spec_file in spec_files:
+            self.refresh_file(spec_file, changes)
+
+        # A table that moved between files is modified, not replaced
+        for name in set(changes.added) & set(changes.removed):
+            changes.added.remove(name)
+            changes.removed.remove(name)
+            changes.modified.append(name)
+
+        changes.added.sort()
+        changes.modified.sort()
+        changes.removed.sort()
+
+        return changes
+
+    def refresh_file(self, spec_file: str, changes: SpecChanges):
+        stat = os.stat(spec_file)
+        known = self.files.get(spec_file, dict())
+
+        if (known.get('mtime') == stat.st_mtime_ns
+                and known.get('size') == stat.st_size):
+            return
+
+        with open(spec_file, 'rb') as handle:
+            content = handle.read()
+        digest = hashlib.sha256(content).hexdigest()
+
+        if known.get('hash') == digest:
+            known.update(mtime=stat.st_mtime_ns, size=stat.st_size)
+            return
+
+        try:
+            definition = JsonSpec(filepath=spec_file,
+                                  text=content.decode()).TableDefinition
+        except Exception as error:
+            self.report.errors[spec_file] = "{}: {}".format(
+                type(error).__name__, error)
+            return
+
+        name = definition.name
+        owner = [path for path, file in self.files.items()
+                 if file.get('name') == name and path != spec_file]
+        if owner:
+            self.report.duplicates[name] = owner + [spec_file]
+            return
+
+        previous = known.get('name')
+        if previous is not None and previous != name:
+            self.definitions.pop(previous, None)
+            changes.removed.append(previous)
+
+        if name in self.definitions.keys():
+            changes.modified.append(name)
+        else:
+            changes.added.append(name)
+
+        self.definitions[name] = definition
+        self.files[spec_file] = dict(mtime=stat.st_mtime_ns,
+                                     size=stat.st_size,
+                                     hash=digest,
+                                     name=name)
@@ -0,0 +1,913 @@
+"""Plan the SQL that migrates live tables to their specs
+
+Every column change for a table, whether an add, drop, type, default or
+nullability change, is merged into a single ALTER TABLE with multiple
+actions, so the table is locked once and rewritten at most once. Columns
+are changed in place with ALTER COLUMN rather than being dropped and added
+again.
+
+Usage
+---------
+comparison = CompareSchema(spec, db_conn, 'public')
+plan = plan_migration(comparison.results)
+print(plan.to_sql())
+plan.run(db_conn)
+
+# Build indexes without blocking writes
+plan = plan_migration(comparison.results, concurrently=True)
+
+Partitioned tables have the partitions their spec's template calls for
+created in bulk, in one statement, after the table itself. Partitions past
+their retention are detached, and dropped once detached if the spec asks.
+
+Storage parameters are changed in place with SET and RESET, which only
+updates the catalog; they apply to pages written from then on. Moving a
+table to another tablespace, or changing whether it is logged, rewrites
+it, and is merged into the table's ALTER TABLE like any other change.
+Indexes whose storage alone differs are altered rather than rebuilt, and
+with concurrently are moved with REINDEX CONCURRENTLY.
+
+Permission changes are planned last by permissions.reconcile_permissions,
+which batches the tables of a schema needing the same grant for the same
+role into one GRANT or REVOKE.
+
+"""
+from psycopg2.extensions import connection
+
+from compare import (PjsComparisonResult,
+                     canonical_column,
+                     canonical_parameters,
+                     normalise_tablespace)
+from describe import IndexDefinition
+from partition import DROP
+
+# How expensive a statement is, cheapest first
+METADATA_ONLY = 'metadata-only'
+SCAN_NEEDED = 'scan-needed'
+FULL_REWRITE = 'full-rewrite'
+COSTS = (METADATA_ONLY, SCAN_NEEDED, FULL_REWRITE)
+
+# The kinds of action a statement can carry
+CREATE_TABLE = 'create_table'
+DROP_TABLE = 'drop_table'
+ADD_COLUMN = 'add_column'
+DROP_COLUMN = 'drop_column'
+ALTER_TYPE = 'alter_type'
+SET_DEFAULT = 'set_default'
+DROP_DEFAULT = 'drop_default'
+SET_NOT_NULL = 'set_not_null'
+DROP_NOT_NULL = 'drop_not_null'
+ADD_IDENTITY = 'add_identity'
+DROP_IDENTITY = 'drop_identity'
+ADD_PRIMARY_KEY = 'add_primary_key'
+DROP_CONSTRAINT = 'drop_constraint'
+CREATE_INDEX = 'create_index'
+DROP_INDEX = 'drop_index'
+RENAME_INDEX = 'rename_index'
+ATTACH_PRIMARY_KEY = 'attach_primary_key'
+GRANT = 'grant'
+REVOKE = 'revoke'
+GRANT_DEFAULT = 'grant_default'
+REVOKE_DEFAULT = 'revoke_default'
+CREATE_PARTITION = 'create_partition'
+DETACH_PARTITION = 'detach_partition'
+DROP_PARTITION = 'drop_partition'
+SET_PARAMETERS = 'set_parameters'
+RESET_PARAMETERS = 'reset_parameters'
+SET_TABLESPACE = 'set_tablespace'
+SET_LOGGED = 'set_logged'
+SET_UNLOGGED = 'set_unlogged'
+
+# Indexes are built concurrently under a temporary name, then renamed
+TEMPORARY_INDEX_SUFFIX = '_pjs_new'
+MAX_IDENTIFIER_LENGTH = 63
+
+
+def quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def quote_table(namespace: str, name: str) -> str:
+    if namespace is None:
+        return quote_ident(name)
+
+    return quote_ident(namespace) + '.' + quote_ident(name)
+
+
+def temporary_index_name(name: str) -> str:
+    return (name[:MAX_IDENTIFIER_LENGTH - len(TEMPORARY_INDEX_SUFFIX)]
+            + TEMPORARY_INDEX_SUFFIX)
+
+
+def column_type(column) -> str:
+    if column.max_length and '(' not in column.type:
+        return '{}({})'.format(column.type, column.max_length)
+
+    return column.type
+
+
+class MigrationAction:
+    """One change made by a MigrationStatement
+
+    Attributes
+    ----------
+    kind : str
+        What the action does, e.g. ADD_COLUMN or ALTER_TYPE
+    name : str
+        The column, index, constraint, role or table the action applies to
+    spec, live : object
+        The spec and live definitions involved, where there are any
+
+    """
+
+    def __init__(self, kind: str, name: str = None, spec=None, live=None):
+        self.kind = kind
+        self.name = name
+        self.spec = spec
+        self.live = live
+
+
+class MigrationStatement:
+    """A single SQL statement of a MigrationPlan
+
+    Attributes
+    ----------
+    sql : str
+        The statement to execute
+    namespace, table : str
+        The table the statement applies to. table is None for statements
+        that apply to several tables, or to the schema
+    actions : list
+        The MigrationAction's the statement carries out
+    transactional : bool
+        If the statement may run inside a transaction block
+    cost : str
+        METADATA_ONLY, SCAN_NEEDED or FULL_REWRITE, once estimated with
+        cost.estimate_plan_cost
+    estimated_bytes : int
+        The bytes of the table the statement scans or rewrites
+    depends_on : list
+        The MigrationStatement's that must run before this one, which may
+        belong to other tables
+
+    """
+
+    def __init__(self,
+                 sql: str,
+                 namespace: str,
+                 table: str,
+                 actions: list = None,
+                 transactional: bool = True):
+        self.sql = sql
+        self.namespace = namespace
+        self.table = table
+        self.actions = actions or list()
+        self.transactional = transactional
+        self.cost = None
+        self.estimated_bytes = None
+        self.depends_on = list()
+
+    def __str__(self) -> str:
+        return self.sql
+
+
+class MigrationPlan:
+    """An ordered list of MigrationStatement's
+
+    Statements for a table are ordered so that indexes are dropped before
+    the columns they use, and created after the columns they need.
+    """
+
+    def __init__(self, statements: list = None):
+        self.statements = statements or list()
+
+    def __iter__(self):
+        return iter(self.statements)
+
+    def __len__(self) -> int:
+        return len(self.statements)
+
+    def to_sql(self) -> str:
+        return ''.join(statement.sql + ';\n'
+                       for statement in self.statements)
+
+    @property
+    def rewrite_bytes(self) -> int:
+        """
+        The estimated bytes rewritten by the plan's full rewrite statements.
+        """
+
+        return sum(statement.estimated_bytes or 0
+                   for statement in self.statements
+                   if statement.cost == FULL_REWRITE)
+
+    def check_budget(self, max_rewrite_bytes: int):
+        """
+        Raise a NameError if the plan would rewrite more than
+        max_rewrite_bytes. Costs must be estimated first, with
+        cost.estimate_plan_cost.
+        """
+
+        if any(statement.cost is None for statement in self.statements):
+            raise NameError("Estimate the plan cost before checking it "
+                            "against a budget")
+
+        if self.rewrite_bytes <= max_rewrite_bytes:
+            return
+
+        rewrites = ['{}.{} ({} bytes)'.format(statement.namespace,
+                                              statement.table,
+                                              statement.estimated_bytes)
+                    for statement in self.statements
+                    if statement.cost == FULL_REWRITE]
+
+        raise NameError("The migration would rewrite {} bytes, over the "
+                        "budget of {}: {}".format(self.rewrite_bytes,
+                                                  max_rewrite_bytes,
+                                                  ', '.join(rewrites)))
+
+    def run(self, db_conn: connection):
+        """
+        Run the plan on a connection, in the order its dependencies allow.
+        Each run of consecutive transactional statements commits as one
+        transaction; others run alone outside a transaction block.
+        """
+
+        from executor import group_statements, order_statements
+
+        for group in group_statements(order_statements(self.statements)):
+            if group[0].transactional:
+                cursor = db_conn.cursor()
+                try:
+                    for statement in group:
+                        cursor.execute(statement.sql)
+                    db_conn.commit()
+                except Exception:
+                    db_conn.rollback()
+                    raise
+                finally:
+                    cursor.close()
+                continue
+
+            # Ends the transaction left open by describing the tables, as
+            # autocommit can't be switched on inside one
+            if not db_conn.autocommit:
+                db_conn.commit()
+
+            autocommit = db_conn.autocommit
+            db_conn.autocommit = True
+            try:
+                cursor = db_conn.cursor()
+                cursor.execute(group[0].sql)
+                cursor.close()
+            finally:
+                db_conn.autocommit = autocommit
+
+
+def chain(statements: list) -> list:
+    """
+    Make each statement depend on the one before it.
+    """
+
+    for previous, statement in zip(statements, statements[1:]):
+        statement.depends_on.append(previous)
+
+    return statements
+
+
+def column_sql(column, primary_fields: list = ()) -> str:
+    sql = '{} {}'.format(quote_ident(column.name), column_type(column))
+
+    canonical = canonical_column(column, list(primary_fields))
+    if not canonical['nullable'] and column.name not in primary_fields:
+        sql += ' NOT NULL'
+    if column.default_value is not None:
+        sql += ' DEFAULT {}'.format(column.default_value)
+    if column.identity:
+        sql += ' GENERATED BY DEFAULT AS IDENTITY'
+
+    return sql
+
+
+def field_sql(field: str) -> str:
+    """
+    A field is a column name, or an expression in parentheses that is
+    written as it is.
+    """
+
+    return field if field.startswith('(') else quote_ident(field)
+
+
+def index_field_sql(index, field: str) -> str:
+    sql = field_sql(field)
+    if field in index.opclasses.keys():
+        sql += ' ' + quote_ident(index.opclasses[field])
+
+    return sql
+
+
+def parameter_sql(value) -> str:
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return str(value)
+
+    return "'" + value.replace("'", "''") + "'"
+
+
+def parameters_sql(parameters: dict) -> str:
+    return ', '.join('{} = {}'.format(name, parameter_sql(value))
+                     for name, value in sorted(parameters.items()))
+
+
+def storage_sql(parameters: dict, tablespace: str) -> str:
+    """
+    The WITH and TABLESPACE clauses of a CREATE TABLE or CREATE INDEX.
+    """
+
+    sql = ''
+    if parameters:
+        sql += ' WITH ({})'.format(parameters_sql(parameters))
+    if normalise_tablespace(tablespace):
+        sql += ' TABLESPACE {}'.format(quote_ident(tablespace))
+
+    return sql
+
+
+def index_sql(index,
+              namespace: str,
+              table: str,
+              name: str = None,
+              concurrently: bool = False) -> str:
+    sql = 'CREATE {}INDEX {}{} ON {} USING {} ({})'.format(
+        'UNIQUE ' if index.unique else '',
+        'CONCURRENTLY ' if concurrently else '',
+        quote_ident(name or index.name),
+        quote_table(namespace, table),
+        index.type or 'btree',
+        ', '.join(index_field_sql(index, field) for field in index.fields))
+
+    if index.include:
+        sql += ' INCLUDE ({})'.format(
+            ', '.join(quote_ident(field) for field in index.include))
+    sql += storage_sql(index.parameters, index.tablespace)
+    if index.predicate:
+        sql += ' WHERE {}'.format(index.predicate)
+
+    return sql
+
+
+def primary_key_name(definition) -> str:
+    return (definition.primary_key_definition.constraint_name
+            or definition.name + '_pkey')
+
+
+def plan_create_table(result: PjsComparisonResult) -> list:
+    spec = result.spec
+    namespace = result.namespace
+    primary_fields = spec.primary_key_definition.fields
+
+    lines = [column_sql(column, primary_fields)
+             for column in spec.column_definitions]
+    if primary_fields:
+        lines.append('CONSTRAINT {} PRIMARY KEY ({})'.format(
+            quote_ident(primary_key_name(spec)),
+            ', '.join(quote_ident(field) for field in primary_fields)))
+
+    partition_by = ''
+    if spec.partition_definition is not None:
+        partition_by = ' PARTITION BY {} ({})'.format(
+            spec.partition_definition.strategy.upper(),
+            ', '.join(field_sql(field)
+                      for field in spec.partition_definition.fields))
+
+    storage = spec.storage_definition
+
+    statements = [MigrationStatement(
+        'CREATE {}TABLE {} (\n    {}\n){}{}'.format(
+            'UNLOGGED ' if storage.unlogged else '',
+            quote_table(namespace, spec.name),
+            ',\n    '.join(lines),
+            partition_by,
+            storage_sql(storage.parameters, storage.tablespace)),
+        namespace,
+        spec.name,
+        [MigrationAction(CREATE_TABLE, spec.name, spec=spec)])]
+
+    if result.new_partitions:
+        statements.append(plan_create_partitions(result))
+
+    for index in spec.index_definitions:
+        statements.append(plan_create_index(index, namespace, spec.name))
+
+    for statement in statements[1:]:
+        statement.depends_on.append(statements[0])
+
+    return statements
+
+
+def plan_column_changes(spec_column,
+                        live_column,
+                        primary_fields: list,
+                        live_primary_fields: list = None) -> list:
+    """
+    Return (SQL, MigrationAction) pairs that alter a column in place.
+    """
+
+    if live_primary_fields is None:
+        live_primary_fields = primary_fields
+
+    name = quote_ident(spec_column.name)
+    spec = canonical_column(spec_column, primary_fields)
+    live = canonical_column(live_column, live_primary_fields)
+    changes = list()
+
+    type_changed = spec['type'] != live['type']
+    default_changed = spec['default_value'] != live['default_value']
+
+    # A default that can't be cast to the new type would fail the change
+    if live['default_value'] is not None and (type_changed
+                                              or default_changed):
+        changes.append(('ALTER COLUMN {} DROP DEFAULT'.format(name),
+                        MigrationAction(DROP_DEFAULT, spec_column.name,
+                                        spec_column, live_column)))
+
+    if type_changed:
+        changes.append(('ALTER COLUMN {0} TYPE {1} USING {0}::{1}'.format(
+                            name, column_type(spec_column)),
+                        MigrationAction(ALTER_TYPE, spec_column.name,
+                                        spec_column, live_column)))
+
+    if spec['default_value'] is not None and (type_changed
+                                              or default_changed):
+        changes.append(('ALTER COLUMN {} SET DEFAULT {}'.format(
+                            name, spec_column.default_value),
+                        MigrationAction(SET_DEFAULT, spec_column.name,
+                                        spec_column, live_column)))
+
+    if spec['nullable'] != live['nullable']:
+        kind = DROP_NOT_NULL if spec['nullable'] else SET_NOT_NULL
+        changes.append(('ALTER COLUMN {} {}'.format(
+                            name, kind.upper().replace('_', ' ')),
+                        MigrationAction(kind, spec_column.name,
+                                        spec_column, live_column)))
+
+    if spec['identity'] != live['identity']:
+        if spec['identity']:
+            sql = 'ALTER COLUMN {} ADD GENERATED BY DEFAULT AS IDENTITY'
+            kind = ADD_IDENTITY
+        else:
+            sql = 'ALTER COLUMN {} DROP IDENTITY IF EXISTS'
+            kind = DROP_IDENTITY
+        changes.append((sql.format(name),
+                        MigrationAction(kind, spec_column.name,
+                                        spec_column, live_column)))
+
+    return changes
+
+
+def plan_storage_changes(spec, live, name: str) -> list:
+    """
+    Return (SQL, MigrationAction) pairs that change the storage parameters
+    and tablespace of a table or index, from its spec and live
+    StorageDefinition's or IndexDefinition's.
+    """
+
+    spec_parameters = canonical_parameters(spec.parameters)
+    live_parameters = canonical_parameters(live.parameters)
+    changes = list()
+
+    reset = sorted(parameter for parameter in live_parameters.keys()
+                   if parameter not in spec_parameters.keys())
+    if reset:
+        changes.append(('RESET ({})'.format(', '.join(reset)),
+                        MigrationAction(RESET_PARAMETERS, name, spec, live)))
+
+    changed = {parameter: spec.parameters[parameter]
+               for parameter, value in spec_parameters.items()
+               if live_parameters.get(parameter) != value}
+    if changed:
+        changes.append(('SET ({})'.format(parameters_sql(changed)),
+                        MigrationAction(SET_PARAMETERS, name, spec, live)))
+
+    if (normalise_tablespace(spec.tablespace)
+            != normalise_tablespace(live.tablespace)):
+        changes.append(('SET TABLESPACE {}'.format(
+                            quote_ident(spec.tablespace or 'pg_default')),
+                        MigrationAction(SET_TABLESPACE, name, spec, live)))
+
+    return changes
+
+
+def plan_alter_table(result: PjsComparisonResult,
+                     attach_primary_key: bool = False) -> MigrationStatement:
+    """
+    Merge every column and primary key change for a table into a single
+    ALTER TABLE, or return None when there are none. With
+    attach_primary_key, a replacement primary key is left to
+    plan_attach_primary_key.
+    """
+
+    spec = result.spec
+    live = result.live
+    primary_fields = sorted(spec.primary_key_definition.fields)
+    live_primary_fields = sorted(live.primary_key_definition.fields)
+    primary_key_changed = result.primary_key_changed and not (
+        attach_primary_key and primary_fields)
+    changes = list()
+
+    if primary_key_changed and live.primary_key_definition.fields:
+        changes.append(('DROP CONSTRAINT {}'.format(
+                            quote_ident(primary_key_name(live))),
+                        MigrationAction(DROP_CONSTRAINT,
+                                        primary_key_name(live))))
+
+    for column in result.removed_fields:
+        changes.append(('DROP COLUMN {}'.format(quote_ident(column.name)),
+                        MigrationAction(DROP_COLUMN, column.name,
+                                        live=column)))
+
+    for column in result.new_fields:
+        changes.append(('ADD COLUMN {}'.format(
+                            column_sql(column, primary_fields)),
+                        MigrationAction(ADD_COLUMN, column.name,
+                                        spec=column)))
+
+    for spec_column, live_column in result.changed_fields:
+        for sql, action in plan_column_changes(spec_column,
+                                               live_column,
+                                               primary_fields,
+                                               live_primary_fields):
+            # Can't run until the live primary key has been dropped
+            if (result.primary_key_changed and not primary_key_changed
+                    and action.kind == DROP_NOT_NULL
+                    and action.name in live_primary_fields):
+                continue
+            changes.append((sql, action))
+
+    if primary_key_changed and primary_fields:
+        changes.append(('ADD CONSTRAINT {} PRIMARY KEY ({})'.format(
+                            quote_ident(primary_key_name(spec)),
+                            ', '.join(quote_ident(field) for field
+                                      in spec.primary_key_definition.fields)),
+                        MigrationAction(ADD_PRIMARY_KEY,
+                                        primary_key_name(spec),
+                                        spec=spec.primary_key_definition)))
+
+    if result.storage_changed:
+        spec_storage = spec.storage_definition
+        live_storage = live.storage_definition
+        changes += plan_storage_changes(spec_storage, live_storage, spec.name)
+
+        if bool(spec_storage.unlogged) != bool(live_storage.unlogged):
+            kind = SET_UNLOGGED if spec_storage.unlogged else SET_LOGGED
+            changes.append((kind.upper().replace('_', ' '),
+                            MigrationAction(kind, spec.name, spec_storage,
+                                            live_storage)))
+
+    if not changes:
+        return None
+
+    return MigrationStatement(
+        'ALTER TABLE {}\n    {}'.format(
+            quote_table(result.namespace, spec.name),
+            ',\n    '.join(sql for sql, _ in changes)),
+        result.namespace,
+        spec.name,
+        [action for _, action in changes])
+
+
+def plan_create_index(index, namespace: str, table: str) -> MigrationStatement:
+    return MigrationStatement(index_sql(index, namespace, table),
+                              namespace,
+                              table,
+                              [MigrationAction(CREATE_INDEX, index.name,
+                                               spec=index)])
+
+
+def plan_drop_index(index,
+                    namespace: str,
+                    table: str,
+                    concurrently: bool = False,
+                    name: str = None) -> MigrationStatement:
+    name = name or index.name
+
+    return MigrationStatement('DROP INDEX {}IF EXISTS {}'.format(
+                                  'CONCURRENTLY ' if concurrently else '',
+                                  quote_table(namespace, name)),
+                              namespace,
+                              table,
+                              [MigrationAction(DROP_INDEX, name, live=index)],
+                              transactional=not concurrently)
+
+
+def plan_online_index(index, namespace: str, table: str) -> list:
+    """
+    Build an index with CREATE INDEX CONCURRENTLY under a temporary name,
+    then swap it in for any index of the same name. None of the statements
+    can run in a transaction block.
+
+    A build that is interrupted leaves an invalid index under the temporary
+    name, which is dropped before building it again.
+    """
+
+    temporary_name = temporary_index_name(index.name)
+
+    return [
+        plan_drop_index(None, namespace, table, True, temporary_name),
+        MigrationStatement(index_sql(index,
+                                     namespace,
+                                     table,
+                                     temporary_name,
+                                     concurrently=True),
+                           namespace,
+                           table,
+                           [MigrationAction(CREATE_INDEX, temporary_name,
+                                            spec=index)],
+                           transactional=False),
+        plan_drop_index(index, namespace, table, True),
+        MigrationStatement('ALTER INDEX {} RENAME TO {}'.format(
+                               quote_table(namespace, temporary_name),
+                               quote_ident(index.name)),
+                           namespace,
+                           table,
+                           [MigrationAction(RENAME_INDEX, index.name,
+                                            spec=index)],
+                           transactional=False)
+    ]
+
+
+def plan_index_storage(spec,
+                       live,
+                       namespace: str,
+                       table: str,
+                       concurrently: bool = False) -> list:
+    """
+    Change an index's storage parameters and tablespace in place, one
+    statement each, as ALTER INDEX takes a single action. With
+    concurrently, the index is moved to its tablespace with REINDEX
+    CONCURRENTLY instead of being locked while it is copied.
+    """
+
+    statements = list()
+
+    for sql, action in plan_storage_changes(spec, live, spec.name):
+        if concurrently and action.kind == SET_TABLESPACE:
+            statements.append(MigrationStatement(
+                'REINDEX (TABLESPACE {}) INDEX CONCURRENTLY {}'.format(
+                    quote_ident(spec.tablespace or 'pg_default'),
+                    quote_table(namespace, spec.name)),
+                namespace,
+                table,
+                [action],
+                transactional=False))
+            continue
+
+        statements.append(MigrationStatement(
+            'ALTER INDEX {} {}'.format(quote_table(namespace, spec.name), sql),
+            namespace,
+            table,
+            [action]))
+
+    return statements
+
+
+def plan_attach_primary_key(result: PjsComparisonResult) -> list:
+    """
+    Replace a primary key without holding a lock while its index builds.
+    A unique index is built concurrently, then attached as the primary key
+    with ADD CONSTRAINT ... USING INDEX, which renames it to the
+    constraint.
+    """
+
+    spec = result.spec
+    live = result.live
+    namespace = result.namespace
+    constraint_name = primary_key_name(spec)
+    temporary_name = temporary_index_name(constraint_name)
+    index = IndexDefinition(name=temporary_name,
+                            fields=spec.primary_key_definition.fields,
+                            unique=True,
+                            type='btree')
+
+    changes = list()
+    if live.primary_key_definition.fields:
+        changes.append(('DROP CONSTRAINT {}'.format(
+                            quote_ident(primary_key_name(live))),
+                        MigrationAction(DROP_CONSTRAINT,
+                                        primary_key_name(live))))
+
+    # Columns leaving the primary key, left out of plan_alter_table
+    for spec_column, live_column in result.changed_fields:
+        changes += [(sql, action) for sql, action in plan_column_changes(
+                        spec_column,
+                        live_column,
+                        spec.primary_key_definition.fields,
+                        live.primary_key_definition.fields)
+                    if action.kind == DROP_NOT_NULL
+                    and action.name in live.primary_key_definition.fields]
+    changes.append(('ADD CONSTRAINT {} PRIMARY KEY USING INDEX {}'.format(
+                        quote_ident(constraint_name),
+                        quote_ident(temporary_name)),
+                    MigrationAction(ATTACH_PRIMARY_KEY,
+                                    constraint_name,
+                                    spec=spec.primary_key_definition)))
+
+    return [
+        plan_drop_index(None, namespace, spec.name, True, temporary_name),
+        MigrationStatement(index_sql(index,
+                                     namespace,
+                                     spec.name,
+                                     concurrently=True),
+                           namespace,
+                           spec.name,
+                           [MigrationAction(CREATE_INDEX, temporary_name,
+                                            spec=index)],
+                           transactional=False),
+        MigrationStatement('ALTER TABLE {}\n    {}'.format(
+                               quote_table(namespace, spec.name),
+                               ',\n    '.join(sql for sql, _ in changes)),
+                           namespace,
+                           spec.name,
+                           [action for _, action in changes],
+                           transactional=False)
+    ]
+
+
+def plan_create_partitions(result: PjsComparisonResult) -> MigrationStatement:
+    """
+    Create every missing partition in a single statement.
+    """
+
+    namespace = result.namespace
+    table = result.name
+
+    return MigrationStatement(
+        ';\n'.join('CREATE TABLE {} PARTITION OF {} {}'.format(
+                       quote_table(namespace, name),
+                       quote_table(namespace, table),
+                       bound)
+                   for name, bound in sorted(result.new_partitions.items())),
+        namespace,
+        table,
+        [MigrationAction(CREATE_PARTITION, name, spec=bound)
+         for name, bound in sorted(result.new_partitions.items())])
+
+
+def plan_expire_partitions(result: PjsComparisonResult,
+                           concurrently: bool = False) -> list:
+    """
+    Detach each expired partition, then drop it when the spec's expiry is
+    drop. With concurrently, partitions are detached without blocking
+    queries on the table, outside of a transaction block.
+    """
+
+    namespace = result.namespace
+    table = result.name
+    statements = list()
+
+    for name in result.expired_partitions:
+        detach = MigrationStatement(
+            'ALTER TABLE {} DETACH PARTITION {}{}'.format(
+                quote_table(namespace, table),
+                quote_table(namespace, name),
+                ' CONCURRENTLY' if concurrently else ''),
+            namespace,
+            table,
+            [MigrationAction(DETACH_PARTITION, name)],
+            transactional=not concurrently)
+        statements.append(detach)
+
+        if result.spec.partition_definition.expire == DROP:
+            drop = MigrationStatement(
+                'DROP TABLE {}'.format(quote_table(namespace, name)),
+                namespace,
+                table,
+                [MigrationAction(DROP_PARTITION, name)])
+            drop.depends_on.append(detach)
+            statements.append(drop)
+
+    return statements
+
+
+def plan_table(result: PjsComparisonResult,
+               drop_tables: bool = False,
+               concurrently: bool = False,
+               permissions: bool = True) -> list:
+    """
+    Plan the statements that migrate one table to its spec. With
+    concurrently, index changes and a replacement primary key are built
+    without blocking writes, outside of a transaction block. Without
+    permissions, grants are left to permissions.reconcile_permissions.
+    """
+
+    from permissions import reconcile_permissions
+
+    if result.new_table:
+        statements = plan_create_table(result)
+        if not permissions:
+            return statements
+        key = (result.namespace, result.name)
+        return statements + reconcile_permissions([result],
+                                                  {key: statements[:1]})
+
+    if result.removed_table:
+        if not drop_tables:
+            return list()
+        return [MigrationStatement(
+            'DROP TABLE {}'.format(quote_table(result.namespace,
+                                               result.name)),
+            result.namespace,
+            result.name,
+            [MigrationAction(DROP_TABLE, result.name, live=result.live)])]
+
+    namespace = result.namespace
+    table = result.name
+
+    if result.partition_changed:
+        raise NameError("{}.{} can't be partitioned differently in "
+                        "place".format(namespace, table))
+
+    # Indexes are dropped before the columns they use
+    drops = list()
+    for index in result.missing_indexes:
+        drops.append(plan_drop_index(index, namespace, table, concurrently))
+    if not concurrently:
+        for _, index in result.changed_indexes:
+            drops.append(plan_drop_index(index, namespace, table))
+
+    alter = plan_alter_table(result, attach_primary_key=concurrently)
+    if alter is not None:
+        alter.depends_on += drops
+
+    # Indexes are built after the columns they need, each as a chain
+    builds = list()
+    for index in result.new_indexes + [spec for spec, _
+                                       in result.changed_indexes]:
+        if concurrently:
+            builds.append(chain(plan_online_index(index, namespace, table)))
+        else:
+            builds.append([plan_create_index(index, namespace, table)])
+
+    if (concurrently and result.primary_key_changed
+            and result.spec.primary_key_definition.fields):
+        builds.append(chain(plan_attach_primary_key(result)))
+
+    for build in builds:
+        build[0].depends_on += drops + ([alter] if alter else [])
+
+    statements = drops + ([alter] if alter else [])
+    for build in builds:
+        statements += build
+
+    for spec_index, live_index in result.changed_index_storage:
+        statements += plan_index_storage(spec_index, live_index, namespace,
+                                         table, concurrently)
+
+    # New partitions are created before expired ones are removed
+    creates = list()
+    if result.new_partitions:
+        creates.append(plan_create_partitions(result))
+    expires = plan_expire_partitions(result, concurrently)
+    for statement in expires:
+        if statement.actions[0].kind == DETACH_PARTITION:
+            statement.depends_on += creates
+
+    partitions = creates + expires
+    if alter is not None:
+        for statement in partitions:
+            statement.depends_on.append(alter)
+
+    statements += partitions
+    if permissions:
+        statements += reconcile_permissions([result])
+
+    return statements
+
+
+def plan_migration(results: list,
+                   drop_tables: bool = False,
+                   concurrently: bool = False) -> MigrationPlan:
+    """
+    Plan the statements that migrate every compared table to its spec.
+    Tables that only exist in the database are only dropped when
+    drop_tables is set. With concurrently, indexes are built online, as
+    for plan_table. Permission changes come last, batched across the
+    tables of each schema.
+    """
+
+    from permissions import reconcile_permissions
+
+    plan = MigrationPlan()
+    created = dict()
+
+    for result in results:
+        statements = plan_table(result, drop_tables, concurrently,
+                                permissions=False)
+        if result.new_table:
+            created[(result.namespace, result.name)] = statements[:1]
+        plan.statements += statements
+
+    plan.statements += reconcile_permissions(results, created)
+
+    return plan
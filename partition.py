@@ -0,0 +1,160 @@
+"""Name and bound the partitions of a partitioned table from its spec
+
+A range partitioned spec with an interval has a partition per day, ISO
+week, month or year, named after the table and the start of its range,
+e.g. events_p20240131. A hash partitioned spec with a modulus has a
+partition per remainder, e.g. events_p3. Partitions are only managed when
+their name follows this template; any others are left alone.
+
+Usage
+---------
+wanted = template_partitions(spec.partition_definition, 'events')
+expired = expired_partitions(spec.partition_definition, 'events',
+                             live.partition_definition.partitions)
+
+"""
+from datetime import date, datetime, timedelta
+
+RANGE = 'range'
+LIST = 'list'
+HASH = 'hash'
+
+DAY = 'day'
+WEEK = 'week'
+MONTH = 'month'
+YEAR = 'year'
+
+# The date format each interval's partitions are named with
+INTERVALS = {
+    DAY: '%Y%m%d',
+    WEEK: '%Y%m%d',
+    MONTH: '%Y%m',
+    YEAR: '%Y',
+}
+
+DETACH = 'detach'
+DROP = 'drop'
+
+DEFAULT_PREMAKE = 4
+
+
+def period_start(day: date, interval: str) -> date:
+    """
+    The start of the interval a day falls in.
+    """
+
+    if interval == DAY:
+        return day
+    if interval == WEEK:
+        return day - timedelta(days=day.weekday())
+    if interval == MONTH:
+        return day.replace(day=1)
+    if interval == YEAR:
+        return day.replace(month=1, day=1)
+
+    raise NameError("Unknown partition interval: {}. Expected one of "
+                    "{}".format(interval, ', '.join(INTERVALS.keys())))
+
+
+def add_periods(start: date, interval: str, count: int) -> date:
+    if interval == DAY:
+        return start + timedelta(days=count)
+    if interval == WEEK:
+        return start + timedelta(weeks=count)
+
+    months = start.year * 12 + start.month - 1
+    months += count * (12 if interval == YEAR else 1)
+
+    return start.replace(year=months // 12, month=months % 12 + 1)
+
+
+def partition_name(table: str, interval: str, start: date) -> str:
+    return '{}_p{}'.format(table, start.strftime(INTERVALS[interval]))
+
+
+def partition_start(table: str, interval: str, name: str) -> date:
+    """
+    The start of a range partition's interval, read back from its name, or
+    None when the name doesn't follow the template.
+    """
+
+    prefix = '{}_p'.format(table)
+    if not name.startswith(prefix):
+        return None
+
+    try:
+        start = datetime.strptime(name[len(prefix):],
+                                  INTERVALS[interval]).date()
+    except ValueError:
+        return None
+
+    if period_start(start, interval) != start:
+        return None
+
+    return start
+
+
+def range_bound(interval: str, start: date) -> str:
+    return "FOR VALUES FROM ('{}') TO ('{}')".format(
+        start.isoformat(), add_periods(start, interval, 1).isoformat())
+
+
+def hash_bound(modulus: int, remainder: int) -> str:
+    return 'FOR VALUES WITH (MODULUS {}, REMAINDER {})'.format(modulus,
+                                                               remainder)
+
+
+def template_partitions(partition, table: str, today: date = None) -> dict:
+    """
+    The partitions a spec's template calls for, as a dict of name to
+    bound. For a range, the current partition and `premake` upcoming
+    ones. For a hash, one per remainder of the modulus. List partitioned
+    tables have no template.
+    """
+
+    if partition.strategy == RANGE and partition.interval:
+        start = period_start(today or date.today(), partition.interval)
+        premake = partition.premake
+        if premake is None:
+            premake = DEFAULT_PREMAKE
+
+        partitions = dict()
+        for count in range(premake + 1):
+            period = add_periods(start, partition.interval, count)
+            partitions[partition_name(table, partition.interval, period)] \
+                = range_bound(partition.interval, period)
+
+        return partitions
+
+    if partition.strategy == HASH and partition.modulus:
+        return {'{}_p{}'.format(table, remainder):
+                hash_bound(partition.modulus, remainder)
+                for remainder in range(partition.modulus)}
+
+    return dict()
+
+
+def expired_partitions(partition,
+                       table: str,
+                       names,
+                       today: date = None) -> list:
+    """
+    The names of range partitions older than a spec's retention, oldest
+    first.
+    """
+
+    if (partition.strategy != RANGE or not partition.interval
+            or not partition.retention):
+        return list()
+
+    cutoff = add_periods(period_start(today or date.today(),
+                                      partition.interval),
+                         partition.interval,
+                         -partition.retention)
+
+    starts = [(partition_start(table, partition.interval, name), name)
+              for name in names]
+
+    return [name for start, name in sorted(
+        (start, name) for start, name in starts
+        if start is not None and start < cutoff)]
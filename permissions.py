@@ -0,0 +1,268 @@
+"""Reconcile table permissions, batched across tables
+
+Each table's grants are diffed against its spec down to the privileges
+each role is missing or has too many of. Tables in a schema that need the
+same change for the same role are then batched into one statement, e.g.
+GRANT SELECT ON "public"."t1", "public"."t2" TO "reader", so rolling a
+role out to thousands of tables takes a handful of statements rather than
+one per table.
+
+Default privileges, set with ALTER DEFAULT PRIVILEGES, grant privileges on
+the tables a role creates in a schema from then on, so tables created
+later don't need grants of their own. They are reconciled the same way,
+with roles that need the same change sharing a statement.
+
+Usage
+---------
+statements = reconcile_permissions(comparison.results)
+
+live = get_default_privileges(db_conn, 'public')
+statements = plan_default_privileges(
+    'public', [PermissionDefinition('reader', ['SELECT'])], live)
+
+"""
+from psycopg2.extensions import connection
+from psycopg2.extras import RealDictCursor
+
+from compare import PjsComparisonResult, expand_grants
+from describe import PermissionDefinition, TableDefinition
+from migrate import (GRANT,
+                     GRANT_DEFAULT,
+                     REVOKE,
+                     REVOKE_DEFAULT,
+                     MigrationAction,
+                     MigrationStatement,
+                     quote_ident,
+                     quote_table)
+
+# The most tables a single GRANT or REVOKE names
+DEFAULT_BATCH_SIZE = 500
+
+# The schema wide default privileges a role gives the tables it creates
+DEFAULT_PRIVILEGES_QUERY = """SELECT
+        r.rolname::TEXT AS grantee,
+        acl.privilege_type
+    FROM pg_default_acl d
+    JOIN pg_namespace n ON n.oid = d.defaclnamespace
+    CROSS JOIN LATERAL aclexplode(d.defaclacl) acl
+    JOIN pg_roles r ON r.oid = acl.grantee
+    WHERE d.defaclobjtype = 'r'
+        AND n.nspname = %(namespace)s
+        AND d.defaclrole = (SELECT oid FROM pg_roles
+                            WHERE rolname = COALESCE(%(owner)s,
+                                                     current_user))
+    ORDER BY
+        r.rolname::TEXT,
+        acl.privilege_type"""
+
+
+def diff_grants(spec_grants: list, live_grants: list) -> tuple:
+    """
+    Split the difference between two grant lists, either of which may use
+    ALL, into the privileges to revoke and those to grant.
+    """
+
+    wanted = expand_grants(spec_grants)
+    existing = expand_grants(live_grants)
+
+    return ([grant for grant in existing if grant not in wanted],
+            [grant for grant in wanted if grant not in existing])
+
+
+def diff_permissions(spec_permissions: list, live_permissions: list) -> list:
+    """
+    The minimal changes between two lists of PermissionDefinition's, as
+    (kind, role, grants) tuples with every revoke before any grant.
+    """
+
+    spec_by_role = {permission.name: permission.grants
+                    for permission in spec_permissions}
+    live_by_role = {permission.name: permission.grants
+                    for permission in live_permissions}
+
+    revokes = list()
+    grants = list()
+
+    for role in sorted(set(spec_by_role.keys()) | set(live_by_role.keys())):
+        revoke, grant = diff_grants(spec_by_role.get(role, list()),
+                                    live_by_role.get(role, list()))
+        if revoke:
+            revokes.append((REVOKE, role, revoke))
+        if grant:
+            grants.append((GRANT, role, grant))
+
+    return revokes + grants
+
+
+def table_permission_changes(result: PjsComparisonResult) -> list:
+    """
+    The minimal permission changes for one compared table, as for
+    diff_permissions. Removed tables have none.
+    """
+
+    if result.removed_table:
+        return list()
+
+    if result.new_table:
+        return diff_permissions(result.spec.permission_definitions, list())
+
+    return diff_permissions(
+        result.new_permissions
+        + [spec for spec, _ in result.changed_permissions],
+        result.missing_permissions
+        + [live for _, live in result.changed_permissions])
+
+
+def batch_statement(kind: str,
+                    namespace: str,
+                    tables: list,
+                    role: str,
+                    grants: list) -> MigrationStatement:
+    """
+    A GRANT or REVOKE of the same privileges on several tables, with an
+    action per table named after it. A statement for several tables has no
+    table of its own, so its table is None.
+    """
+
+    sql = '{} {} ON {} {} {}'.format(
+        kind.upper(),
+        ', '.join(grants),
+        ', '.join(quote_table(namespace, table) for table in tables),
+        'TO' if kind == GRANT else 'FROM',
+        quote_ident(role))
+
+    permission = PermissionDefinition(role, grants)
+    actions = [MigrationAction(kind, table,
+                               spec=permission if kind == GRANT else None,
+                               live=permission if kind == REVOKE else None)
+               for table in tables]
+
+    return MigrationStatement(sql,
+                              namespace,
+                              tables[0] if len(tables) == 1 else None,
+                              actions)
+
+
+def reconcile_permissions(results: list,
+                          depends_on: dict = None,
+                          batch_size: int = DEFAULT_BATCH_SIZE) -> list:
+    """
+    Plan the permission changes for every compared table, batching tables
+    of a schema that need the same change for the same role into one
+    statement of at most batch_size tables. Every revoke comes before any
+    grant.
+
+    depends_on maps (schema, table) to the statements that must run before
+    the table's permissions change, such as its CREATE TABLE.
+    """
+
+    depends_on = depends_on or dict()
+    batches = dict()
+
+    for result in results:
+        for kind, role, grants in table_permission_changes(result):
+            key = (kind != REVOKE, result.namespace, role, tuple(grants))
+            batches.setdefault(key, list()).append(result.name)
+
+    statements = list()
+
+    for key in sorted(batches.keys()):
+        _, namespace, role, grants = key
+        kind = GRANT if key[0] else REVOKE
+        tables = batches[key]
+
+        for start in range(0, len(tables), batch_size):
+            batch = tables[start:start + batch_size]
+            statement = batch_statement(kind, namespace, batch, role,
+                                        list(grants))
+            for table in batch:
+                for dependency in depends_on.get((namespace, table), list()):
+                    if dependency not in statement.depends_on:
+                        statement.depends_on.append(dependency)
+            statements.append(statement)
+
+    return statements
+
+
+def get_default_privileges(db_conn: connection,
+                           namespace: str,
+                           owner: str = None) -> list:
+    """
+    Read the default privileges that tables created in a schema by owner,
+    the connected user by default, are given, as a list of
+    PermissionDefinition's.
+    """
+
+    cursor = db_conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute(DEFAULT_PRIVILEGES_QUERY,
+                   {"namespace": namespace, "owner": owner})
+    rows = cursor.fetchall()
+    cursor.close()
+
+    return TableDefinition().extract_permission_definitions(rows)
+
+
+def plan_default_privileges(namespace: str,
+                            spec: list,
+                            live: list,
+                            owner: str = None) -> list:
+    """
+    Plan the ALTER DEFAULT PRIVILEGES that bring a schema's defaults for
+    tables created by owner, the connected user by default, from live to
+    spec, both lists of PermissionDefinition's. Roles that need the same
+    change share a statement.
+    """
+
+    roles = dict()
+    for kind, role, grants in diff_permissions(spec, live):
+        roles.setdefault((kind != REVOKE, tuple(grants)), list()).append(role)
+
+    statements = list()
+
+    for key in sorted(roles.keys()):
+        kind = GRANT_DEFAULT if key[0] else REVOKE_DEFAULT
+        grants = list(key[1])
+        permissions = [PermissionDefinition(role, grants)
+                       for role in roles[key]]
+
+        statements.append(MigrationStatement(
+            'ALTER DEFAULT PRIVILEGES {}IN SCHEMA {} {} {} ON TABLES '
+            '{} {}'.format(
+                'FOR ROLE {} '.format(quote_ident(owner)) if owner else '',
+                quote_ident(namespace),
+                'GRANT' if key[0] else 'REVOKE',
+                ', '.join(grants),
+                'TO' if key[0] else 'FROM',
+                ', '.join(quote_ident(role) for role in roles[key])),
+            namespace,
+            None,
+            [MigrationAction(kind, permission.name,
+                             spec=permission if key[0] else None,
+                             live=None if key[0] else permission)
+             for permission in permissions]))
+
+    return statements
+
+
+def common_permissions(definitions: list) -> list:
+    """
+    The privileges every one of a list of TableDefinition's grants each
+    role, as PermissionDefinition's. A starting point for a schema's
+    default privileges.
+    """
+
+    if not definitions:
+        return list()
+
+    common = None
+    for definition in definitions:
+        grants = {permission.name: set(expand_grants(permission.grants))
+                  for permission in definition.permission_definitions}
+        if common is None:
+            common = grants
+            continue
+        common = {role: common[role] & grants[role]
+                  for role in common.keys() if role in grants.keys()}
+
+    return [PermissionDefinition(role, sorted(grants))
+            for role, grants in sorted(common.items()) if grants]
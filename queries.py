@@ -0,0 +1,475 @@
+"""Catalog queries used to describe tables
+
+Every query is set based. It takes a list of ``namespaces`` and an optional
+``table_name``, and returns rows carrying ``table_schema`` and
+``table_name`` so a single execution can describe one table or every table
+in a list of schemas. The remaining columns of each row are identical
+between backends, so the TableDefinition.extract_* methods don't need to
+know which backend produced them. Invalid indexes, left behind by an
+interrupted CREATE INDEX CONCURRENTLY, are not described.
+
+Indexes are read from pg_index by both backends, as information_schema
+has no view of them. Each index comes back already broken down into its
+access method, key fields, INCLUDE columns, predicate, any non default
+operator classes, storage parameters and tablespace. A key column is its
+name, and an expression is its definition from
+pg_get_indexdef(oid, column, true) in parentheses, so nothing needs
+parsing in Python.
+
+Storage parameters, tablespaces and persistence aren't in
+information_schema either, so both backends read them from pg_class with a
+shared storage query. Only tables that set any of them are returned.
+
+Child partitions are described as part of their parent, from a single
+partitions query, rather than as tables of their own. Describing a whole
+schema leaves them out of the other queries.
+
+information_schema
+    The SQL standard views. Portable, but slow on large catalogs because
+    of their privilege checks and unions.
+pg_catalog
+    The system catalogs queried directly. Returns the same rows as the
+    information_schema backend when connected as a superuser or as the
+    owner of the described tables.
+
+"""
+
+INFORMATION_SCHEMA = 'information_schema'
+PG_CATALOG = 'pg_catalog'
+
+
+INDEXES_QUERY = """SELECT
+                n.nspname::TEXT AS table_schema,
+                c.relname::TEXT AS table_name,
+                i.relname::TEXT AS indexname,
+                x.indisunique AS is_unique,
+                am.amname::TEXT AS method,
+                keys.fields,
+                ARRAY(
+                    SELECT
+                        a.attname::TEXT
+                    FROM
+                        generate_series(x.indnkeyatts + 1, x.indnatts) k(n)
+                    JOIN pg_attribute a
+                        ON a.attrelid = x.indrelid
+                        AND a.attnum = x.indkey[k.n - 1]
+                    ORDER BY
+                        k.n
+                ) AS include,
+                pg_get_expr(x.indpred, x.indrelid, true) AS predicate,
+                keys.opclasses,
+                i.reloptions::TEXT[] AS parameters,
+                ts.spcname::TEXT AS tablespace
+            FROM
+                pg_index x
+            JOIN pg_class c
+                ON c.oid = x.indrelid
+            JOIN pg_class i
+                ON i.oid = x.indexrelid
+            JOIN pg_namespace n
+                ON n.oid = c.relnamespace
+            JOIN pg_am am
+                ON am.oid = i.relam
+            LEFT JOIN pg_tablespace ts
+                ON ts.oid = i.reltablespace
+            CROSS JOIN LATERAL (
+                SELECT
+                    array_agg(k.field ORDER BY k.n) AS fields,
+                    json_object_agg(k.field, k.opclass)
+                        FILTER (WHERE NOT k.opcdefault) AS opclasses
+                FROM (
+                    SELECT
+                        k.n,
+                        CASE
+                            WHEN a.attname IS NOT NULL
+                                THEN a.attname::TEXT
+                            WHEN left(pg_get_indexdef(x.indexrelid, k.n, true),
+                                      1) = '('
+                                THEN pg_get_indexdef(x.indexrelid, k.n, true)
+                            ELSE '('
+                                ||pg_get_indexdef(x.indexrelid, k.n, true)
+                                ||')'
+                        END AS field,
+                        opc.opcname::TEXT AS opclass,
+                        opc.opcdefault
+                    FROM
+                        generate_series(1, x.indnkeyatts) k(n)
+                    JOIN pg_opclass opc
+                        ON opc.oid = x.indclass[k.n - 1]
+                    LEFT JOIN pg_attribute a
+                        ON a.attrelid = x.indrelid
+                        AND a.attnum = x.indkey[k.n - 1]
+                ) k
+            ) keys
+            WHERE
+                c.relkind IN ('r', 'm', 'p')
+                AND i.relkind IN ('i', 'I')
+                AND x.indisvalid
+                AND n.nspname = ANY(%(namespaces)s)
+                AND ((%(table_name)s::TEXT IS NULL AND NOT c.relispartition)
+                     OR c.relname = %(table_name)s)
+            ORDER BY
+                n.nspname::TEXT,
+                c.relname::TEXT,
+                i.oid"""
+
+
+# A partitioned table's key, and its child partitions with their bounds
+PARTITIONS_QUERY = """SELECT
+                n.nspname::TEXT AS table_schema,
+                c.relname::TEXT AS table_name,
+                CASE p.partstrat
+                    WHEN 'r' THEN 'range'
+                    WHEN 'l' THEN 'list'
+                    WHEN 'h' THEN 'hash'
+                END AS strategy,
+                ARRAY(
+                    SELECT
+                        CASE
+                            WHEN a.attname IS NOT NULL
+                                THEN a.attname::TEXT
+                            ELSE '('
+                                ||pg_get_expr(p.partexprs, p.partrelid, true)
+                                ||')'
+                        END
+                    FROM
+                        generate_series(1, p.partnatts) k(n)
+                    LEFT JOIN pg_attribute a
+                        ON a.attrelid = p.partrelid
+                        AND a.attnum = p.partattrs[k.n - 1]
+                    ORDER BY
+                        k.n
+                ) AS partition_key,
+                ARRAY(
+                    SELECT
+                        child.relname::TEXT
+                    FROM
+                        pg_inherits i
+                    JOIN pg_class child
+                        ON child.oid = i.inhrelid
+                    WHERE
+                        i.inhparent = c.oid
+                    ORDER BY
+                        child.relname::TEXT
+                ) AS partitions,
+                ARRAY(
+                    SELECT
+                        pg_get_expr(child.relpartbound, child.oid)
+                    FROM
+                        pg_inherits i
+                    JOIN pg_class child
+                        ON child.oid = i.inhrelid
+                    WHERE
+                        i.inhparent = c.oid
+                    ORDER BY
+                        child.relname::TEXT
+                ) AS bounds
+            FROM
+                pg_partitioned_table p
+            JOIN pg_class c
+                ON c.oid = p.partrelid
+            JOIN pg_namespace n
+                ON n.oid = c.relnamespace
+            WHERE
+                n.nspname = ANY(%(namespaces)s)
+                AND ((%(table_name)s::TEXT IS NULL AND NOT c.relispartition)
+                     OR c.relname = %(table_name)s)
+            ORDER BY
+                n.nspname::TEXT,
+                c.relname::TEXT"""
+
+
+# The storage parameters, tablespace and persistence of tables that set
+# any of them. Parameters of the TOAST table are prefixed with toast.
+STORAGE_QUERY = """SELECT
+                n.nspname::TEXT AS table_schema,
+                c.relname::TEXT AS table_name,
+                ARRAY(
+                    SELECT
+                        option
+                    FROM
+                        unnest(c.reloptions) option
+                    UNION ALL
+                    SELECT
+                        'toast.'||option
+                    FROM
+                        unnest(t.reloptions) option
+                )::TEXT[] AS parameters,
+                ts.spcname::TEXT AS tablespace,
+                c.relpersistence = 'u' AS unlogged
+            FROM
+                pg_class c
+            JOIN pg_namespace n
+                ON n.oid = c.relnamespace
+            LEFT JOIN pg_class t
+                ON t.oid = c.reltoastrelid
+            LEFT JOIN pg_tablespace ts
+                ON ts.oid = c.reltablespace
+            WHERE
+                c.relkind IN ('r', 'm', 'p')
+                AND (c.reloptions IS NOT NULL
+                     OR t.reloptions IS NOT NULL
+                     OR c.reltablespace <> 0
+                     OR c.relpersistence = 'u')
+                AND n.nspname = ANY(%(namespaces)s)
+                AND ((%(table_name)s::TEXT IS NULL AND NOT c.relispartition)
+                     OR c.relname = %(table_name)s)
+            ORDER BY
+                n.nspname::TEXT,
+                c.relname::TEXT"""
+
+
+INFORMATION_SCHEMA_QUERIES = dict(
+    tables="""SELECT
+                table_schema,
+                table_name
+            FROM
+                information_schema.tables
+            WHERE
+                table_schema = ANY(%(namespaces)s)
+                AND ((%(table_name)s::TEXT IS NULL
+                      AND (table_schema::TEXT, table_name::TEXT)
+                          NOT IN (SELECT
+                                      pn.nspname::TEXT,
+                                      pc.relname::TEXT
+                                  FROM
+                                      pg_class pc
+                                  JOIN pg_namespace pn
+                                      ON pn.oid = pc.relnamespace
+                                  WHERE
+                                      pc.relispartition))
+                     OR table_name = %(table_name)s)
+            ORDER BY
+                table_schema,
+                table_name""",
+
+    columns="""SELECT
+                c.table_schema,
+                c.table_name,
+                c.column_name,
+                c.is_nullable::TEXT = 'YES' AS is_nullable,
+                CASE
+                    WHEN c.domain_name is not null
+                        THEN domain_name
+                    WHEN c.data_type='character varying'
+                        THEN 'varchar('||c.character_maximum_length||')'
+                    WHEN c.data_type='integer'
+                        THEN 'int'
+                    WHEN c.data_type='numeric'
+                        THEN 'numeric('||c.numeric_precision||','
+                                       ||c.numeric_scale||')'
+                    WHEN c.data_type='timestamp without time zone'
+                        THEN 'timestamp'
+                    ELSE c.data_type
+                end as data_type,
+                c.character_maximum_length,
+                c.is_identity::TEXT = 'YES' AS is_identity,
+                c.column_default,
+                keys.constraint_name,
+                cons.constraint_type::TEXT = 'PRIMARY KEY'::TEXT
+                    AS is_primary_key
+            FROM
+                information_schema.columns c
+            LEFT JOIN
+                information_schema.key_column_usage keys
+                ON
+                    c.column_name = keys.column_name
+                    AND c.table_name = keys.table_name
+                    AND c.table_schema  = keys.table_schema
+            LEFT JOIN information_schema.table_constraints cons
+                ON
+                    cons.constraint_name = keys.constraint_name
+                    AND cons.table_name  = c.table_name
+                    AND cons.table_schema = c.table_schema
+            WHERE
+                c.table_schema = ANY(%(namespaces)s)
+                AND ((%(table_name)s::TEXT IS NULL
+                      AND (c.table_schema::TEXT, c.table_name::TEXT)
+                          NOT IN (SELECT
+                                      pn.nspname::TEXT,
+                                      pc.relname::TEXT
+                                  FROM
+                                      pg_class pc
+                                  JOIN pg_namespace pn
+                                      ON pn.oid = pc.relnamespace
+                                  WHERE
+                                      pc.relispartition))
+                     OR c.table_name = %(table_name)s)
+            ORDER BY
+                c.table_schema,
+                c.table_name,
+                c.column_name""",
+
+    indexes=INDEXES_QUERY,
+
+    partitions=PARTITIONS_QUERY,
+
+    storage=STORAGE_QUERY,
+
+    permissions="""SELECT
+                table_schema,
+                table_name,
+                grantee,
+                privilege_type
+            FROM
+                information_schema.role_table_grants
+            WHERE
+                grantee NOT in('postgres', 'PUBLIC')
+                AND table_schema = ANY(%(namespaces)s)
+                AND ((%(table_name)s::TEXT IS NULL
+                      AND (table_schema::TEXT, table_name::TEXT)
+                          NOT IN (SELECT
+                                      pn.nspname::TEXT,
+                                      pc.relname::TEXT
+                                  FROM
+                                      pg_class pc
+                                  JOIN pg_namespace pn
+                                      ON pn.oid = pc.relnamespace
+                                  WHERE
+                                      pc.relispartition))
+                     OR table_name = %(table_name)s)
+            ORDER BY
+                table_schema,
+                table_name,
+                grantee,
+                privilege_type""",
+)
+
+
+PG_CATALOG_QUERIES = dict(
+    tables="""SELECT
+                n.nspname::TEXT AS table_schema,
+                c.relname::TEXT AS table_name
+            FROM
+                pg_class c
+            JOIN pg_namespace n
+                ON n.oid = c.relnamespace
+            WHERE
+                c.relkind IN ('r', 'v', 'f', 'p')
+                AND n.nspname = ANY(%(namespaces)s)
+                AND ((%(table_name)s::TEXT IS NULL AND NOT c.relispartition)
+                     OR c.relname = %(table_name)s)
+            ORDER BY
+                n.nspname::TEXT,
+                c.relname::TEXT""",
+
+    columns="""SELECT
+                n.nspname::TEXT AS table_schema,
+                c.relname::TEXT AS table_name,
+                a.attname::TEXT AS column_name,
+                NOT (a.attnotnull OR (t.typtype = 'd' AND t.typnotnull))
+                    AS is_nullable,
+                CASE
+                    WHEN t.typtype = 'd'
+                        THEN t.typname::TEXT
+                    WHEN t.typelem <> 0 AND t.typlen = -1
+                        THEN 'ARRAY'
+                    WHEN tn.nspname <> 'pg_catalog'
+                        THEN 'USER-DEFINED'
+                    WHEN a.atttypid = 'varchar'::regtype
+                        THEN 'varchar('
+                            ||information_schema._pg_char_max_length(
+                                a.atttypid, a.atttypmod)||')'
+                    WHEN a.atttypid = 'int4'::regtype
+                        THEN 'int'
+                    WHEN a.atttypid = 'numeric'::regtype
+                        THEN 'numeric('
+                            ||information_schema._pg_numeric_precision(
+                                a.atttypid, a.atttypmod)||','
+                            ||information_schema._pg_numeric_scale(
+                                a.atttypid, a.atttypmod)||')'
+                    WHEN a.atttypid = 'timestamp'::regtype
+                        THEN 'timestamp'
+                    ELSE format_type(a.atttypid, NULL)
+                end AS data_type,
+                information_schema._pg_char_max_length(
+                    information_schema._pg_truetypid(a.*, t.*),
+                    information_schema._pg_truetypmod(a.*, t.*))::INT
+                    AS character_maximum_length,
+                a.attidentity IN ('a', 'd') AS is_identity,
+                pg_get_expr(ad.adbin, ad.adrelid) AS column_default,
+                con.conname::TEXT AS constraint_name,
+                con.contype = 'p' AS is_primary_key
+            FROM
+                pg_attribute a
+            JOIN pg_class c
+                ON c.oid = a.attrelid
+            JOIN pg_namespace n
+                ON n.oid = c.relnamespace
+            JOIN pg_type t
+                ON t.oid = a.atttypid
+            JOIN pg_namespace tn
+                ON tn.oid = t.typnamespace
+            LEFT JOIN pg_attrdef ad
+                ON ad.adrelid = a.attrelid
+                AND ad.adnum = a.attnum
+            LEFT JOIN pg_constraint con
+                ON con.conrelid = a.attrelid
+                AND con.contype IN ('p', 'u', 'f')
+                AND a.attnum = ANY(con.conkey)
+            WHERE
+                a.attnum > 0
+                AND NOT a.attisdropped
+                AND c.relkind IN ('r', 'v', 'f', 'p')
+                AND n.nspname = ANY(%(namespaces)s)
+                AND ((%(table_name)s::TEXT IS NULL AND NOT c.relispartition)
+                     OR c.relname = %(table_name)s)
+            ORDER BY
+                n.nspname::TEXT,
+                c.relname::TEXT,
+                a.attname::TEXT""",
+
+    indexes=INDEXES_QUERY,
+
+    partitions=PARTITIONS_QUERY,
+
+    storage=STORAGE_QUERY,
+
+    permissions="""SELECT
+                table_schema,
+                table_name,
+                grantee,
+                privilege_type
+            FROM (
+                SELECT
+                    n.nspname::TEXT AS table_schema,
+                    c.relname::TEXT AS table_name,
+                    COALESCE(r.rolname::TEXT, 'PUBLIC') AS grantee,
+                    acl.privilege_type
+                FROM
+                    pg_class c
+                JOIN pg_namespace n
+                    ON n.oid = c.relnamespace
+                CROSS JOIN LATERAL aclexplode(
+                    COALESCE(c.relacl, acldefault('r', c.relowner))) acl
+                LEFT JOIN pg_roles r
+                    ON r.oid = acl.grantee
+                WHERE
+                    c.relkind IN ('r', 'v', 'f', 'p')
+                    AND n.nspname = ANY(%(namespaces)s)
+                    AND ((%(table_name)s::TEXT IS NULL
+                          AND NOT c.relispartition)
+                         OR c.relname = %(table_name)s)
+            ) grants
+            WHERE
+                grantee NOT in('postgres', 'PUBLIC')
+            ORDER BY
+                table_schema,
+                table_name,
+                grantee,
+                privilege_type""",
+)
+
+
+BACKENDS = {
+    INFORMATION_SCHEMA: INFORMATION_SCHEMA_QUERIES,
+    PG_CATALOG: PG_CATALOG_QUERIES,
+}
+
+
+def get_queries(backend: str = INFORMATION_SCHEMA) -> dict:
+    if backend not in BACKENDS.keys():
+        raise NameError("Unknown introspection backend: {}. Expected one "
+                        "of {}".format(backend, ', '.join(BACKENDS.keys())))
+
+    return BACKENDS[backend]
@@ -0,0 +1,301 @@
+"""Prime newly created tables with the rows of their seed file
+
+A seed file is a JSON array of rows, each either an object keyed by column
+name or an array of values in column order. The file is parsed
+incrementally and the rows streamed into the table with COPY ... FROM
+STDIN as CSV, so memory stays flat however large the file is and no INSERT
+statements are built.
+
+Usage
+---------
+spec = JsonSpec(filepath='my_table.json')
+rows = seed_table(spec.TableDefinition, db_conn, namespace='public')
+
+"""
+import io
+import json
+
+from psycopg2.extensions import connection
+
+from describe import TableDefinition
+from migrate import quote_ident, quote_table
+
+READ_SIZE = 64 * 1024
+
+JSON_TYPES = ('json', 'jsonb')
+BOOLEAN_TYPES = ('bool', 'boolean')
+
+WHITESPACE = ' \t\n\r'
+NUMBER_CHARACTERS = '0123456789.eE+-'
+# The longest token that can fail to decode only for being cut off, \uXXXX
+MAX_TOKEN_LENGTH = 6
+
+
+def iter_json_array(handle, read_size: int = READ_SIZE):
+    """
+    Yield the elements of a JSON array read from a text file handle,
+    holding no more than one element and one read in memory at a time.
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+
+    def fill() -> bool:
+        nonlocal buffer, position, eof
+        chunk = handle.read(read_size)
+        buffer = buffer[position:] + chunk
+        position = 0
+        eof = not chunk
+        return bool(chunk)
+
+    def incomplete(error: json.JSONDecodeError) -> bool:
+        # Cut off by the end of the buffer, rather than malformed
+        return (error.msg.startswith('Unterminated string')
+                or len(buffer) - error.pos <= MAX_TOKEN_LENGTH)
+
+    def skip_whitespace():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in WHITESPACE:
+                position += 1
+            if position < len(buffer) or not fill():
+                return
+
+    skip_whitespace()
+    if buffer[position:position + 1] != '[':
+        raise ValueError("A seed file must contain a JSON array")
+    position += 1
+
+    skip_whitespace()
+    if buffer[position:position + 1] == ']':
+        return
+
+    while True:
+        skip_whitespace()
+        while True:
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+                # A number may continue into the next read
+                if (eof or not isinstance(element, (int, float))
+                        or (end < len(buffer)
+                            and buffer[end] not in NUMBER_CHARACTERS)):
+                    break
+            except json.JSONDecodeError as error:
+                if eof or not incomplete(error):
+                    raise
+            fill()
+        position = end
+        yield element
+
+        skip_whitespace()
+        separator = buffer[position:position + 1]
+        position += 1
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError("Expected ',' or ']' in the seed file, "
+                             "found {!r}".format(separator))
+
+
+def format_array(values: list) -> str:
+    """
+    Format a list as a PostgreSQL array literal.
+    """
+
+    items = list()
+    for value in values:
+        if value is None:
+            items.append('NULL')
+        elif isinstance(value, list):
+            items.append(format_array(value))
+        else:
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+            items.append('"' + value + '"')
+
+    return '{' + ','.join(items) + '}'
+
+
+def boolean_value(column, value) -> str:
+    """
+    Convert a JSON boolean to its COPY text. Strings such as 'false' or 'f'
+    are passed through for PostgreSQL to parse, and any other value is
+    rejected rather than judged by its truthiness.
+    """
+
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, str):
+        return value
+
+    raise ValueError("The seed value for boolean column {} must be true, "
+                     "false or a string, not {!r}".format(column.name, value))
+
+
+def column_converter(column):
+    """
+    Return a function converting a JSON value to the text COPY expects for
+    a column, based on its type.
+    """
+
+    column_type = column.type.lower()
+
+    if column_type in JSON_TYPES:
+        return lambda value: json.dumps(value)
+    if column_type in BOOLEAN_TYPES:
+        return lambda value: boolean_value(column, value)
+    if column_type.endswith('[]'):
+        return lambda value: format_array(value) \
+            if isinstance(value, list) else value
+
+    return lambda value: value
+
+
+def get_seed_columns(definition: TableDefinition, row) -> list:
+    """
+    The ColumnDefinition's a seed file populates, in table order. Object
+    rows populate the columns named by the first row, array rows the
+    leading columns.
+    """
+
+    if isinstance(row, dict):
+        names = set(row.keys())
+        unknown = names - set(column.name for column
+                              in definition.column_definitions)
+        if unknown:
+            raise NameError("The seed file for {} has unknown columns: "
+                            "{}".format(definition.name, sorted(unknown)))
+        return [column for column in definition.column_definitions
+                if column.name in names]
+
+    if len(row) > len(definition.column_definitions):
+        raise NameError("The seed file for {} has more values than the "
+                        "table has columns".format(definition.name))
+
+    return definition.column_definitions[:len(row)]
+
+
+def csv_value(value) -> str:
+    """
+    Format a value as a CSV field. NULL is the only unquoted empty field,
+    so COPY can tell it from an empty string.
+    """
+
+    if value is None:
+        return ''
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return '"\\x' + bytes(value).hex() + '"'
+
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class CsvRowStream(io.TextIOBase):
+    """A readable file of CSV text, formatted from rows as it is read
+
+    Values are converted with column_converter, then csv_value.
+    """
+
+    def __init__(self, rows, columns: list):
+        self.rows = rows
+        self.names = [column.name for column in columns]
+        self.converters = [column_converter(column) for column in columns]
+        self.pending = ''
+        self.row_count = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def format_row(self, row) -> str:
+        if isinstance(row, dict):
+            values = [row.get(name) for name in self.names]
+        else:
+            values = list(row) + [None] * (len(self.names) - len(row))
+
+        return ','.join('' if value is None else csv_value(converter(value))
+                        for converter, value
+                        in zip(self.converters, values)) + '\n'
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self.pending) < size:
+            lines = list()
+            for row in self.rows:
+                lines.append(self.format_row(row))
+                if len(lines) >= 1000:
+                    break
+            if not lines:
+                break
+
+            self.row_count += len(lines)
+            self.pending += ''.join(lines)
+
+        if size < 0:
+            size = len(self.pending)
+
+        text, self.pending = self.pending[:size], self.pending[size:]
+
+        return text
+
+
+def seed_table(definition: TableDefinition,
+               db_conn: connection,
+               path: str = None,
+               namespace: str = None,
+               read_size: int = READ_SIZE) -> int:
+    """
+    Stream a seed file into a table with COPY, returning the number of
+    rows loaded. The path and namespace default to the definition's seed
+    and namespace. The caller commits.
+    """
+
+    path = path or definition.seed
+    namespace = namespace or definition.namespace
+    if path is None:
+        raise NameError("No seed file is set for {}".format(definition.name))
+
+    with open(path) as handle:
+        rows = iter_json_array(handle, read_size)
+
+        try:
+            first = next(rows)
+        except StopIteration:
+            return 0
+
+        def all_rows():
+            yield first
+            yield from rows
+
+        columns = get_seed_columns(definition, first)
+        stream = CsvRowStream(all_rows(), columns)
+
+        cursor = db_conn.cursor()
+        cursor.copy_expert(
+            'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+                quote_table(namespace, definition.name),
+                ', '.join(quote_ident(column.name) for column in columns)),
+            stream,
+            size=read_size)
+        cursor.close()
+
+    return stream.row_count
+
+
+def seed_new_tables(results: list, db_conn: connection) -> dict:
+    """
+    Seed every table a migration created that has a seed file, returning
+    a dict of table name to the number of rows loaded.
+    """
+
+    loaded = dict()
+
+    for result in results:
+        if result.new_table and result.spec.seed is not None:
+            loaded[result.name] = seed_table(result.spec,
+                                             db_conn,
+                                             namespace=result.namespace)
+
+    db_conn.commit()
+
+    return loaded
@@ -0,0 +1,482 @@
+"""Synchronise data into a table from its spec's source or query
+
+Rows are read from the source with a server-side named cursor, a batch of
+fetch_size rows at a time. Each batch is converted with the fields'
+parse_with_function by a converter compiled once per table, see
+convert.py, then streamed with COPY into a temporary staging table. Once
+every batch is staged, a single INSERT ... ON CONFLICT upserts the rows
+into the table on its primary key.
+
+A spec's source is an Airflow connection id and object name, e.g.
+'warehouse.public.events'. Airflow is only needed to resolve the
+connection; pass source_conn to sync from any DB-API connection instead.
+
+Specs with incremental watermark fields only pull rows beyond the last
+watermark, a page at a time with keyset pagination. The watermark of each
+table is kept in a pjs_sync_state table alongside it, and updated in the
+same transaction as the upsert. A full reconciliation pass re-reads every
+row and deletes those no longer in the source.
+
+Usage
+---------
+spec = JsonSpec(filepath='events.json')
+result = sync_table(spec.TableDefinition, db_conn,
+                    source_conn=source_conn, fetch_size=50000)
+
+"""
+from psycopg2.extensions import connection
+
+from convert import compile_batch_converter
+from describe import TableDefinition
+from migrate import quote_ident, quote_table
+from seed import CsvRowStream
+
+FETCH_SIZE = 10000
+STAGING_PREFIX = 'pjs_staging_'
+STATE_TABLE = 'pjs_sync_state'
+# Numbers staged rows in the order they were read
+STAGING_ORDINAL = 'pjs_staged_ordinal'
+
+STATE_TABLE_SQL = """CREATE TABLE IF NOT EXISTS {} (
+        table_schema TEXT NOT NULL,
+        table_name TEXT NOT NULL,
+        watermark TEXT[],
+        incremental_syncs INT NOT NULL DEFAULT 0,
+        synced_at TIMESTAMP WITH TIME ZONE,
+        PRIMARY KEY (table_schema, table_name)
+    )"""
+
+
+def get_airflow_connection(conn_id: str):
+    try:
+        from airflow.hooks.base import BaseHook
+    except ImportError:
+        raise NameError("Airflow is required to resolve the source "
+                        "connection {}, or pass source_conn".format(conn_id))
+
+    return BaseHook.get_connection(conn_id).get_hook().get_conn()
+
+
+def split_source(source: str) -> tuple:
+    """
+    Split a spec source into its connection id and object name.
+    """
+
+    if source is None or '.' not in source:
+        raise NameError("A source must be 'connection.object', not "
+                        "{}".format(source))
+
+    return tuple(source.split('.', 1))
+
+
+def get_source_query(definition: TableDefinition) -> str:
+    if definition.query is not None:
+        with open(definition.query) as handle:
+            return handle.read().strip().rstrip(';')
+
+    _, source_object = split_source(definition.source)
+
+    return 'SELECT {} FROM {}'.format(
+        ', '.join(column.name for column in definition.column_definitions),
+        source_object)
+
+
+def open_source_cursor(source_conn, fetch_size: int):
+    """
+    Open a server-side named cursor where the source supports one, so
+    rows are only transferred as they are fetched.
+    """
+
+    if isinstance(source_conn, connection):
+        cursor = source_conn.cursor(name='pjs_sync_source')
+        cursor.itersize = fetch_size
+        return cursor
+
+    return source_conn.cursor()
+
+
+def iter_batches(cursor, fetch_size: int):
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def upsert_sql(definition: TableDefinition,
+               namespace: str,
+               staging: str) -> str:
+    primary_fields = definition.primary_key_definition.fields
+    names = [column.name for column in definition.column_definitions]
+    key = ', '.join(quote_ident(field) for field in primary_fields)
+    updates = [name for name in names if name not in primary_fields]
+
+    if updates:
+        action = 'DO UPDATE SET {}'.format(', '.join(
+            '{0} = EXCLUDED.{0}'.format(quote_ident(name))
+            for name in updates))
+    else:
+        action = 'DO NOTHING'
+
+    columns = ', '.join(quote_ident(name) for name in names)
+
+    # A key staged more than once would fail the upsert, so only its latest
+    # row is kept: the highest watermark, then the last one read
+    latest = ', '.join(['{} DESC NULLS LAST'.format(quote_ident(field))
+                        for field in definition.watermark_fields]
+                       + ['{} DESC'.format(quote_ident(STAGING_ORDINAL))])
+
+    return ('INSERT INTO {} ({}) SELECT DISTINCT ON ({}) {} FROM {} '
+            'ORDER BY {}, {} ON CONFLICT ({}) {}').format(
+                quote_table(namespace, definition.name),
+                columns,
+                key,
+                columns,
+                quote_ident(staging),
+                key,
+                latest,
+                key,
+                action)
+
+
+class SyncResult:
+    """The outcome of sync_table
+
+    Attributes
+    ----------
+    fetched : int
+        The rows read from the source
+    upserted : int
+        The rows inserted or updated in the table
+    batches : int
+        The batches fetched
+    deleted : int
+        The rows deleted by a full reconciliation
+    reconciled : bool
+        If the sync was a full reconciliation
+    watermark : list
+        The watermark of an incremental sync once it finished, as text
+
+    """
+
+    def __init__(self, fetched: int = 0, upserted: int = 0, batches: int = 0):
+        self.fetched = fetched
+        self.upserted = upserted
+        self.batches = batches
+        self.deleted = 0
+        self.reconciled = False
+        self.watermark = None
+
+
+def stage_rows(db_conn: connection,
+               definition: TableDefinition,
+               namespace: str,
+               batches) -> tuple:
+    """
+    Create a temporary staging table like the table, dropped on commit,
+    and COPY batches of rows into it, numbering them in the order they
+    were read. Returns the staging table's name and
+    a SyncResult of the rows fetched.
+    """
+
+    staging = STAGING_PREFIX + definition.name
+    columns = definition.column_definitions
+    convert = compile_batch_converter(columns)
+    result = SyncResult()
+
+    cursor = db_conn.cursor()
+    cursor.execute('CREATE TEMPORARY TABLE {} (LIKE {}, {} BIGINT '
+                   'GENERATED ALWAYS AS IDENTITY) ON COMMIT DROP'.format(
+                       quote_ident(staging),
+                       quote_table(namespace, definition.name),
+                       quote_ident(STAGING_ORDINAL)))
+
+    copy_sql = 'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+        quote_ident(staging),
+        ', '.join(quote_ident(column.name) for column in columns))
+
+    for batch in batches:
+        batch = convert(batch)
+        cursor.copy_expert(copy_sql, CsvRowStream(iter(batch), columns))
+        result.fetched += len(batch)
+        result.batches += 1
+
+    cursor.close()
+
+    return staging, result
+
+
+def upsert_batches(definition: TableDefinition,
+                   db_conn: connection,
+                   namespace: str,
+                   batches,
+                   before_commit=None) -> SyncResult:
+    """
+    Stage batches of rows, in column order, and upsert them into the table
+    on its primary key in one transaction. before_commit is called with a
+    cursor, the staging table's name and the SyncResult before committing.
+    """
+
+    try:
+        staging, result = stage_rows(db_conn, definition, namespace, batches)
+
+        cursor = db_conn.cursor()
+        cursor.execute(upsert_sql(definition, namespace, staging))
+        result.upserted = cursor.rowcount
+        if before_commit is not None:
+            before_commit(cursor, staging, result)
+        cursor.close()
+
+        db_conn.commit()
+    except Exception:
+        db_conn.rollback()
+        raise
+
+    return result
+
+
+def delete_missing_sql(definition: TableDefinition,
+                       namespace: str,
+                       staging: str) -> str:
+    key = ' AND '.join('s.{0} = t.{0}'.format(quote_ident(field))
+                       for field in definition.primary_key_definition.fields)
+
+    return ('DELETE FROM {} AS t WHERE NOT EXISTS '
+            '(SELECT 1 FROM {} AS s WHERE {})').format(
+                quote_table(namespace, definition.name),
+                quote_ident(staging),
+                key)
+
+
+def get_sync_state(db_conn: connection,
+                   namespace: str,
+                   definition: TableDefinition) -> tuple:
+    """
+    Lock the table's row in the sync state table, creating both if needed,
+    and return its watermark and the incremental syncs since the last
+    reconciliation. Concurrent syncs of the table wait on the lock.
+    """
+
+    state_table = quote_table(namespace, STATE_TABLE)
+
+    cursor = db_conn.cursor()
+    cursor.execute(STATE_TABLE_SQL.format(state_table))
+    cursor.execute('INSERT INTO {} (table_schema, table_name) '
+                   'VALUES (%s, %s) ON CONFLICT DO NOTHING'.format(
+                       state_table), (namespace, definition.name))
+    cursor.execute('SELECT watermark, incremental_syncs FROM {} '
+                   'WHERE table_schema = %s AND table_name = %s '
+                   'FOR UPDATE'.format(state_table),
+                   (namespace, definition.name))
+    watermark, incremental_syncs = cursor.fetchone()
+    cursor.close()
+
+    return watermark, incremental_syncs
+
+
+def save_sync_state(cursor,
+                    namespace: str,
+                    definition: TableDefinition,
+                    watermark: list,
+                    reconciled: bool):
+    cursor.execute('UPDATE {} SET watermark = %s, '
+                   'incremental_syncs = CASE WHEN %s THEN 0 '
+                   'ELSE incremental_syncs + 1 END, '
+                   'synced_at = now() '
+                   'WHERE table_schema = %s AND table_name = %s'.format(
+                       quote_table(namespace, STATE_TABLE)),
+                   (watermark, reconciled, namespace, definition.name))
+
+
+def keyset_fields(definition: TableDefinition) -> list:
+    """
+    The watermark fields followed by any primary key fields they don't
+    include, so every row has a distinct position in the keyset and rows
+    tied on the watermark can't fall between two pages.
+    """
+
+    return definition.watermark_fields + [
+        field for field in definition.primary_key_definition.fields
+        if field not in definition.watermark_fields]
+
+
+def keyset_query(definition: TableDefinition,
+                 source_query: str,
+                 watermark: list,
+                 fetch_size: int) -> tuple:
+    """
+    The query and parameters for the page of rows after a watermark, or the
+    first page when there is no watermark yet.
+    """
+
+    keyset = keyset_fields(definition)
+    fields = ', '.join(keyset)
+    sql = 'SELECT * FROM ({}) AS pjs_source'.format(source_query)
+    parameters = None
+
+    if watermark is not None:
+        # A watermark saved before the primary key was part of the keyset
+        # is shorter, so its ties are read again rather than skipped
+        operator = '>' if len(watermark) == len(keyset) else '>='
+        # Literal % in the source query would be read as a placeholder
+        sql = sql.replace('%', '%%') + ' WHERE ({}) {} ({})'.format(
+            ', '.join(keyset[:len(watermark)]),
+            operator,
+            ', '.join(['%s'] * len(watermark)))
+        parameters = list(watermark)
+
+    return ('{} ORDER BY {} LIMIT {}'.format(sql, fields, fetch_size),
+            parameters)
+
+
+class KeysetPages:
+    """Iterate the rows of a source beyond a watermark, a page at a time
+
+    Each page is a separate query ordered by the watermark fields, then
+    the primary key, and starting after the last row of the page before,
+    so no long running cursor or OFFSET scan is held open on the source.
+
+    Attributes
+    ----------
+    watermark : list
+        The watermark and primary key field values of the last row read
+    """
+
+    def __init__(self,
+                 source_conn,
+                 definition: TableDefinition,
+                 watermark: list,
+                 fetch_size: int):
+        names = [column.name for column in definition.column_definitions]
+        unknown = set(definition.watermark_fields) - set(names)
+        if unknown:
+            raise NameError("The watermark fields of {} aren't columns: "
+                            "{}".format(definition.name, sorted(unknown)))
+
+        self.source_conn = source_conn
+        self.definition = definition
+        self.watermark = watermark
+        self.fetch_size = fetch_size
+        self.positions = [names.index(field)
+                          for field in keyset_fields(definition)]
+
+    def __iter__(self):
+        source_query = get_source_query(self.definition)
+
+        while True:
+            cursor = self.source_conn.cursor()
+            cursor.execute(*keyset_query(self.definition,
+                                         source_query,
+                                         self.watermark,
+                                         self.fetch_size))
+            rows = cursor.fetchall()
+            cursor.close()
+            # Pages are read in their own short transactions
+            self.source_conn.rollback()
+
+            if not rows:
+                return
+
+            self.watermark = [rows[-1][position]
+                              for position in self.positions]
+            yield rows
+
+            if len(rows) < self.fetch_size:
+                return
+
+
+def sync_incremental(definition: TableDefinition,
+                     db_conn: connection,
+                     source_conn,
+                     namespace: str,
+                     fetch_size: int,
+                     reconcile: bool) -> SyncResult:
+    """
+    Sync the rows beyond the table's watermark, or every row on the first
+    sync. A reconciliation, when asked for or due after reconcile_every
+    incremental syncs, re-reads every row and deletes the table's rows
+    that are no longer in the source.
+    """
+
+    try:
+        watermark, incremental_syncs = get_sync_state(db_conn,
+                                                      namespace,
+                                                      definition)
+    except Exception:
+        db_conn.rollback()
+        raise
+
+    reconcile = reconcile or (definition.reconcile_every is not None
+                              and incremental_syncs
+                              >= definition.reconcile_every)
+    pages = KeysetPages(source_conn,
+                        definition,
+                        None if reconcile else watermark,
+                        fetch_size)
+
+    def finish(cursor, staging: str, result: SyncResult):
+        if reconcile:
+            cursor.execute(delete_missing_sql(definition, namespace, staging))
+            result.deleted = cursor.rowcount
+
+        result.reconciled = reconcile
+        result.watermark = None if pages.watermark is None else [
+            None if value is None else str(value)
+            for value in pages.watermark]
+        save_sync_state(cursor,
+                        namespace,
+                        definition,
+                        result.watermark,
+                        reconcile)
+
+    return upsert_batches(definition, db_conn, namespace, pages, finish)
+
+
+def sync_table(definition: TableDefinition,
+               db_conn: connection,
+               source_conn=None,
+               namespace: str = None,
+               fetch_size: int = FETCH_SIZE,
+               reconcile: bool = False) -> SyncResult:
+    """
+    Sync a table's source or query into it, upserting on the primary key.
+    Tables with watermark_fields sync incrementally, reconciling in full
+    when reconcile is set; others sync every row. The source connection is
+    resolved from Airflow, and closed again, when it isn't given.
+    """
+
+    namespace = namespace or definition.namespace
+
+    if not definition.primary_key_definition.fields:
+        raise NameError("A primary key is required to sync "
+                        "{}".format(definition.name))
+    if definition.source is None and definition.query is None:
+        raise NameError("No source or query is set for "
+                        "{}".format(definition.name))
+
+    owns_source = source_conn is None
+    if owns_source:
+        source_conn = get_airflow_connection(
+            split_source(definition.source)[0])
+
+    try:
+        if definition.watermark_fields:
+            return sync_incremental(definition,
+                                    db_conn,
+                                    source_conn,
+                                    namespace,
+                                    fetch_size,
+                                    reconcile)
+
+        source_cursor = open_source_cursor(source_conn, fetch_size)
+        try:
+            source_cursor.execute(get_source_query(definition))
+            return upsert_batches(definition,
+                                  db_conn,
+                                  namespace,
+                                  iter_batches(source_cursor, fetch_size))
+        finally:
+            source_cursor.close()
+    finally:
+        if owns_source:
+            source_conn.close()
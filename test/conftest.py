@@ -0,0 +1,50 @@
+import pytest
+
+from test.helpers import get_connection
+
+
+@pytest.fixture(scope="module")
+def setup_db(request):
+    def drop_db():
+        db = get_connection()
+        cursor = db.cursor()
+        cursor.execute("DROP SCHEMA IF EXISTS pjs_pytest_testing CASCADE;")
+        cursor.execute("DROP ROLE IF EXISTS pjs_pytest_role;")
+        db.commit()
+        return
+
+    db = get_connection()
+    cursor = db.cursor()
+    # Create a schema to use
+    cursor.execute("CREATE SCHEMA pjs_pytest_testing;")
+    # Create a sample table that can have additional types to test
+    cursor.execute("""CREATE TABLE pjs_pytest_testing.sample_table (
+        id bigint not null,
+        int_col int,
+        int_nn_col int not null,
+        text_col text,
+        text_nn_col text not null,
+        ts_col timestamp,
+        ts_tz_col timestamp with time zone,
+        ts_tz_default_col timestamp with time zone default now(),
+        CONSTRAINT sample_table_pkey PRIMARY KEY (id)
+    );""")
+    # Create an index
+    cursor.execute("CREATE UNIQUE INDEX pjs_index_name "
+                   "ON pjs_pytest_testing.sample_table "
+                   "USING btree(int_nn_col,text_nn_col);")
+    # Create a second table to test describing a whole schema
+    cursor.execute("""CREATE TABLE pjs_pytest_testing.other_table (
+        other_id int not null,
+        label varchar(64),
+        amount numeric(10, 2) default 0,
+        CONSTRAINT other_table_pkey PRIMARY KEY (other_id)
+    );""")
+    # Create a role to test permissions
+    cursor.execute("CREATE ROLE pjs_pytest_role;")
+    cursor.execute("""GRANT ALL
+        ON pjs_pytest_testing.sample_table
+        TO pjs_pytest_role;""")
+    db.commit()
+
+    request.addfinalizer(drop_db)
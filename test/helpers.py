@@ -3,6 +3,12 @@ import psycopg2
 import os
 import sys
 
+from convert import batch_parser
+from describe import (TableDefinition,
+                      ColumnDefinition,
+                      IndexDefinition,
+                      PrimaryKeyDefinition)
+
 
 def get_connection():
     try:
@@ -19,3 +25,38 @@ def get_connection():
 def load_sample_json(file):
     with open('test/sample_json/'+file) as sample_json:
         return json.load(sample_json)
+
+
+def get_dsn():
+    return "user={} password={} host={} port={} dbname={}".format(
+        os.environ["DB_USER"],
+        os.environ["DB_PASS"],
+        os.environ["DB_HOST"],
+        os.environ["DB_PORT"],
+        os.environ["DB_NAME"])
+
+
+@batch_parser
+def double_all(values):
+    return [value * 2 for value in values]
+
+
+def prepare_table_definition(name='migrate_table') -> TableDefinition:
+    definition = TableDefinition()
+    definition.name = name
+    definition.namespace = 'pjs_pytest_testing'
+    definition.column_definitions = [
+        ColumnDefinition(name='id', type='bigint', primary=True),
+        ColumnDefinition(name='label', type='varchar', max_length=64,
+                         nullable=True),
+        ColumnDefinition(name='amount', type='int', default_value='0',
+                         nullable=True)
+    ]
+    definition.primary_key_definition = PrimaryKeyDefinition(
+        'id', name + '_pkey')
+    definition.index_definitions = [
+        IndexDefinition(name='migrate_label_index', fields=['label'])
+    ]
+    definition.permission_definitions = []
+
+    return definition
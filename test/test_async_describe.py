@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from describe import SchemaDefinition, TableDefinition
+from queries import PG_CATALOG
+
+from test.helpers import get_connection, get_dsn
+
+psycopg = pytest.importorskip("psycopg")
+
+from async_describe import (AsyncTableDefinition,  # noqa: E402
+                            describe_schema_async,
+                            describe_tables_async)
+
+
+def run_with_connection(coroutine, *args):
+    async def run():
+        db_conn = await psycopg.AsyncConnection.connect(get_dsn())
+        try:
+            return await coroutine(*args, db_conn)
+        finally:
+            await db_conn.close()
+
+    return asyncio.run(run())
+
+
+async def describe_table(schema, name, backend, db_conn):
+    return await AsyncTableDefinition.describe(schema, name, db_conn, backend)
+
+
+async def describe_schema(namespace, backend, db_conn):
+    return await describe_schema_async(namespace, db_conn, backend)
+
+
+@pytest.mark.usefixtures("setup_db")
+class TestAsyncDescribe:
+    @pytest.mark.parametrize("backend", ['information_schema', PG_CATALOG])
+    def test_async_describe_matches_sync(self, backend):
+        expected = TableDefinition('pjs_pytest_testing',
+                                   'sample_table',
+                                   get_connection())
+        actual = run_with_connection(describe_table,
+                                     'pjs_pytest_testing',
+                                     'sample_table',
+                                     backend)
+
+        assert isinstance(actual, TableDefinition)
+        assert actual.to_json() == expected.to_json(),\
+            "The async describe should match the sync describe"
+
+    def test_async_describe_non_existing_table(self):
+        with pytest.raises(NameError):
+            run_with_connection(describe_table,
+                                'pjs_pytest_testing',
+                                'not_real',
+                                'information_schema')
+
+    def test_async_describe_schema_matches_sync(self):
+        expected = SchemaDefinition('pjs_pytest_testing', get_connection())
+        actual = run_with_connection(describe_schema,
+                                     'pjs_pytest_testing',
+                                     PG_CATALOG)
+
+        assert [d.to_json() for d in actual] == expected.to_json(),\
+            "The async schema describe should match the sync describe"
+
+    def test_async_describe_tables(self):
+        tables = [('pjs_pytest_testing', 'other_table'),
+                  ('pjs_pytest_testing', 'not_real'),
+                  ('pjs_pytest_testing', 'sample_table')]
+
+        definitions, failures = asyncio.run(
+            describe_tables_async(tables, get_dsn(), concurrency=2))
+
+        assert [d.name for d in definitions] \
+            == ['other_table', 'sample_table'],\
+            "Definitions should be returned in the requested order"
+        assert isinstance(failures[('pjs_pytest_testing', 'not_real')],
+                          NameError)
+
+    def test_async_describe_tables_replaces_broken_connections(
+            self, monkeypatch):
+        tables = [('pjs_pytest_testing', 'other_table'),
+                  ('pjs_pytest_testing', 'not_real'),
+                  ('pjs_pytest_testing', 'sample_table')]
+        rollback = psycopg.AsyncConnection.rollback
+        calls = list()
+
+        async def fail_first_rollback(self):
+            calls.append(self)
+            if len(calls) == 1:
+                raise psycopg.OperationalError("the connection is lost")
+            await rollback(self)
+
+        monkeypatch.setattr(psycopg.AsyncConnection, 'rollback',
+                            fail_first_rollback)
+
+        definitions, failures = asyncio.run(asyncio.wait_for(
+            describe_tables_async(tables, get_dsn(), concurrency=1), 30))
+
+        assert [d.name for d in definitions] \
+            == ['other_table', 'sample_table'], \
+            "A connection that fails to roll back should be replaced"
+        assert list(failures.keys()) == [('pjs_pytest_testing', 'not_real')]
+
+    def test_async_describe_tables_cancelled(self, monkeypatch):
+        describe = AsyncTableDefinition.describe
+
+        async def cancel_not_real(schema, name, db_conn, backend):
+            if name == 'not_real':
+                raise asyncio.CancelledError()
+            return await describe(schema, name, db_conn, backend)
+
+        monkeypatch.setattr(AsyncTableDefinition, 'describe',
+                            cancel_not_real)
+
+        definitions, failures = asyncio.run(describe_tables_async(
+            [('pjs_pytest_testing', 'not_real'),
+             ('pjs_pytest_testing', 'other_table')], get_dsn()))
+
+        assert [d.name for d in definitions] == ['other_table']
+        assert isinstance(failures[('pjs_pytest_testing', 'not_real')],
+                          asyncio.CancelledError), \
+            "A cancelled table should be a failure, not a definition"
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from compare import CompareSchema
+from describe import ColumnDefinition
+from executor import FAILED, OK, SKIPPED
+from migrate import MigrationPlan, MigrationStatement
+
+from test.helpers import get_connection, get_dsn, prepare_table_definition
+
+psycopg = pytest.importorskip("psycopg")
+
+from async_migrate import (compare_schema_async,  # noqa: E402
+                           estimate_plan_cost_async,
+                           execute_plan_async,
+                           migrate_async)
+
+
+def create_table(name='migrate_table'):
+    db = get_connection()
+    cursor = db.cursor()
+    cursor.execute("DROP TABLE IF EXISTS pjs_pytest_testing." + name)
+    cursor.execute("""CREATE TABLE pjs_pytest_testing.{} (
+        id bigint not null,
+        label varchar(32),
+        CONSTRAINT {}_pkey PRIMARY KEY (id)
+    );""".format(name, name))
+    cursor.execute("INSERT INTO pjs_pytest_testing.{} "
+                   "VALUES (1, 'one');".format(name))
+    db.commit()
+
+    return db
+
+
+async def compare_and_cost(spec):
+    db_conn = await psycopg.AsyncConnection.connect(get_dsn())
+    try:
+        results = await compare_schema_async(spec, db_conn,
+                                             'pjs_pytest_testing')
+        plan = CompareSchema(spec, get_connection(),
+                             'pjs_pytest_testing').plan()
+        sync_costs = [(s.cost, s.estimated_bytes) for s in plan]
+        await estimate_plan_cost_async(plan, db_conn)
+        return results, sync_costs, [(s.cost, s.estimated_bytes)
+                                     for s in plan]
+    finally:
+        await db_conn.close()
+
+
+@pytest.mark.usefixtures("setup_db")
+class TestAsyncMigrate:
+    def test_compare_and_cost_match_sync(self):
+        db = create_table()
+        spec = prepare_table_definition()
+        spec.column_definitions[1] = ColumnDefinition(
+            name='label', type='int', nullable=True)
+
+        results, sync_costs, async_costs = asyncio.run(compare_and_cost(spec))
+        expected = CompareSchema(spec, db, 'pjs_pytest_testing').results
+
+        assert [(r.name, [c.name for c, _ in r.changed_fields])
+                for r in results] \
+            == [(r.name, [c.name for c, _ in r.changed_fields])
+                for r in expected]
+        assert async_costs == sync_costs, \
+            "The async cost estimate should match the sync estimate"
+
+    def test_migrate_async(self):
+        create_table('migrate_table')
+        create_table('other_migrate_table')
+        db = get_connection()
+
+        specs = [prepare_table_definition('migrate_table'),
+                 prepare_table_definition('other_migrate_table')]
+        specs[1].index_definitions[0].name = 'other_label_index'
+
+        plan, timings, failures = asyncio.run(migrate_async(
+            specs, get_dsn(), 'pjs_pytest_testing',
+            concurrency=2, concurrently=True))
+
+        assert failures == dict()
+        assert len(timings) == len(plan) > 0
+        assert set(record['status'] for record in timings) == {OK}
+        assert not CompareSchema(specs, db, 'pjs_pytest_testing').results, \
+            "The tables should match their specs after migrating"
+
+    def test_execute_plan_async_skips_dependent_tables(self):
+        broken = MigrationStatement('ALTER TABLE pjs_pytest_testing.not_real '
+                                    'ADD COLUMN note text',
+                                    'pjs_pytest_testing', 'not_real')
+        dependent = MigrationStatement('SELECT 1',
+                                       'pjs_pytest_testing', 'dependent')
+        dependent.depends_on.append(broken)
+
+        timings, failures = asyncio.run(execute_plan_async(
+            MigrationPlan([dependent, broken]), get_dsn()))
+
+        assert set(failures.keys()) == {('pjs_pytest_testing', 'not_real'),
+                                        ('pjs_pytest_testing', 'dependent')}
+        assert [record['status'] for record in timings] == [FAILED, SKIPPED]
+
+    def test_execute_plan_async_rejects_cycles(self):
+        first = MigrationStatement('SELECT 1', 'pjs_pytest_testing', 'a')
+        second = MigrationStatement('SELECT 1', 'pjs_pytest_testing', 'b')
+        first.depends_on.append(second)
+        second.depends_on.append(first)
+
+        with pytest.raises(NameError):
+            asyncio.run(execute_plan_async(MigrationPlan([first, second]),
+                                           get_dsn()))
@@ -0,0 +1,86 @@
+import pytest
+
+import cache
+from cache import CatalogCache, get_catalog_fingerprint
+from describe import SchemaDefinition
+
+from test.helpers import get_connection
+
+
+def fail_to_describe(*args):
+    raise AssertionError("The schema should have been read from the cache")
+
+
+def test_cache_requires_an_entry():
+    with pytest.raises(NameError):
+        CatalogCache('unused', max_entries=0)
+
+
+@pytest.mark.usefixtures("setup_db")
+class TestCatalogCache:
+    def test_fingerprint_is_stable(self):
+        db = get_connection()
+
+        assert get_catalog_fingerprint(db, ['pjs_pytest_testing']) \
+            == get_catalog_fingerprint(db, ['pjs_pytest_testing']),\
+            "An unchanged catalog should have the same fingerprint"
+
+    def test_cache_hit(self, tmp_path, monkeypatch):
+        db = get_connection()
+        catalog_cache = CatalogCache(str(tmp_path))
+
+        expected = SchemaDefinition('pjs_pytest_testing', db).to_json()
+        assert catalog_cache.describe_schema('pjs_pytest_testing', db) \
+            == expected
+
+        monkeypatch.setattr(cache, 'SchemaDefinition', fail_to_describe)
+        assert catalog_cache.describe_schema('pjs_pytest_testing', db) \
+            == expected,\
+            "An unchanged schema should be served from the cache"
+
+    def test_cache_refreshes_after_ddl(self, tmp_path):
+        db = get_connection()
+        catalog_cache = CatalogCache(str(tmp_path))
+        before = get_catalog_fingerprint(db, ['pjs_pytest_testing'])
+        catalog_cache.describe_schema('pjs_pytest_testing', db)
+
+        cursor = db.cursor()
+        cursor.execute("ALTER TABLE pjs_pytest_testing.other_table "
+                       "ADD COLUMN cache_col int")
+        db.commit()
+
+        assert get_catalog_fingerprint(db, ['pjs_pytest_testing']) != before
+
+        tables = catalog_cache.describe_schema('pjs_pytest_testing', db)
+        assert 'cache_col' in tables[0]['schema'],\
+            "A changed schema should be described again"
+
+        cursor.execute("ALTER TABLE pjs_pytest_testing.other_table "
+                       "DROP COLUMN cache_col")
+        db.commit()
+
+    def test_cache_invalidate(self, tmp_path, monkeypatch):
+        db = get_connection()
+        catalog_cache = CatalogCache(str(tmp_path))
+        catalog_cache.describe_schema('pjs_pytest_testing', db)
+        catalog_cache.describe_schema('pjs_pytest_testing', db,
+                                      set_defaults=True)
+        assert len(catalog_cache.entries()) == 2
+
+        catalog_cache.invalidate(db, 'pjs_pytest_testing')
+        assert len(catalog_cache.entries()) == 1
+
+        catalog_cache.invalidate()
+        assert len(catalog_cache.entries()) == 0
+
+    def test_cache_eviction(self, tmp_path):
+        db = get_connection()
+        catalog_cache = CatalogCache(str(tmp_path), max_entries=1)
+        catalog_cache.describe_schema('pjs_pytest_testing', db)
+        catalog_cache.describe_schema('pjs_pytest_testing', db,
+                                      set_defaults=True)
+
+        assert catalog_cache.entries() \
+            == [catalog_cache.get_path(catalog_cache.get_key(
+                db, ['pjs_pytest_testing'], set_defaults=True))],\
+            "Only the most recently used entry should be kept"
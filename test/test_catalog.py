@@ -0,0 +1,67 @@
+import pytest
+
+from catalog import Catalog
+from describe import ColumnDefinition, PermissionDefinition, SchemaDefinition
+
+from test.helpers import get_connection, prepare_table_definition
+
+
+def fail_to_compare(*args):
+    raise AssertionError("Tables sharing definitions shouldn't be diffed")
+
+
+def test_catalog_shares_definitions():
+    tables = [prepare_table_definition('sample_table'),
+              prepare_table_definition('other_table')]
+    tables[0].permission_definitions = [
+        PermissionDefinition('reader', ['SELECT', 'INSERT'])]
+    tables[1].permission_definitions = [
+        PermissionDefinition('writer', ['SELECT', 'INSERT'])]
+
+    catalog = Catalog()
+    dev = catalog.add('dev', tables)
+    prod = catalog.add('prod', [prepare_table_definition('sample_table')])
+
+    assert dev[0].column_definitions[0] is prod[0].column_definitions[0]
+    assert dev[1].index_definitions[0] is prod[0].index_definitions[0]
+    assert dev[0].permission_definitions[0].grants \
+        is dev[1].permission_definitions[0].grants, \
+        "Grant lists should be interned"
+    assert len(catalog.definitions) == 6, \
+        "Only distinct definitions should be kept"
+
+
+def test_catalog_compare(monkeypatch):
+    catalog = Catalog()
+    catalog.add('dev', [prepare_table_definition('sample_table'),
+                        prepare_table_definition('other_table')])
+    prod = catalog.add('prod', [prepare_table_definition('sample_table'),
+                                prepare_table_definition('other_table')])
+    prod[1].column_definitions[1] = catalog.intern(ColumnDefinition(
+        name='label', type='text', nullable=True))
+
+    results = catalog.compare('dev', 'prod')
+
+    assert [result.name for result in results] == ['other_table']
+    assert [spec.name for spec, _ in results[0].changed_fields] == ['label']
+
+    monkeypatch.setattr('catalog.compare_tables', fail_to_compare)
+    assert catalog.compare('dev', 'dev') == list()
+
+    with pytest.raises(NameError):
+        catalog.compare('dev', 'not_real')
+
+
+@pytest.mark.usefixtures("setup_db")
+def test_catalog_describe():
+    catalog = Catalog()
+    db = get_connection()
+
+    first = catalog.describe('first', 'pjs_pytest_testing', db)
+    second = catalog.describe('second', 'pjs_pytest_testing', db)
+
+    assert [definition.to_json() for definition in first] \
+        == SchemaDefinition('pjs_pytest_testing', db).to_json()
+    assert all(column is second[0].column_definitions[index]
+               for index, column in enumerate(first[0].column_definitions))
+    assert catalog.compare('first', 'second') == list()
@@ -0,0 +1,198 @@
+import pytest
+
+from compare import (CompareSchema,
+                     compare_schemas,
+                     compare_tables,
+                     normalise_default,
+                     normalise_type,
+                     table_digests,
+                     canonical_table)
+from describe import (TableDefinition,
+                      ColumnDefinition,
+                      IndexDefinition,
+                      PermissionDefinition,
+                      PrimaryKeyDefinition)
+
+from test.helpers import get_connection
+
+
+def prepare_table_definition(name='sample_table') -> TableDefinition:
+    definition = TableDefinition()
+    definition.name = name
+    definition.column_definitions = [
+        ColumnDefinition(name='id', type='bigint', primary=True),
+        ColumnDefinition(name='label', type='varchar', max_length=64,
+                         nullable=True),
+        ColumnDefinition(name='created_at', type='timestamp',
+                         default_value='now()')
+    ]
+    definition.primary_key_definition = PrimaryKeyDefinition(
+        'id', 'sample_table_pkey')
+    definition.index_definitions = [
+        IndexDefinition(name='sample_table_pkey', unique=True,
+                        type='btree', fields=['id']),
+        IndexDefinition(name='label_index', fields=['label'])
+    ]
+    definition.permission_definitions = [
+        PermissionDefinition('reader', ['SELECT'])
+    ]
+
+    return definition
+
+
+@pytest.mark.parametrize('type, max_length, expected', [
+    ('varchar', 64, 'varchar(64)'),
+    ('character varying(64)', None, 'varchar(64)'),
+    ('INTEGER', None, 'int'),
+    ('numeric(10, 2)', None, 'numeric(10,2)'),
+    ('timestamp without time zone', None, 'timestamp'),
+])
+def test_normalise_type(type, max_length, expected):
+    assert normalise_type(type, max_length) == expected
+
+
+@pytest.mark.parametrize('default_value, expected', [
+    ("'x'::character varying", "'x'"),
+    ("'x'::character varying(10)", "'x'"),
+    ("'it''s'::text", "'it''s'"),
+    ("'{}'::text[]", "'{}'"),
+    ("'-1'::integer", '-1'),
+    ("NOW()", 'now()'),
+    ("nextval('id_seq'::regclass)", "nextval('id_seq'::regclass)"),
+])
+def test_normalise_default(default_value, expected):
+    assert normalise_default(default_value) == expected
+
+
+def test_compare_unchanged_table():
+    spec = prepare_table_definition()
+    live = prepare_table_definition()
+    live.column_definitions[1] = ColumnDefinition(
+        name='label', type='character varying(64)', max_length=64,
+        nullable=True)
+    live.column_definitions[2].default_value = 'NOW()'
+    live.index_definitions[1].type = 'btree'
+
+    assert table_digests(canonical_table(spec))['table'] \
+        == table_digests(canonical_table(live))['table'], \
+        'Equivalent definitions should share a digest'
+    assert not compare_tables(spec, live)
+
+
+def test_compare_changed_table():
+    spec = prepare_table_definition()
+    live = prepare_table_definition()
+
+    spec.column_definitions[1].max_length = 128
+    spec.column_definitions.append(ColumnDefinition(name='new', type='int'))
+    del live.column_definitions[2]
+    live.column_definitions.append(ColumnDefinition(name='old', type='int'))
+    spec.index_definitions[1].unique = True
+    spec.permission_definitions = [PermissionDefinition('reader', ['ALL']),
+                                   PermissionDefinition('writer', ['ALL'])]
+
+    result = compare_tables(spec, live)
+
+    assert result
+    assert [c.name for c in result.new_fields] == ['created_at', 'new']
+    assert [c.name for c in result.removed_fields] == ['old']
+    assert [(s.name, lv.max_length) for s, lv in result.changed_fields] \
+        == [('label', 64)]
+    assert [(s.name, lv.unique) for s, lv in result.changed_indexes] \
+        == [('label_index', False)]
+    assert result.new_indexes == [] and result.missing_indexes == [], \
+        'The primary key index should not be compared'
+    assert [p.name for p in result.new_permissions] == ['writer']
+    assert [p.name for p, _ in result.changed_permissions] == ['reader']
+    assert not result.primary_key_changed
+
+
+def test_compare_permissions_all():
+    spec = prepare_table_definition()
+    live = prepare_table_definition()
+    spec.permission_definitions = [PermissionDefinition('reader', ['ALL'])]
+    live.permission_definitions = [PermissionDefinition(
+        'reader',
+        ['DELETE', 'INSERT', 'REFERENCES', 'SELECT',
+         'TRIGGER', 'TRUNCATE', 'UPDATE'])]
+
+    assert not compare_tables(spec, live), \
+        'ALL should match every individual grant'
+
+
+def test_compare_schemas():
+    results = compare_schemas(
+        [prepare_table_definition('a'), prepare_table_definition('b')],
+        [prepare_table_definition('b'), prepare_table_definition('c')])
+
+    assert [(r.name, r.new_table, r.removed_table) for r in results] \
+        == [('a', True, False), ('c', False, True)]
+
+
+@pytest.mark.usefixtures("setup_db")
+class TestCompareSchema:
+    def test_compare_live_table_with_itself(self):
+        live = TableDefinition('pjs_pytest_testing',
+                               'sample_table',
+                               get_connection())
+
+        comparison = CompareSchema(live,
+                                   get_connection(),
+                                   'pjs_pytest_testing')
+
+        assert comparison.results == []
+
+    def test_compare_spec_with_live_table(self):
+        spec = {
+            "name": "other_table",
+            "schema": {
+                "other_id": {"type": "int"},
+                "label": {"type": "varchar", "max_length": 128,
+                          "nullable": True},
+                "amount": {"type": "numeric(10,2)", "default_value": "0",
+                           "nullable": True},
+                "added": {"type": "text", "nullable": True}
+            },
+            "primary_key": {"fields": ["other_id"]}
+        }
+
+        comparison = CompareSchema(spec,
+                                   get_connection(),
+                                   'pjs_pytest_testing')
+
+        assert len(comparison.results) == 1
+
+        result = comparison.results[0]
+        assert result.namespace == 'pjs_pytest_testing'
+        assert [c.name for c in result.new_fields] == ['added']
+        assert [s.name for s, _ in result.changed_fields] == ['label']
+        assert result.removed_fields == []
+        assert not result.primary_key_changed
+
+    def test_compare_text_defaults(self):
+        db = get_connection()
+        cursor = db.cursor()
+        cursor.execute("""CREATE TABLE pjs_pytest_testing.default_table (
+            id int PRIMARY KEY,
+            label text DEFAULT 'a',
+            code varchar(8) DEFAULT 'x',
+            status text DEFAULT 'it''s'
+        )""")
+        db.commit()
+
+        spec = {
+            "name": "default_table",
+            "schema": {
+                "id": {"type": "int"},
+                "label": {"type": "text", "default_value": "'a'",
+                          "nullable": True},
+                "code": {"type": "varchar", "max_length": 8,
+                         "default_value": "'x'", "nullable": True},
+                "status": {"type": "text", "default_value": "'it''s'",
+                           "nullable": True}
+            },
+            "primary_key": {"fields": ["id"]}
+        }
+
+        assert CompareSchema(spec, db, 'pjs_pytest_testing').results == [], \
+            "String defaults should match the casts the catalog adds"
@@ -0,0 +1,78 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+from convert import (COLUMNS,
+                     ROWS,
+                     compile_batch_converter,
+                     compile_row_converter,
+                     resolve_function)
+from describe import ColumnDefinition
+
+
+def test_resolve_function():
+    assert resolve_function('int') is int
+    assert resolve_function('str.upper') is str.upper
+    assert resolve_function('decimal.Decimal') is Decimal
+
+    with pytest.raises(NameError):
+        resolve_function('not_a_module.function')
+
+
+def prepare_columns() -> list:
+    return [ColumnDefinition(name='id', type='int'),
+            ColumnDefinition(name='label', type='text',
+                             parse_with_function='str.upper'),
+            ColumnDefinition(name='amount', type='numeric',
+                             parse_with_function='numeric'),
+            ColumnDefinition(name='created_at', type='timestamp',
+                             parse_with_function='timestamp')]
+
+
+def test_compile_row_converter():
+    convert = compile_row_converter(prepare_columns())
+
+    assert convert((1, 'a', '1.50', '2020-01-02T03:04:05Z')) \
+        == (1, 'A', Decimal('1.50'),
+            datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc))
+    assert convert((2, None, None, None)) == (2, None, None, None), \
+        "NULLs should never be parsed"
+
+    unparsed = [ColumnDefinition(name='id', type='int')]
+    assert compile_row_converter(unparsed) is None
+
+
+@pytest.mark.parametrize('mode', [ROWS, COLUMNS, None])
+def test_compile_batch_converter(mode):
+    convert = compile_batch_converter(prepare_columns(), mode)
+    created_at = datetime(2020, 1, 2)
+
+    assert convert([(1, 'a', '1.5', created_at),
+                    (2, None, 2, '2020-01-02 00:00:00')]) \
+        == [(1, 'A', Decimal('1.5'), created_at),
+            (2, None, Decimal(2), created_at)]
+    assert convert([]) == []
+
+
+def test_batch_converter_skips_converted_columns():
+    created_at = [datetime(2020, 1, 2), None]
+    columns = [ColumnDefinition(name='created_at', type='timestamp',
+                                parse_with_function='timestamp')]
+
+    converted = compile_batch_converter(columns, COLUMNS)(
+        [(value,) for value in created_at])
+
+    assert [row[0] for row in converted] == created_at
+
+
+def test_batch_parsers_take_columns():
+    columns = [ColumnDefinition(name='id', type='int'),
+               ColumnDefinition(name='amount', type='int',
+                                parse_with_function='test.helpers.double_all')]
+
+    assert compile_batch_converter(columns)([(1, 2), (2, 3)]) \
+        == [(1, 4), (2, 6)]
+
+    with pytest.raises(NameError):
+        compile_row_converter(columns)
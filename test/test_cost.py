@@ -0,0 +1,173 @@
+import pytest
+
+from compare import CompareSchema, compare_tables
+from cost import (classify_statement,
+                  estimate_plan_cost,
+                  is_volatile_default,
+                  is_widening)
+from describe import ColumnDefinition, StorageDefinition
+from migrate import (METADATA_ONLY,
+                     SCAN_NEEDED,
+                     FULL_REWRITE,
+                     plan_migration)
+
+from test.helpers import get_connection, prepare_table_definition
+
+
+@pytest.mark.parametrize('old_type, new_type, expected', [
+    ('varchar(32)', 'varchar(64)', True),
+    ('varchar(64)', 'varchar(32)', False),
+    ('varchar(32)', 'varchar', True),
+    ('varchar(32)', 'text', True),
+    ('text', 'varchar', True),
+    ('text', 'varchar(64)', False),
+    ('numeric(10,2)', 'numeric(12,2)', True),
+    ('numeric(10,2)', 'numeric(12,3)', False),
+    ('numeric(10,2)', 'numeric', True),
+    ('int', 'bigint', False),
+])
+def test_is_widening(old_type, new_type, expected):
+    assert is_widening(old_type, new_type) == expected
+
+
+def test_is_volatile_default():
+    assert is_volatile_default('random()')
+    assert is_volatile_default("(clock_timestamp() + '1 day'::interval)")
+    assert not is_volatile_default('now()')
+    assert not is_volatile_default("'text'::character varying")
+    assert not is_volatile_default(None)
+
+
+def classify_change(column, server_version=110000):
+    live = prepare_table_definition()
+    spec = prepare_table_definition()
+    spec.column_definitions = [c for c in spec.column_definitions
+                               if c.name != column.name] + [column]
+
+    statements = [statement for statement in
+                  plan_migration([compare_tables(spec, live)])
+                  if statement.sql.startswith('ALTER TABLE')]
+    assert len(statements) == 1
+
+    return classify_statement(statements[0], server_version)
+
+
+@pytest.mark.parametrize('column, server_version, expected', [
+    (ColumnDefinition(name='note', type='text', nullable=True),
+     110000, METADATA_ONLY),
+    (ColumnDefinition(name='note', type='text', default_value="''",
+                      nullable=False),
+     110000, METADATA_ONLY),
+    (ColumnDefinition(name='note', type='text', default_value="''",
+                      nullable=False),
+     100000, FULL_REWRITE),
+    (ColumnDefinition(name='note', type='float8', default_value='random()',
+                      nullable=True),
+     110000, FULL_REWRITE),
+    (ColumnDefinition(name='label', type='varchar', max_length=128,
+                      nullable=True),
+     110000, METADATA_ONLY),
+    (ColumnDefinition(name='label', type='varchar', max_length=128,
+                      nullable=False),
+     110000, SCAN_NEEDED),
+    (ColumnDefinition(name='amount', type='bigint', default_value='0',
+                      nullable=True),
+     110000, FULL_REWRITE),
+])
+def test_classify_statement(column, server_version, expected):
+    assert classify_change(column, server_version) == expected
+
+
+def test_classify_storage_changes():
+    live = prepare_table_definition()
+    spec = prepare_table_definition()
+    spec.storage_definition = StorageDefinition(parameters={'fillfactor': 70})
+    spec.index_definitions[0].tablespace = 'fast'
+
+    statements = list(plan_migration([compare_tables(spec, live)]))
+
+    assert [classify_statement(statement) for statement in statements] \
+        == [METADATA_ONLY, SCAN_NEEDED], \
+        "Storage parameters only change the catalog"
+
+    spec.storage_definition.tablespace = 'fast'
+    statements = list(plan_migration([compare_tables(spec, live)]))
+
+    assert classify_statement(statements[0]) == FULL_REWRITE, \
+        "Moving a table to another tablespace rewrites it"
+
+
+@pytest.mark.usefixtures("setup_db")
+class TestEstimatePlanCost:
+    def prepare_table(self, db):
+        cursor = db.cursor()
+        cursor.execute("DROP TABLE IF EXISTS "
+                       "pjs_pytest_testing.migrate_table")
+        cursor.execute("""CREATE TABLE pjs_pytest_testing.migrate_table (
+            id bigint not null,
+            label varchar(64),
+            amount int default 0,
+            CONSTRAINT migrate_table_pkey PRIMARY KEY (id)
+        );""")
+        cursor.execute("CREATE INDEX migrate_label_index "
+                       "ON pjs_pytest_testing.migrate_table (label)")
+        cursor.execute("INSERT INTO pjs_pytest_testing.migrate_table "
+                       "SELECT i, 'label', 0 FROM generate_series(1, 5000) i")
+        cursor.execute("ANALYZE pjs_pytest_testing.migrate_table")
+        db.commit()
+
+    def test_estimate_plan_cost(self):
+        db = get_connection()
+        self.prepare_table(db)
+
+        spec = prepare_table_definition()
+        spec.column_definitions[2] = ColumnDefinition(
+            name='amount', type='bigint', default_value='0', nullable=True)
+        spec.column_definitions.append(ColumnDefinition(
+            name='note', type='text', default_value='now()', nullable=True))
+
+        plan = CompareSchema(spec, db, 'pjs_pytest_testing').plan()
+        statement = plan.statements[0]
+
+        assert statement.cost == FULL_REWRITE
+        cursor = db.cursor()
+        cursor.execute("SELECT relpages * current_setting('block_size')::INT, "
+                       "pg_total_relation_size(oid) FROM pg_class WHERE oid = "
+                       "'pjs_pytest_testing.migrate_table'::regclass")
+        heap_bytes, total_bytes = cursor.fetchone()
+
+        assert statement.estimated_bytes == total_bytes > heap_bytes, \
+            "The rewrite should be sized with its indexes and TOAST"
+
+        with pytest.raises(NameError):
+            plan.check_budget(statement.estimated_bytes - 1)
+        plan.check_budget(statement.estimated_bytes)
+
+    def test_estimate_plan_cost_metadata_only(self):
+        db = get_connection()
+        self.prepare_table(db)
+
+        spec = prepare_table_definition()
+        spec.column_definitions.append(ColumnDefinition(
+            name='note', type='text', default_value='now()', nullable=True))
+
+        plan = CompareSchema(spec, db, 'pjs_pytest_testing').plan()
+        totals = estimate_plan_cost(plan, db)
+
+        assert [s.cost for s in plan] == [METADATA_ONLY]
+        assert totals[FULL_REWRITE] == 0 and totals[SCAN_NEEDED] == 0
+
+    def test_run_rejects_plans_over_budget(self):
+        db = get_connection()
+        self.prepare_table(db)
+
+        spec = prepare_table_definition()
+        spec.column_definitions[2] = ColumnDefinition(
+            name='amount', type='bigint', default_value='0', nullable=True)
+
+        with pytest.raises(NameError):
+            CompareSchema(spec, db, 'pjs_pytest_testing')\
+                .run(max_rewrite_bytes=0)
+
+        live = CompareSchema(spec, db, 'pjs_pytest_testing')
+        assert live.results, "Nothing should run when over budget"
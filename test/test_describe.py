@@ -2,12 +2,21 @@
 import pytest
 
 from describe import (TableDefinition,
+                      SchemaDefinition,
+                      describe_schema,
+                      describe_tables,
                       ColumnDefinition,
+                      Definition,
                       PrimaryKeyDefinition,
                       IndexDefinition,
-                      PermissionDefinition)
+                      PermissionDefinition,
+                      StorageDefinition)
 
-from test.helpers import load_sample_json, get_connection
+from queries import PG_CATALOG, get_queries
+
+from psycopg2.pool import ThreadedConnectionPool
+
+from test.helpers import load_sample_json, get_connection, get_dsn
 
 ALL_PERMISSIONS = ["DELETE",
                    "INSERT",
@@ -18,46 +27,6 @@ ALL_PERMISSIONS = ["DELETE",
                    "UPDATE"]
 
 
-@pytest.fixture(scope="module")
-def setup_db(request):
-    def drop_db():
-        db = get_connection()
-        cursor = db.cursor()
-        cursor.execute("DROP SCHEMA IF EXISTS pjs_pytest_testing CASCADE;")
-        cursor.execute("DROP ROLE IF EXISTS pjs_pytest_role;")
-        db.commit()
-        return
-
-    db = get_connection()
-    cursor = db.cursor()
-    # Create a schema to use
-    cursor.execute("CREATE SCHEMA pjs_pytest_testing;")
-    # Create a sample table that can have additional types to test
-    cursor.execute("""CREATE TABLE pjs_pytest_testing.sample_table (
-        id bigint not null,
-        int_col int,
-        int_nn_col int not null,
-        text_col text,
-        text_nn_col text not null,
-        ts_col timestamp,
-        ts_tz_col timestamp with time zone,
-        ts_tz_default_col timestamp with time zone default now(),
-        CONSTRAINT sample_table_pkey PRIMARY KEY (id)
-    );""")
-    # Create an index
-    cursor.execute("CREATE UNIQUE INDEX pjs_index_name "
-                   "ON pjs_pytest_testing.sample_table "
-                   "USING btree(int_nn_col,text_nn_col);")
-    # Create a role to test permissions
-    cursor.execute("CREATE ROLE pjs_pytest_role;")
-    cursor.execute("""GRANT ALL
-        ON pjs_pytest_testing.sample_table
-        TO pjs_pytest_role;""")
-    db.commit()
-
-    request.addfinalizer(drop_db)
-
-
 def prepare_table_definiton() -> TableDefinition:
     table_def = TableDefinition()
     table_def.name = 'sample_table'
@@ -77,6 +46,18 @@ def test_initialise_non_existing_table():
         TableDefinition('public', 'not_real', get_connection())
 
 
+@pytest.mark.usefixtures("setup_db")
+def test_initialise_unknown_backend():
+    with pytest.raises(NameError, match='Unknown introspection backend'):
+        get_queries('not_real')
+
+    with pytest.raises(NameError, match='Unknown introspection backend'):
+        TableDefinition('pjs_pytest_testing',
+                        'sample_table',
+                        get_connection(),
+                        'not_real')
+
+
 def test_column_definition():
     object = ColumnDefinition(
         name='column_name',
@@ -196,6 +177,34 @@ def test_permission_definitions():
         "The index definition should be ALL"
 
 
+def test_definitions_compare_by_value():
+    column = ColumnDefinition(name='id', type='int', nullable=True)
+    index = IndexDefinition(name='index_name', fields=['a', 'b'])
+    permission = PermissionDefinition('userrole', ['SELECT'])
+    primary_key = PrimaryKeyDefinition('id', 'table_pkey')
+
+    assert column == ColumnDefinition(name='id', type='int', nullable=True)
+    assert column != ColumnDefinition(name='id', type='int')
+    assert index == IndexDefinition(name='index_name', fields=['a', 'b'])
+    assert index != IndexDefinition(name='index_name', fields=['b', 'a'])
+    assert permission == PermissionDefinition('userrole', ['SELECT'])
+    assert primary_key == PrimaryKeyDefinition('id', 'table_pkey')
+    assert column != 'id'
+
+    assert len({column, index, permission, primary_key,
+                ColumnDefinition(name='id', type='int', nullable=True),
+                IndexDefinition(name='index_name', fields=['a', 'b']),
+                PermissionDefinition('userrole', ['SELECT']),
+                PrimaryKeyDefinition('id', 'table_pkey')}) == 4, \
+        "Equal definitions should hash alike"
+
+    with pytest.raises(AttributeError):
+        column.not_an_attribute = True
+
+    with pytest.raises(TypeError):
+        Definition()
+
+
 @pytest.mark.usefixtures("setup_db")
 class TestDescribe:
     def test_table_exists(self):
@@ -276,15 +285,26 @@ class TestDescribe:
 
         index0 = dict(
             indexname='sample_table_pkey',
-            indexdef="CREATE UNIQUE INDEX sample_table_pkey "
-                     "ON pjs_pytest_testing.sample_table USING btree (id)"
+            is_unique=True,
+            method='btree',
+            fields=['id'],
+            include=[],
+            predicate=None,
+            opclasses=None,
+            parameters=None,
+            tablespace=None
         )
 
         index1 = dict(
             indexname='pjs_index_name',
-            indexdef="CREATE UNIQUE INDEX pjs_index_name "
-                     "ON pjs_pytest_testing.sample_table "
-                     "USING btree (int_nn_col, text_nn_col)"
+            is_unique=True,
+            method='btree',
+            fields=['int_nn_col', 'text_nn_col'],
+            include=[],
+            predicate=None,
+            opclasses=None,
+            parameters=None,
+            tablespace=None
         )
 
         assert index0 == index_list[0],\
@@ -358,9 +378,250 @@ class TestDescribe:
         assert grant.to_json() == permission_def[0].to_json(),\
             "The user should be granted all permissions"
 
+    @pytest.mark.parametrize("name", ['sample_table', 'other_table'])
+    def test_describe_pg_catalog_backend(self, name):
+        expected = TableDefinition('pjs_pytest_testing',
+                                   name,
+                                   get_connection())
+        actual = TableDefinition('pjs_pytest_testing',
+                                 name,
+                                 get_connection(),
+                                 PG_CATALOG)
+
+        assert actual.get_column_list() == expected.get_column_list(),\
+            "Both backends should return identical column rows"
+        assert actual.get_index_list() == expected.get_index_list(),\
+            "Both backends should return identical index rows"
+        assert actual.get_permission_list() \
+            == expected.get_permission_list(),\
+            "Both backends should return identical permission rows"
+        assert actual.to_json() == expected.to_json(),\
+            "Both backends should describe the table identically"
+
+    @pytest.mark.parametrize("backend", ['information_schema', PG_CATALOG])
+    def test_describe_structured_indexes(self, backend):
+        db = get_connection()
+        cursor = db.cursor()
+        cursor.execute("DROP TABLE IF EXISTS pjs_pytest_testing.index_table")
+        cursor.execute("""CREATE TABLE pjs_pytest_testing.index_table (
+            id int not null,
+            label text,
+            tags text[],
+            deleted_at timestamp
+        );""")
+        for sql in ["CREATE INDEX index_table_lower ON "
+                    "pjs_pytest_testing.index_table (lower(label), id)",
+                    "CREATE UNIQUE INDEX index_table_covering ON "
+                    "pjs_pytest_testing.index_table (id) INCLUDE (label) "
+                    "WHERE deleted_at IS NULL",
+                    "CREATE INDEX index_table_tags ON "
+                    "pjs_pytest_testing.index_table USING gin (tags)",
+                    "CREATE INDEX index_table_pattern ON "
+                    "pjs_pytest_testing.index_table "
+                    "(label text_pattern_ops, id)"]:
+            cursor.execute(sql)
+        db.commit()
+
+        indexes = TableDefinition('pjs_pytest_testing', 'index_table', db,
+                                  backend).index_definitions
+        cursor.execute("DROP TABLE pjs_pytest_testing.index_table")
+        db.commit()
+
+        assert indexes == [
+            IndexDefinition(name='index_table_lower', type='btree',
+                            fields=['(lower(label))', 'id'],
+                            unique=False, include=[], opclasses={}),
+            IndexDefinition(name='index_table_covering', type='btree',
+                            fields=['id'], unique=True, include=['label'],
+                            predicate='deleted_at IS NULL', opclasses={}),
+            IndexDefinition(name='index_table_tags', type='gin',
+                            fields=['tags'], unique=False, include=[],
+                            opclasses={}),
+            IndexDefinition(name='index_table_pattern', type='btree',
+                            fields=['label', 'id'], unique=False,
+                            include=[],
+                            opclasses={'label': 'text_pattern_ops'}),
+        ]
+
+    @pytest.mark.parametrize("backend", ['information_schema', PG_CATALOG])
+    def test_describe_storage(self, backend):
+        db = get_connection()
+        cursor = db.cursor()
+        cursor.execute("""CREATE UNLOGGED TABLE
+            pjs_pytest_testing.storage_table (
+                id int not null,
+                label text,
+                CONSTRAINT storage_table_pkey PRIMARY KEY (id)
+            ) WITH (fillfactor = 70, toast.autovacuum_enabled = off)""")
+        cursor.execute("CREATE INDEX storage_table_label ON "
+                       "pjs_pytest_testing.storage_table (label) "
+                       "WITH (fillfactor = 80)")
+        db.commit()
+
+        try:
+            definition = TableDefinition('pjs_pytest_testing',
+                                         'storage_table', db, backend)
+            schema = SchemaDefinition('pjs_pytest_testing', db, backend)
+        finally:
+            cursor.execute("DROP TABLE pjs_pytest_testing.storage_table")
+            db.commit()
+
+        assert definition.storage_definition == StorageDefinition(
+            parameters={'fillfactor': 70, 'toast.autovacuum_enabled': False},
+            unlogged=True)
+        assert definition.index_definitions[1].parameters \
+            == {'fillfactor': 80}
+        assert definition.to_json()['storage'] \
+            == dict(parameters={'fillfactor': 70,
+                                'toast.autovacuum_enabled': False},
+                    unlogged=True)
+        assert schema.get_table_definition('storage_table') \
+            .storage_definition == definition.storage_definition
+        assert schema.get_table_definition('sample_table') \
+            .storage_definition == StorageDefinition(),\
+            "Tables with default storage should have an empty definition"
+
     def test_describe_to_json(self):
         expected = load_sample_json('pjs_pytest_test_sample_table.json')
         definition = TableDefinition('pjs_pytest_testing',
                                      'sample_table',
                                      get_connection())
         assert definition.to_json() == expected
+
+
+@pytest.mark.usefixtures("setup_db")
+class TestDescribeSchema:
+    def test_initialise_missing_params_schema(self):
+        with pytest.raises(NameError):
+            SchemaDefinition('pjs_pytest_testing')
+
+    def test_describe_schema_tables(self):
+        definitions = describe_schema('pjs_pytest_testing', get_connection())
+
+        assert [d.name for d in definitions] \
+            == ['other_table', 'sample_table'],\
+            "Every table in the schema should be described, ordered by name"
+
+        assert all(d.namespace == 'pjs_pytest_testing' for d in definitions)
+
+    def test_describe_schema_matches_table_definition(self):
+        schema = SchemaDefinition(['pjs_pytest_testing'], get_connection())
+
+        for name in ('sample_table', 'other_table'):
+            expected = TableDefinition('pjs_pytest_testing',
+                                       name,
+                                       get_connection())
+            actual = schema.get_table_definition(name)
+
+            assert actual.to_json() == expected.to_json(),\
+                "The schema wide describe should match the table describe"
+
+    def test_describe_schema_pg_catalog_backend(self):
+        expected = SchemaDefinition('pjs_pytest_testing', get_connection())
+        actual = SchemaDefinition('pjs_pytest_testing',
+                                  get_connection(),
+                                  PG_CATALOG)
+
+        assert actual.to_json() == expected.to_json(),\
+            "Both backends should describe the schema identically"
+
+    @pytest.mark.parametrize("backend", ['information_schema', PG_CATALOG])
+    def test_describe_schema_collapses_partitions(self, backend):
+        db = get_connection()
+        cursor = db.cursor()
+        cursor.execute("""CREATE TABLE pjs_pytest_testing.events_table (
+            id bigint not null,
+            created_at date not null,
+            CONSTRAINT events_table_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at);""")
+        for day in (1, 2, 3):
+            cursor.execute(
+                "CREATE TABLE pjs_pytest_testing.events_table_p2024010{0} "
+                "PARTITION OF pjs_pytest_testing.events_table FOR VALUES "
+                "FROM ('2024-01-0{0}') TO ('2024-01-0{1}')".format(
+                    day, day + 1))
+        db.commit()
+
+        try:
+            definitions = describe_schema('pjs_pytest_testing', db, backend)
+            single = TableDefinition('pjs_pytest_testing', 'events_table',
+                                     db, backend)
+        finally:
+            cursor.execute("DROP TABLE pjs_pytest_testing.events_table")
+            db.commit()
+
+        assert [d.name for d in definitions] \
+            == ['events_table', 'other_table', 'sample_table'],\
+            "Child partitions should be collapsed into their parent"
+
+        partition = definitions[0].partition_definition
+        assert (partition.strategy, partition.fields) \
+            == ('range', ['created_at'])
+        assert sorted(partition.partitions.keys()) \
+            == ['events_table_p20240101', 'events_table_p20240102',
+                'events_table_p20240103']
+        assert partition.partitions['events_table_p20240101'] \
+            == "FOR VALUES FROM ('2024-01-01') TO ('2024-01-02')"
+        assert definitions[0].to_json()['partition'] \
+            == dict(strategy='range', fields=['created_at'])
+        assert single.partition_definition == partition
+        assert definitions[1].partition_definition is None
+
+    def test_describe_schema_unknown_table(self):
+        schema = SchemaDefinition('pjs_pytest_testing', get_connection())
+
+        with pytest.raises(NameError):
+            schema.get_table_definition('not_real')
+
+
+@pytest.mark.usefixtures("setup_db")
+class TestDescribeTables:
+    tables = [('pjs_pytest_testing', 'sample_table'),
+              ('pjs_pytest_testing', 'not_real'),
+              ('pjs_pytest_testing', 'other_table')]
+
+    def test_describe_tables_requires_a_pool(self):
+        with pytest.raises(NameError):
+            describe_tables(self.tables)
+
+    def test_describe_tables_with_dsn(self):
+        definitions, failures = describe_tables(self.tables,
+                                                dsn=get_dsn(),
+                                                workers=2)
+
+        assert [d.name for d in definitions] \
+            == ['sample_table', 'other_table'],\
+            "Definitions should be returned in the requested order"
+
+        assert list(failures.keys()) \
+            == [('pjs_pytest_testing', 'not_real')],\
+            "The missing table should be collected as a failure"
+        assert isinstance(failures[('pjs_pytest_testing', 'not_real')],
+                          NameError)
+
+    def test_describe_tables_with_pool(self):
+        pool = ThreadedConnectionPool(1, 2, get_dsn())
+        definitions, failures = describe_tables(self.tables[::2], pool=pool)
+
+        expected = TableDefinition('pjs_pytest_testing',
+                                   'sample_table',
+                                   get_connection())
+
+        assert len(failures) == 0
+        assert definitions[0].to_json() == expected.to_json(),\
+            "The parallel describe should match the table describe"
+        assert not pool.closed,\
+            "A pool passed in should be left open"
+
+        pool.closeall()
+
+    def test_describe_tables_with_a_small_pool(self):
+        pool = ThreadedConnectionPool(1, 1, get_dsn())
+        definitions, failures = describe_tables(self.tables[::2] * 4,
+                                                pool=pool,
+                                                workers=4)
+        pool.closeall()
+
+        assert failures == dict(), \
+            "Workers should be capped at the pool's maxconn"
+        assert len(definitions) == 8
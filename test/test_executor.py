@@ -0,0 +1,170 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+from psycopg2.pool import ThreadedConnectionPool
+
+from compare import compare_tables
+from executor import (FAILED,
+                      OK,
+                      RETRY,
+                      SKIPPED,
+                      dependency_graph,
+                      execute_plan,
+                      group_statements,
+                      order_statements)
+from migrate import MigrationPlan, MigrationStatement, plan_migration
+
+from test.helpers import get_connection, get_dsn, prepare_table_definition
+
+
+def statement(sql, table='a', transactional=True):
+    return MigrationStatement(sql, 'pjs_pytest_testing', table,
+                              transactional=transactional)
+
+
+def test_order_statements():
+    first = statement('first')
+    second = statement('second')
+    third = statement('third')
+    first.depends_on.append(third)
+
+    assert [s.sql for s in order_statements([first, second, third])] \
+        == ['second', 'third', 'first']
+
+    third.depends_on.append(first)
+    with pytest.raises(NameError):
+        order_statements([first, second, third])
+
+
+def test_planned_dependencies():
+    spec = prepare_table_definition()
+    plan = plan_migration([compare_tables(spec, None)])
+
+    create, index = plan.statements
+    assert index.depends_on == [create], \
+        "Indexes should be built after their table is created"
+
+
+def test_dependency_graph():
+    parent = statement('parent', 'a')
+    child = statement('child', 'b')
+    child.depends_on.append(parent)
+    other = statement('other', 'c')
+
+    statements, graph = dependency_graph(
+        MigrationPlan([child, other, parent]))
+
+    assert graph == {('pjs_pytest_testing', 'a'): set(),
+                     ('pjs_pytest_testing', 'b'):
+                         {('pjs_pytest_testing', 'a')},
+                     ('pjs_pytest_testing', 'c'): set()}
+
+
+def test_group_statements():
+    statements = [statement('one'),
+                  statement('two'),
+                  statement('three', transactional=False),
+                  statement('four')]
+
+    assert [[s.sql for s in group]
+            for group in group_statements(statements)] \
+        == [['one', 'two'], ['three'], ['four']]
+
+
+def table_plan(*names) -> MigrationPlan:
+    results = list()
+    for name in names:
+        spec = prepare_table_definition(name)
+        spec.index_definitions = list()
+        results.append(compare_tables(spec, None))
+
+    return plan_migration(results)
+
+
+@pytest.mark.usefixtures("setup_db")
+class TestExecutePlan:
+    def drop_tables(self, *names):
+        db = get_connection()
+        cursor = db.cursor()
+        for name in names:
+            cursor.execute("DROP TABLE IF EXISTS pjs_pytest_testing." + name)
+        db.commit()
+
+    def test_execute_plan(self):
+        self.drop_tables('executor_a', 'executor_b')
+        log = io.StringIO()
+
+        timings, failures = execute_plan(table_plan('executor_a',
+                                                    'executor_b'),
+                                         dsn=get_dsn(),
+                                         workers=2,
+                                         log=log)
+
+        assert failures == dict()
+        assert [record['status'] for record in timings] == [OK, OK]
+        assert [json.loads(line) for line in
+                log.getvalue().splitlines()] == timings, \
+            "Every timing record should be logged as a line of JSON"
+        assert all(record['duration'] >= 0 for record in timings)
+
+    def test_execute_plan_with_a_small_pool(self):
+        names = ['executor_{}'.format(i) for i in range(4)]
+        self.drop_tables(*names)
+        pool = ThreadedConnectionPool(1, 1, get_dsn())
+
+        timings, failures = execute_plan(table_plan(*names),
+                                         pool=pool,
+                                         workers=4)
+        pool.closeall()
+
+        assert failures == dict(), \
+            "Workers should be capped at the pool's maxconn"
+        assert [record['status'] for record in timings] == [OK] * 4
+
+    def test_execute_plan_retries_on_lock_timeout(self):
+        self.drop_tables('executor_a')
+        execute_plan(table_plan('executor_a'), dsn=get_dsn())
+
+        locker = get_connection()
+        cursor = locker.cursor()
+        cursor.execute("LOCK TABLE pjs_pytest_testing.executor_a "
+                       "IN ACCESS EXCLUSIVE MODE")
+
+        plan = MigrationPlan([statement(
+            'ALTER TABLE pjs_pytest_testing.executor_a ADD COLUMN note text',
+            'executor_a')])
+        outcome = dict()
+
+        def run():
+            outcome['result'] = execute_plan(plan,
+                                             dsn=get_dsn(),
+                                             lock_timeout=100,
+                                             retries=10,
+                                             backoff=0.05)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        time.sleep(0.5)
+        locker.rollback()
+        thread.join()
+
+        timings, failures = outcome['result']
+        assert failures == dict()
+        assert RETRY in [record['status'] for record in timings]
+        assert timings[-1]['status'] == OK
+
+    def test_execute_plan_skips_dependent_tables(self):
+        broken = statement('ALTER TABLE pjs_pytest_testing.not_real '
+                           'ADD COLUMN note text', 'not_real')
+        dependent = statement('SELECT 1', 'executor_b')
+        dependent.depends_on.append(broken)
+
+        timings, failures = execute_plan(MigrationPlan([dependent, broken]),
+                                         dsn=get_dsn())
+
+        assert set(failures.keys()) == {('pjs_pytest_testing', 'not_real'),
+                                        ('pjs_pytest_testing', 'executor_b')}
+        assert [record['status'] for record in timings] == [FAILED, SKIPPED]
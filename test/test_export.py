@@ -0,0 +1,147 @@
+import json
+import os
+
+import pytest
+
+from describe import SchemaDefinition, TableDefinition
+from export import (MANIFEST_NAME,
+                    export_schema,
+                    format_spec,
+                    get_namespaces,
+                    main)
+from jsonspec import load_spec_directory
+
+from test.helpers import get_connection, get_dsn
+
+
+def test_export_requires_a_pool(tmp_path):
+    with pytest.raises(NameError):
+        export_schema(str(tmp_path), 'pjs_pytest_testing')
+
+
+def test_format_spec_is_deterministic():
+    assert format_spec(dict(name='a', indexes=dict(), schema=dict())) \
+        == format_spec(dict(schema=dict(), name='a', indexes=dict())), \
+        "Specs should serialise the same whatever order keys were set in"
+
+
+@pytest.mark.usefixtures("setup_db")
+class TestExportSchema:
+    def test_export_schema(self, tmp_path):
+        output = str(tmp_path)
+        report = export_schema(output, 'pjs_pytest_testing', dsn=get_dsn())
+
+        directory = os.path.join(output, 'pjs_pytest_testing')
+        assert report.written == [os.path.join(directory, 'other_table.json'),
+                                  os.path.join(directory, 'sample_table.json')]
+        assert report.is_valid
+
+        expected = SchemaDefinition('pjs_pytest_testing', get_connection())
+        with open(os.path.join(directory, 'sample_table.json')) as handle:
+            assert json.load(handle) \
+                == expected.get_table_definition('sample_table').to_json()
+
+        definitions, load_report = load_spec_directory(output, workers=1)
+        assert load_report.is_valid, str(load_report)
+        assert sorted(definitions.keys()) == ['other_table', 'sample_table']
+
+        with open(os.path.join(output, MANIFEST_NAME)) as handle:
+            manifest = json.load(handle)
+        assert manifest['namespaces']['pjs_pytest_testing']['tables'] \
+            == ['other_table', 'sample_table']
+
+        report = export_schema(output, 'pjs_pytest_testing', dsn=get_dsn())
+        assert report.skipped == ['pjs_pytest_testing'], \
+            "An unchanged namespace should be skipped when resuming"
+
+        report = export_schema(output, 'pjs_pytest_testing', dsn=get_dsn(),
+                               resume=False)
+        assert report.written == []
+        assert len(report.unchanged) == 2, \
+            "Unchanged tables should leave their spec files untouched"
+
+        os.remove(os.path.join(directory, 'other_table.json'))
+        report = export_schema(output, 'pjs_pytest_testing', dsn=get_dsn())
+        assert report.written == [os.path.join(directory, 'other_table.json')]
+
+    def test_export_table_without_primary_key(self, tmp_path):
+        db = get_connection()
+        cursor = db.cursor()
+        cursor.execute("CREATE TABLE pjs_pytest_testing.keyless_table "
+                       "(label text)")
+        db.commit()
+
+        output = str(tmp_path)
+        path = os.path.join(output, 'pjs_pytest_testing',
+                            'keyless_table.json')
+        try:
+            export_schema(output, 'pjs_pytest_testing', dsn=get_dsn(),
+                          workers=2)
+            with open(path) as handle:
+                assert 'primary_key' not in json.load(handle)
+        finally:
+            cursor.execute("DROP TABLE pjs_pytest_testing.keyless_table")
+            db.commit()
+
+        report = export_schema(output, 'pjs_pytest_testing', dsn=get_dsn())
+        assert report.removed == [path], \
+            "Specs of dropped tables should be removed"
+        assert not os.path.exists(path)
+
+    def test_export_with_defaults_loads(self, tmp_path):
+        output = str(tmp_path)
+        export_schema(output, 'pjs_pytest_testing', dsn=get_dsn(),
+                      set_defaults=True)
+
+        definitions, load_report = load_spec_directory(output, workers=1)
+        assert load_report.is_valid, str(load_report)
+        assert len(definitions) == 2
+
+    def test_export_keeps_going_past_a_failed_table(self, tmp_path,
+                                                    monkeypatch):
+        output = str(tmp_path)
+        export_schema(output, 'pjs_pytest_testing', dsn=get_dsn())
+        path = os.path.join(output, 'pjs_pytest_testing', 'other_table.json')
+
+        extract = TableDefinition.extract_column_definitions
+
+        def fail_other_table(self, columns):
+            if self.name == 'other_table':
+                raise NameError('Name and type are mandatory requirements')
+            return extract(self, columns)
+
+        monkeypatch.setattr(TableDefinition, 'extract_column_definitions',
+                            fail_other_table)
+        report = export_schema(output, 'pjs_pytest_testing', dsn=get_dsn(),
+                               resume=False)
+
+        assert list(report.table_failures.keys()) \
+            == [('pjs_pytest_testing', 'other_table')]
+        assert not report.is_valid
+        assert len(report.unchanged) == 1, \
+            "The rest of the namespace should still be exported"
+        assert report.removed == [] and os.path.exists(path), \
+            "The spec of a failed table should be kept"
+
+        with open(os.path.join(output, MANIFEST_NAME)) as handle:
+            entry = json.load(handle)['namespaces']['pjs_pytest_testing']
+        assert list(entry['failures'].keys()) == ['other_table']
+
+        monkeypatch.undo()
+        report = export_schema(output, 'pjs_pytest_testing', dsn=get_dsn())
+        assert report.skipped == [], \
+            "A namespace with failed tables should be exported again"
+        assert report.is_valid
+
+    def test_export_whole_database(self, tmp_path):
+        namespaces = get_namespaces(get_connection())
+        assert 'pjs_pytest_testing' in namespaces
+        assert 'pg_catalog' not in namespaces
+        assert 'information_schema' not in namespaces
+
+        assert main([get_dsn(), str(tmp_path),
+                     '--namespace', 'pjs_pytest_testing',
+                     '--backend', 'pg_catalog']) == 0
+        assert os.path.exists(os.path.join(str(tmp_path),
+                                           'pjs_pytest_testing',
+                                           'sample_table.json'))
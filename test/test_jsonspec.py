@@ -1,10 +1,20 @@
+import json
+import os
+import subprocess
+import sys
+
+import jsonschema
+import pytest
+
 import jsonspec
 
 from describe import (TableDefinition,
                       ColumnDefinition,
                       IndexDefinition,
+                      PartitionDefinition,
                       PermissionDefinition,
-                      PrimaryKeyDefinition)
+                      PrimaryKeyDefinition,
+                      StorageDefinition)
 
 from test.helpers import load_sample_json
 
@@ -14,6 +24,38 @@ def test_pjs_schema_is_valid():
         'The rule schema loaded is valid json'
 
 
+def test_import_is_lazy_and_path_independent(tmp_path):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = ("import sys; sys.path.insert(0, {!r}); import jsonspec; "
+              "assert jsonspec.get_pjs_schema.cache_info().currsize == 0; "
+              "assert 'jsonschema' not in sys.modules; "
+              "assert jsonspec.validate_schema({{'schema': {{'a': "
+              "{{'type': 'int'}}}}}})").format(root)
+
+    subprocess.check_call([sys.executable, '-c', script], cwd=str(tmp_path))
+
+
+def test_pjs_schema_cache_is_written_atomically(tmp_path, monkeypatch):
+    cache_path = str(tmp_path / 'pjs.schema.marshal')
+    monkeypatch.setattr(jsonspec, 'PJS_SCHEMA_CACHE_PATH', cache_path)
+    jsonspec.get_pjs_schema.cache_clear()
+
+    try:
+        schema = jsonspec.get_pjs_schema()
+    finally:
+        jsonspec.get_pjs_schema.cache_clear()
+
+    assert os.listdir(str(tmp_path)) == ['pjs.schema.marshal'], \
+        "The marshalled copy should be moved into place, not left aside"
+
+    monkeypatch.setattr(jsonspec, 'load_file', None)
+    try:
+        assert jsonspec.get_pjs_schema() == schema, \
+            "The marshalled copy should be reused"
+    finally:
+        jsonspec.get_pjs_schema.cache_clear()
+
+
 def test_validate_a_valid_schema():
     valid_schema = load_sample_json('valid_schema.json')
 
@@ -24,6 +66,26 @@ def test_validate_a_valid_schema():
         'The target schema loaded is valid to the pjs schema'
 
 
+def test_validator_is_built_once():
+    assert jsonspec.get_validator() is jsonspec.get_validator(), \
+        'The compiled validator is reused between calls'
+
+
+@pytest.mark.parametrize('fast', [True, False])
+def test_validate_an_invalid_schema(fast):
+    invalid_schema = load_sample_json('valid_schema.json')
+    invalid_schema['schema']['minimum']['nullable'] = 'yes'
+
+    with pytest.raises(jsonschema.ValidationError) as expected:
+        jsonschema.validate(invalid_schema, jsonspec.PJS_SCHEMA)
+
+    with pytest.raises(jsonschema.ValidationError) as actual:
+        jsonspec.validate_schema(invalid_schema, fast=fast)
+
+    assert str(actual.value) == str(expected.value), \
+        'The error raised matches jsonschema.validate'
+
+
 def test_load_file():
     file = 'test/sample_json/valid_schema.json'
     valid_schema = jsonspec.load_file(file)
@@ -66,3 +128,160 @@ def test_jsonspec_loads_a_tabledefinition():
     expected_key.add_field("field1").add_field("field2")
     assert spec.TableDefinition.primary_key_definition.to_json(spec) \
         == expected_key.to_json()
+
+
+def test_jsonspec_loads_a_partition():
+    spec = load_sample_json('valid_schema.json')
+    spec['partition'] = dict(strategy='range', fields=['field1'],
+                             interval='month', retention=12)
+
+    definition = jsonspec.JsonSpec(text=json.dumps(spec)).TableDefinition
+
+    assert definition.partition_definition == PartitionDefinition(
+        strategy='range', fields=['field1'], interval='month', retention=12)
+    assert definition.to_json()['partition'] == dict(
+        strategy='range', fields=['field1'], interval='month', retention=12,
+        expire='detach')
+
+    spec['partition']['interval'] = 'fortnight'
+    with pytest.raises(jsonschema.ValidationError):
+        jsonspec.validate_schema(spec)
+
+
+def test_jsonspec_loads_storage():
+    spec = load_sample_json('valid_schema.json')
+    spec['storage'] = dict(parameters={'fillfactor': 70,
+                                       'toast.autovacuum_enabled': False},
+                           unlogged=True)
+    spec['indexes']['simple_index']['parameters'] = {'fillfactor': 90}
+    spec['indexes']['simple_index']['tablespace'] = 'fast'
+
+    definition = jsonspec.JsonSpec(text=json.dumps(spec)).TableDefinition
+
+    assert definition.storage_definition == StorageDefinition(
+        parameters={'fillfactor': 70, 'toast.autovacuum_enabled': False},
+        unlogged=True)
+    assert definition.to_json()['storage'] == spec['storage']
+    index = definition.index_definitions[0]
+    assert (index.parameters, index.tablespace) == ({'fillfactor': 90},
+                                                    'fast')
+
+    spec['storage']['parameters'] = {'fill factor': 70}
+    with pytest.raises(jsonschema.ValidationError):
+        jsonspec.validate_schema(spec)
+
+
+def write_spec(path, name=None, **changes):
+    spec = load_sample_json('valid_schema.json')
+    spec.pop('name')
+    if name is not None:
+        spec['name'] = name
+    spec.update(changes)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(spec))
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_load_spec_directory(tmp_path, workers):
+    write_spec(tmp_path / 'a.json', 'table_a')
+    write_spec(tmp_path / 'nested' / 'table_b.json')
+    write_spec(tmp_path / 'nested' / 'deeper' / 'c.json', 'table_c')
+    write_spec(tmp_path / 'not_a_spec.txt', 'ignored')
+
+    definitions, report = jsonspec.load_spec_directory(str(tmp_path),
+                                                       workers=workers)
+
+    assert report.is_valid
+    assert sorted(definitions.keys()) == ['table_a', 'table_b', 'table_c'], \
+        'Specs without a name are named after their file'
+    assert type(definitions['table_b']) is TableDefinition
+    assert len(definitions['table_b'].column_definitions) == 2
+
+
+def test_load_spec_directory_report(tmp_path):
+    write_spec(tmp_path / 'a.json', 'table_a')
+    write_spec(tmp_path / 'b.json', 'table_a')
+    write_spec(tmp_path / 'invalid.json', 'table_c', schema={})
+    (tmp_path / 'broken.json').write_text('{')
+
+    definitions, report = jsonspec.load_spec_directory(str(tmp_path),
+                                                       workers=2)
+
+    assert list(definitions.keys()) == ['table_a']
+    assert not report.is_valid
+
+    assert sorted(report.errors.keys()) \
+        == [str(tmp_path / 'broken.json'), str(tmp_path / 'invalid.json')]
+    assert report.errors[str(tmp_path / 'invalid.json')] \
+        .startswith('ValidationError')
+
+    assert report.duplicates \
+        == {'table_a': [str(tmp_path / 'a.json'), str(tmp_path / 'b.json')]}
+    assert 'Duplicate table table_a' in str(report)
+
+
+def test_spec_registry(tmp_path, monkeypatch):
+    write_spec(tmp_path / 'a.json', 'table_a')
+    write_spec(tmp_path / 'b.json', 'table_b')
+    registry = jsonspec.SpecRegistry(str(tmp_path))
+
+    changes = registry.refresh()
+    assert changes.added == ['table_a', 'table_b']
+    assert sorted(registry.definitions.keys()) == ['table_a', 'table_b']
+
+    loads = list()
+    original_load_schema = jsonspec.JsonSpec.load_schema
+
+    def counting_load_schema(self, json_spec):
+        loads.append(json_spec.get('name'))
+        return original_load_schema(self, json_spec)
+
+    monkeypatch.setattr(jsonspec.JsonSpec, 'load_schema', counting_load_schema)
+
+    assert not registry.refresh(), \
+        'Unchanged files should not be reported'
+
+    os.utime(str(tmp_path / 'a.json'), ns=(0, 0))
+    assert not registry.refresh(), \
+        'A touched file with the same content is unchanged'
+    assert loads == [], \
+        'Files with unchanged content should not be re-parsed'
+
+    write_spec(tmp_path / 'a.json', 'table_a', source='mysql.changed')
+    write_spec(tmp_path / 'c.json', 'table_c')
+    (tmp_path / 'b.json').unlink()
+
+    changes = registry.refresh()
+    assert changes.added == ['table_c']
+    assert changes.modified == ['table_a']
+    assert changes.removed == ['table_b']
+    assert sorted(loads) == ['table_a', 'table_c'], \
+        'Only the changed files should be re-parsed'
+    assert sorted(registry.definitions.keys()) == ['table_a', 'table_c']
+
+
+def test_spec_registry_errors(tmp_path):
+    write_spec(tmp_path / 'a.json', 'table_a')
+    registry = jsonspec.SpecRegistry(str(tmp_path))
+    registry.refresh()
+
+    (tmp_path / 'a.json').write_text('{')
+    write_spec(tmp_path / 'b.json', 'table_a')
+
+    changes = registry.refresh()
+    assert not changes
+    assert list(registry.report.errors.keys()) == [str(tmp_path / 'a.json')]
+    assert 'table_a' in registry.definitions, \
+        'A spec that fails to load keeps its last good definition'
+    assert registry.report.duplicates == {
+        'table_a': [str(tmp_path / 'a.json'), str(tmp_path / 'b.json')]}
+
+    write_spec(tmp_path / 'a.json', 'renamed')
+
+    changes = registry.refresh()
+    assert changes.added == ['renamed']
+    assert changes.modified == ['table_a'], \
+        'A table moved to another file is reported as modified'
+    assert changes.removed == []
+    assert registry.report.is_valid
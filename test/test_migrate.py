@@ -0,0 +1,467 @@
+from datetime import date, timedelta
+
+import pytest
+
+from compare import CompareSchema, compare_tables
+from describe import (ColumnDefinition,
+                      IndexDefinition,
+                      PartitionDefinition,
+                      PermissionDefinition,
+                      PrimaryKeyDefinition,
+                      StorageDefinition)
+from migrate import (ADD_COLUMN,
+                     ALTER_TYPE,
+                     CREATE_PARTITION,
+                     DETACH_PARTITION,
+                     DROP_PARTITION,
+                     DROP_COLUMN,
+                     RESET_PARAMETERS,
+                     SET_NOT_NULL,
+                     SET_PARAMETERS,
+                     SET_TABLESPACE,
+                     SET_UNLOGGED,
+                     index_sql,
+                     plan_migration)
+
+from test.helpers import get_connection, prepare_table_definition
+
+
+def test_plan_merges_column_changes_into_one_alter():
+    live = prepare_table_definition()
+    spec = prepare_table_definition()
+    spec.column_definitions[1] = ColumnDefinition(
+        name='label', type='varchar', max_length=128, nullable=False)
+    spec.column_definitions[2] = ColumnDefinition(
+        name='amount', type='bigint', default_value='1', nullable=True)
+    spec.column_definitions.append(
+        ColumnDefinition(name='note', type='text', nullable=True))
+    live.column_definitions.append(
+        ColumnDefinition(name='legacy', type='text', nullable=True))
+
+    plan = plan_migration([compare_tables(spec, live)])
+
+    alters = [s for s in plan if s.sql.startswith('ALTER TABLE')]
+    assert len(alters) == 1, "Column changes should share one ALTER TABLE"
+
+    kinds = [action.kind for action in alters[0].actions]
+    assert DROP_COLUMN in kinds and ADD_COLUMN in kinds
+    assert kinds.count(ALTER_TYPE) == 2
+    assert SET_NOT_NULL in kinds
+
+    sql = alters[0].sql
+    assert 'ALTER COLUMN "label" TYPE varchar(128)' in sql
+    assert 'ALTER COLUMN "amount" DROP DEFAULT' in sql
+    assert sql.index('DROP DEFAULT') < sql.index('"amount" TYPE') \
+        < sql.index('SET DEFAULT 1'), \
+        "Defaults should be dropped before, and set after, a type change"
+    assert 'DROP COLUMN "label"' not in sql, \
+        "Changed columns should be altered in place"
+
+
+def test_plan_unchanged_table_is_empty():
+    result = compare_tables(prepare_table_definition(),
+                            prepare_table_definition())
+
+    assert len(plan_migration([result])) == 0
+
+
+def test_plan_new_table():
+    spec = prepare_table_definition()
+    spec.permission_definitions = [PermissionDefinition('reader',
+                                                        ['SELECT'])]
+
+    plan = plan_migration([compare_tables(spec, None)])
+    sql = [statement.sql for statement in plan]
+
+    assert sql[0].startswith(
+        'CREATE TABLE "pjs_pytest_testing"."migrate_table"')
+    assert 'CONSTRAINT "migrate_table_pkey" PRIMARY KEY ("id")' in sql[0]
+    assert sql[1].startswith('CREATE INDEX "migrate_label_index"')
+    assert sql[2] == ('GRANT SELECT ON "pjs_pytest_testing"."migrate_table" '
+                      'TO "reader"')
+
+
+def test_plan_skips_removed_tables_unless_asked():
+    result = compare_tables(None, prepare_table_definition())
+
+    assert len(plan_migration([result])) == 0
+    assert plan_migration([result], drop_tables=True).to_sql() \
+        == 'DROP TABLE "pjs_pytest_testing"."migrate_table";\n'
+
+
+def test_plan_drops_indexes_before_altering_columns():
+    live = prepare_table_definition()
+    spec = prepare_table_definition()
+    spec.column_definitions.pop(1)
+    spec.index_definitions = [IndexDefinition(name='migrate_amount_index',
+                                              fields=['amount'])]
+
+    sql = [statement.sql for statement in
+           plan_migration([compare_tables(spec, live)])]
+
+    assert sql[0].startswith('DROP INDEX IF EXISTS')
+    assert sql[1].startswith('ALTER TABLE')
+    assert sql[2].startswith('CREATE INDEX "migrate_amount_index"')
+
+
+def test_index_sql_structured_indexes():
+    index = IndexDefinition(name='label_index',
+                            type='btree',
+                            fields=['(lower(label))', 'label', 'id'],
+                            include=['amount'],
+                            predicate='amount > 0',
+                            opclasses={'label': 'text_pattern_ops'})
+
+    assert index_sql(index, 'public', 'table') \
+        == ('CREATE INDEX "label_index" ON "public"."table" USING btree '
+            '((lower(label)), "label" "text_pattern_ops", "id") '
+            'INCLUDE ("amount") WHERE amount > 0')
+
+
+@pytest.mark.usefixtures("setup_db")
+def test_compare_schema_run():
+    db = get_connection()
+    cursor = db.cursor()
+    cursor.execute("DROP TABLE IF EXISTS pjs_pytest_testing.migrate_table")
+    cursor.execute("""CREATE TABLE pjs_pytest_testing.migrate_table (
+        id bigint not null,
+        label varchar(32),
+        legacy text,
+        CONSTRAINT migrate_table_pkey PRIMARY KEY (id)
+    );""")
+    cursor.execute("INSERT INTO pjs_pytest_testing.migrate_table "
+                   "VALUES (1, 'one', 'old');")
+    db.commit()
+
+    migrations = CompareSchema(prepare_table_definition(),
+                               db,
+                               'pjs_pytest_testing')
+    assert migrations.results, "The live table should differ from the spec"
+
+    migrations.run()
+
+    assert not CompareSchema(prepare_table_definition(),
+                             db,
+                             'pjs_pytest_testing').results, \
+        "The table should match the spec after migrating"
+
+    cursor.execute("SELECT label, amount "
+                   "FROM pjs_pytest_testing.migrate_table")
+    assert cursor.fetchall() == [('one', 0)], \
+        "Existing rows should be kept"
+
+
+def test_plan_storage_changes():
+    live = prepare_table_definition()
+    live.storage_definition = StorageDefinition(
+        parameters={'fillfactor': 100, 'autovacuum_enabled': 'off'})
+    spec = prepare_table_definition()
+    spec.storage_definition = StorageDefinition(
+        parameters={'fillfactor': 70, 'toast.autovacuum_enabled': False},
+        tablespace='fast', unlogged=True)
+    spec.index_definitions[0].parameters = {'fillfactor': 90}
+    spec.index_definitions[0].tablespace = 'fast'
+
+    result = compare_tables(spec, live)
+    assert not result.changed_indexes and result.changed_index_storage, \
+        "Indexes that only differ in storage should not be rebuilt"
+
+    statements = list(plan_migration([result]))
+    assert [[action.kind for action in statement.actions]
+            for statement in statements] \
+        == [[RESET_PARAMETERS, SET_PARAMETERS, SET_TABLESPACE, SET_UNLOGGED],
+            [SET_PARAMETERS], [SET_TABLESPACE]]
+    assert statements[0].sql \
+        == ('ALTER TABLE "pjs_pytest_testing"."migrate_table"\n'
+            '    RESET (autovacuum_enabled),\n'
+            '    SET (fillfactor = 70, toast.autovacuum_enabled = false),\n'
+            '    SET TABLESPACE "fast",\n'
+            '    SET UNLOGGED')
+    assert statements[1].sql \
+        == ('ALTER INDEX "pjs_pytest_testing"."migrate_label_index" '
+            'SET (fillfactor = 90)')
+
+    statements = list(plan_migration([result], concurrently=True))
+    assert statements[2].sql \
+        == ('REINDEX (TABLESPACE "fast") INDEX CONCURRENTLY '
+            '"pjs_pytest_testing"."migrate_label_index"')
+    assert not statements[2].transactional
+
+    live.storage_definition.parameters = {'fillfactor': '70',
+                                          'toast.autovacuum_enabled': 'off'}
+    live.storage_definition.tablespace = 'fast'
+    live.storage_definition.unlogged = True
+    live.index_definitions[0].parameters = {'fillfactor': 90}
+    live.index_definitions[0].tablespace = 'fast'
+    assert not compare_tables(spec, live), \
+        "Parameters should compare however their values are spelled"
+
+
+def test_plan_new_table_storage():
+    spec = prepare_table_definition()
+    spec.storage_definition = StorageDefinition(
+        parameters={'fillfactor': 70}, tablespace='fast', unlogged=True)
+    spec.index_definitions[0].parameters = {'fillfactor': 90}
+
+    sql = [statement.sql for statement in
+           plan_migration([compare_tables(spec, None)])]
+
+    assert sql[0].startswith('CREATE UNLOGGED TABLE')
+    assert sql[0].endswith(') WITH (fillfactor = 70) TABLESPACE "fast"')
+    assert sql[1].endswith('("label") WITH (fillfactor = 90)')
+
+
+@pytest.mark.usefixtures("setup_db")
+def test_compare_schema_run_storage():
+    db = get_connection()
+    cursor = db.cursor()
+    cursor.execute("DROP TABLE IF EXISTS pjs_pytest_testing.migrate_table")
+    db.commit()
+
+    spec = prepare_table_definition()
+    spec.storage_definition = StorageDefinition(
+        parameters={'fillfactor': 70, 'autovacuum_enabled': False},
+        unlogged=True)
+    spec.index_definitions[0].parameters = {'fillfactor': 90}
+    CompareSchema(spec, db, 'pjs_pytest_testing').run()
+    assert not CompareSchema(spec, db, 'pjs_pytest_testing').results
+
+    spec.storage_definition = StorageDefinition(
+        parameters={'autovacuum_vacuum_scale_factor': 0.01})
+    spec.index_definitions[0].parameters = {}
+    CompareSchema(spec, db, 'pjs_pytest_testing').run()
+    assert not CompareSchema(spec, db, 'pjs_pytest_testing').results, \
+        "The table's storage should match the spec after migrating"
+
+    cursor.execute("SELECT relpersistence, reloptions FROM pg_class "
+                   "WHERE oid = 'pjs_pytest_testing.migrate_table'::regclass")
+    assert cursor.fetchall() \
+        == [('p', ['autovacuum_vacuum_scale_factor=0.01'])]
+
+    cursor.execute("DROP TABLE pjs_pytest_testing.migrate_table")
+    db.commit()
+
+
+def prepare_partitioned_definition():
+    definition = prepare_table_definition('partitioned_table')
+    definition.column_definitions = [
+        ColumnDefinition(name='id', type='bigint', primary=True),
+        ColumnDefinition(name='created_at', type='date', primary=True)]
+    definition.primary_key_definition = PrimaryKeyDefinition(
+        'id', 'partitioned_table_pkey')
+    definition.primary_key_definition.add_field('created_at')
+    definition.index_definitions = []
+    definition.partition_definition = PartitionDefinition(
+        strategy='range', fields=['created_at'], interval='day', premake=2,
+        retention=1, expire='drop')
+
+    return definition
+
+
+def test_plan_partitions():
+    spec = prepare_partitioned_definition()
+    live = prepare_partitioned_definition()
+    live.partition_definition.partitions = {
+        'partitioned_table_p20240101': '', 'partitioned_table_p20240109': ''}
+
+    plan = plan_migration([compare_tables(spec, live,
+                                          today=date(2024, 1, 10))])
+    statements = list(plan)
+
+    assert [[action.kind for action in statement.actions]
+            for statement in statements] \
+        == [[CREATE_PARTITION] * 3, [DETACH_PARTITION], [DROP_PARTITION]]
+    assert statements[0].sql.count('PARTITION OF') == 3, \
+        "Partitions should be created in one statement"
+    assert statements[1].depends_on == [statements[0]]
+    assert statements[2].depends_on == [statements[1]]
+    assert statements[1].sql \
+        == ('ALTER TABLE "pjs_pytest_testing"."partitioned_table" DETACH '
+            'PARTITION "pjs_pytest_testing"."partitioned_table_p20240101"')
+
+    live.partition_definition.strategy = 'list'
+    with pytest.raises(NameError):
+        plan_migration([compare_tables(spec, live)])
+
+
+@pytest.mark.usefixtures("setup_db")
+def test_compare_schema_run_partitions():
+    db = get_connection()
+    cursor = db.cursor()
+    cursor.execute("DROP TABLE IF EXISTS "
+                   "pjs_pytest_testing.partitioned_table")
+    db.commit()
+
+    CompareSchema(prepare_partitioned_definition(), db,
+                  'pjs_pytest_testing').run()
+
+    today = date.today()
+    for days in (-5, -1):
+        day = today + timedelta(days=days)
+        cursor.execute(
+            "CREATE TABLE pjs_pytest_testing.partitioned_table_p{} "
+            "PARTITION OF pjs_pytest_testing.partitioned_table "
+            "FOR VALUES FROM ('{}') TO ('{}')".format(
+                day.strftime('%Y%m%d'), day, day + timedelta(days=1)))
+    db.commit()
+
+    CompareSchema(prepare_partitioned_definition(), db,
+                  'pjs_pytest_testing').run()
+
+    cursor.execute("SELECT c.relname FROM pg_inherits i "
+                   "JOIN pg_class c ON c.oid = i.inhrelid "
+                   "WHERE i.inhparent = "
+                   "'pjs_pytest_testing.partitioned_table'::regclass "
+                   "ORDER BY c.relname")
+    assert [row[0] for row in cursor.fetchall()] \
+        == ['partitioned_table_p' + (today + timedelta(days=days))
+            .strftime('%Y%m%d') for days in (-1, 0, 1, 2)], \
+        "Upcoming partitions should be created and expired ones dropped"
+    assert not CompareSchema(prepare_partitioned_definition(), db,
+                             'pjs_pytest_testing').results
+
+    cursor.execute("DROP TABLE pjs_pytest_testing.partitioned_table")
+    db.commit()
+
+
+def test_plan_online_index_changes():
+    live = prepare_table_definition()
+    spec = prepare_table_definition()
+    spec.index_definitions = [IndexDefinition(name='migrate_label_index',
+                                              fields=['label', 'amount'])]
+
+    plan = plan_migration([compare_tables(spec, live)], concurrently=True)
+    sql = [statement.sql for statement in plan]
+
+    assert sql == [
+        'DROP INDEX CONCURRENTLY IF EXISTS '
+        '"pjs_pytest_testing"."migrate_label_index_pjs_new"',
+        'CREATE INDEX CONCURRENTLY "migrate_label_index_pjs_new" '
+        'ON "pjs_pytest_testing"."migrate_table" '
+        'USING btree ("label", "amount")',
+        'DROP INDEX CONCURRENTLY IF EXISTS '
+        '"pjs_pytest_testing"."migrate_label_index"',
+        'ALTER INDEX "pjs_pytest_testing"."migrate_label_index_pjs_new" '
+        'RENAME TO "migrate_label_index"'
+    ]
+    assert not any(statement.transactional for statement in plan), \
+        "Concurrent index builds can't run in a transaction block"
+
+
+def test_plan_online_primary_key():
+    live = prepare_table_definition()
+    spec = prepare_table_definition()
+    spec.primary_key_definition.add_field('label')
+
+    plan = plan_migration([compare_tables(spec, live)], concurrently=True)
+    sql = [statement.sql for statement in plan]
+
+    assert sql[0].startswith('ALTER TABLE') and 'PRIMARY KEY' not in sql[0]
+    assert sql[-2].startswith('CREATE UNIQUE INDEX CONCURRENTLY '
+                              '"migrate_table_pkey_pjs_new"')
+    assert sql[-1].endswith('DROP CONSTRAINT "migrate_table_pkey",\n    '
+                            'ADD CONSTRAINT "migrate_table_pkey" PRIMARY KEY '
+                            'USING INDEX "migrate_table_pkey_pjs_new"')
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.autocommit = False
+        self.executed = list()
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql):
+        self.executed.append((sql, self.autocommit))
+
+    def close(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def test_run_follows_dependencies():
+    live = prepare_table_definition()
+    spec = prepare_table_definition()
+    spec.column_definitions[1] = ColumnDefinition(
+        name='label', type='text', nullable=True)
+    spec.index_definitions = list()
+
+    db = RecordingConnection()
+    plan_migration([compare_tables(spec, live)], concurrently=True).run(db)
+
+    assert db.executed == [
+        ('DROP INDEX CONCURRENTLY IF EXISTS '
+         '"pjs_pytest_testing"."migrate_label_index"', True),
+        ('ALTER TABLE "pjs_pytest_testing"."migrate_table"\n    '
+         'ALTER COLUMN "label" TYPE text USING "label"::text', False)
+    ], "Indexes should be dropped before the columns they use are altered"
+
+
+@pytest.mark.usefixtures("setup_db")
+def test_compare_schema_run_concurrently():
+    db = get_connection()
+    cursor = db.cursor()
+    cursor.execute("DROP TABLE IF EXISTS pjs_pytest_testing.migrate_table")
+    cursor.execute("""CREATE TABLE pjs_pytest_testing.migrate_table (
+        id bigint not null,
+        label varchar(64),
+        amount int default 0,
+        CONSTRAINT migrate_table_pkey PRIMARY KEY (id)
+    );""")
+    cursor.execute("INSERT INTO pjs_pytest_testing.migrate_table "
+                   "VALUES (1, 'one', 0), (2, 'one', 0);")
+    db.commit()
+
+    # Leave an invalid index behind, as an interrupted run would
+    db.autocommit = True
+    with pytest.raises(Exception):
+        cursor.execute("CREATE UNIQUE INDEX CONCURRENTLY "
+                       "migrate_label_index_pjs_new "
+                       "ON pjs_pytest_testing.migrate_table (label)")
+    db.autocommit = False
+
+    spec = prepare_table_definition()
+    spec.primary_key_definition.add_field('label')
+
+    CompareSchema(spec, db, 'pjs_pytest_testing').run(concurrently=True)
+
+    assert not CompareSchema(spec, db, 'pjs_pytest_testing').results, \
+        "The table should match the spec after migrating"
+
+    cursor.execute("SELECT count(*) FROM pg_index "
+                   "WHERE indrelid = 'pjs_pytest_testing.migrate_table'"
+                   "::regclass AND NOT indisvalid")
+    assert cursor.fetchone()[0] == 0, "Invalid indexes should be cleaned up"
+    db.rollback()
+
+
+@pytest.mark.usefixtures("setup_db")
+def test_compare_schema_run_concurrently_indexes_only():
+    db = get_connection()
+    cursor = db.cursor()
+    cursor.execute("DROP TABLE IF EXISTS pjs_pytest_testing.migrate_table")
+    cursor.execute("""CREATE TABLE pjs_pytest_testing.migrate_table (
+        id bigint not null,
+        label varchar(64),
+        amount int default 0,
+        CONSTRAINT migrate_table_pkey PRIMARY KEY (id)
+    );""")
+    db.commit()
+
+    spec = prepare_table_definition()
+    comparison = CompareSchema(spec, db, 'pjs_pytest_testing')
+    assert not comparison.plan(concurrently=True).statements[0] \
+        .transactional, "The plan should start outside a transaction"
+
+    # Describing the table leaves a transaction open on the connection
+    comparison.run(concurrently=True)
+
+    assert not CompareSchema(spec, db, 'pjs_pytest_testing').results, \
+        "The index should be built outside the describe's transaction"
+    db.rollback()
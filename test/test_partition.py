@@ -0,0 +1,64 @@
+from datetime import date
+
+import pytest
+
+from describe import PartitionDefinition
+from partition import (add_periods,
+                       expired_partitions,
+                       partition_start,
+                       period_start,
+                       template_partitions)
+
+
+@pytest.mark.parametrize('interval, start, next_start', [
+    ('day', date(2024, 2, 28), date(2024, 2, 29)),
+    ('week', date(2024, 2, 26), date(2024, 3, 4)),
+    ('month', date(2024, 2, 1), date(2024, 3, 1)),
+    ('year', date(2024, 1, 1), date(2025, 1, 1)),
+])
+def test_periods(interval, start, next_start):
+    assert period_start(date(2024, 2, 28), interval) == start
+    assert add_periods(start, interval, 1) == next_start
+    assert add_periods(next_start, interval, -1) == start
+
+    with pytest.raises(NameError):
+        period_start(start, 'fortnight')
+
+
+def test_template_partitions():
+    partition = PartitionDefinition(strategy='range', fields=['created_at'],
+                                    interval='month', premake=1)
+
+    assert template_partitions(partition, 'events', date(2024, 12, 15)) \
+        == {'events_p202412':
+            "FOR VALUES FROM ('2024-12-01') TO ('2025-01-01')",
+            'events_p202501':
+            "FOR VALUES FROM ('2025-01-01') TO ('2025-02-01')"}
+
+    partition = PartitionDefinition(strategy='hash', fields=['id'],
+                                    modulus=2)
+    assert template_partitions(partition, 'events') \
+        == {'events_p0': 'FOR VALUES WITH (MODULUS 2, REMAINDER 0)',
+            'events_p1': 'FOR VALUES WITH (MODULUS 2, REMAINDER 1)'}
+
+    partition = PartitionDefinition(strategy='list', fields=['region'])
+    assert template_partitions(partition, 'events') == dict()
+
+
+def test_expired_partitions():
+    partition = PartitionDefinition(strategy='range', fields=['created_at'],
+                                    interval='day', retention=2)
+    names = ['events_p20240110', 'events_p20240107', 'events_p20240108',
+             'events_p20240105', 'events_archive', 'events_p2024010']
+
+    assert expired_partitions(partition, 'events', names,
+                              date(2024, 1, 10)) \
+        == ['events_p20240105', 'events_p20240107'], \
+        "Partitions that don't follow the template should be left alone"
+
+    partition.retention = None
+    assert expired_partitions(partition, 'events', names,
+                              date(2024, 1, 10)) == list()
+
+    assert partition_start('events', 'week', 'events_p20240102') is None, \
+        "Weekly partitions should start on a Monday"
@@ -0,0 +1,125 @@
+import pytest
+
+from compare import CompareSchema, compare_tables
+from describe import PermissionDefinition
+from migrate import REVOKE, plan_migration
+from permissions import (common_permissions,
+                         diff_permissions,
+                         get_default_privileges,
+                         plan_default_privileges,
+                         reconcile_permissions)
+
+from test.helpers import get_connection, prepare_table_definition
+
+
+def prepare_permissions(name, permissions):
+    definition = prepare_table_definition(name)
+    definition.permission_definitions = [
+        PermissionDefinition(role, grants)
+        for role, grants in permissions.items()]
+
+    return definition
+
+
+def test_diff_permissions():
+    spec = [PermissionDefinition('reader', ['SELECT']),
+            PermissionDefinition('writer', ['ALL'])]
+    live = [PermissionDefinition('reader', ['SELECT', 'UPDATE']),
+            PermissionDefinition('writer', ['DELETE', 'INSERT', 'REFERENCES',
+                                            'SELECT', 'TRIGGER', 'TRUNCATE',
+                                            'UPDATE']),
+            PermissionDefinition('legacy', ['SELECT'])]
+
+    assert diff_permissions(spec, live) \
+        == [(REVOKE, 'legacy', ['SELECT']), (REVOKE, 'reader', ['UPDATE'])], \
+        "Only the privileges that differ should change"
+
+
+def test_reconcile_permissions_batches_tables():
+    results = [compare_tables(
+                   prepare_permissions(name, {'reader': ['SELECT']}),
+                   prepare_permissions(name, {'reader': ['UPDATE']}))
+               for name in ('table_a', 'table_b', 'table_c')]
+    results.append(compare_tables(
+        prepare_permissions('table_d', {'reader': ['SELECT']}), None))
+
+    statements = reconcile_permissions(results)
+
+    assert [statement.sql for statement in statements] \
+        == ['REVOKE UPDATE ON "pjs_pytest_testing"."table_a", '
+            '"pjs_pytest_testing"."table_b", "pjs_pytest_testing"."table_c" '
+            'FROM "reader"',
+            'GRANT SELECT ON "pjs_pytest_testing"."table_a", '
+            '"pjs_pytest_testing"."table_b", "pjs_pytest_testing"."table_c", '
+            '"pjs_pytest_testing"."table_d" TO "reader"']
+    assert [action.name for action in statements[1].actions] \
+        == ['table_a', 'table_b', 'table_c', 'table_d']
+    assert statements[1].table is None
+
+    assert len(reconcile_permissions(results, batch_size=3)) == 3, \
+        "Batches should be split at batch_size tables"
+
+    plan = list(plan_migration(results))
+    assert plan[0].sql.startswith('CREATE TABLE')
+    assert plan[-1].depends_on == [plan[0]], \
+        "Grants on a new table should wait for it to be created"
+
+
+def test_plan_default_privileges():
+    spec = [PermissionDefinition('reader', ['SELECT']),
+            PermissionDefinition('auditor', ['SELECT']),
+            PermissionDefinition('writer', ['INSERT', 'SELECT'])]
+    live = [PermissionDefinition('writer', ['SELECT', 'DELETE'])]
+
+    statements = plan_default_privileges('public', spec, live, 'loader')
+
+    assert [statement.sql for statement in statements] \
+        == ['ALTER DEFAULT PRIVILEGES FOR ROLE "loader" IN SCHEMA "public" '
+            'REVOKE DELETE ON TABLES FROM "writer"',
+            'ALTER DEFAULT PRIVILEGES FOR ROLE "loader" IN SCHEMA "public" '
+            'GRANT INSERT ON TABLES TO "writer"',
+            'ALTER DEFAULT PRIVILEGES FOR ROLE "loader" IN SCHEMA "public" '
+            'GRANT SELECT ON TABLES TO "auditor", "reader"']
+
+
+def test_common_permissions():
+    definitions = [
+        prepare_permissions('table_a', {'reader': ['SELECT', 'UPDATE'],
+                                        'writer': ['ALL']}),
+        prepare_permissions('table_b', {'reader': ['ALL']}),
+    ]
+
+    assert common_permissions(definitions) \
+        == [PermissionDefinition('reader', ['SELECT', 'UPDATE'])]
+    assert common_permissions([]) == []
+
+
+@pytest.mark.usefixtures("setup_db")
+def test_compare_schema_run_default_privileges():
+    db = get_connection()
+    cursor = db.cursor()
+    cursor.execute("DROP TABLE IF EXISTS pjs_pytest_testing.migrate_table")
+    db.commit()
+
+    spec = prepare_permissions('migrate_table',
+                               {'pjs_pytest_role': ['SELECT']})
+    defaults = common_permissions([spec])
+    CompareSchema(spec, db, 'pjs_pytest_testing').run(
+        default_privileges=defaults)
+
+    assert get_default_privileges(db, 'pjs_pytest_testing') == defaults
+    cursor.execute("CREATE TABLE pjs_pytest_testing.default_table (id int)")
+    cursor.execute("SELECT has_table_privilege('pjs_pytest_role', "
+                   "'pjs_pytest_testing.default_table', 'SELECT')")
+    assert cursor.fetchone()[0], \
+        "Tables created later should be granted the default privileges"
+
+    assert len(CompareSchema(spec, db, 'pjs_pytest_testing')
+               .plan(default_privileges=defaults)) == 0
+
+    CompareSchema(spec, db, 'pjs_pytest_testing').run(default_privileges=[])
+    assert get_default_privileges(db, 'pjs_pytest_testing') == []
+
+    cursor.execute("DROP TABLE pjs_pytest_testing.default_table")
+    cursor.execute("DROP TABLE pjs_pytest_testing.migrate_table")
+    db.commit()
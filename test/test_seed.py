@@ -0,0 +1,147 @@
+import io
+import json
+import tracemalloc
+
+import pytest
+
+from compare import CompareSchema
+from describe import ColumnDefinition
+from jsonspec import JsonSpec
+from seed import CsvRowStream, iter_json_array, seed_table
+
+from test.helpers import get_connection, prepare_table_definition
+
+
+@pytest.mark.parametrize('read_size', [1, 3, 7, 4096])
+def test_iter_json_array(read_size):
+    rows = [{"id": 1, "label": "a, \"quoted\" ]"},
+            [12345, None, True],
+            1.5e10,
+            "text",
+            {"nested": {"list": [1, 2, [3]]}}]
+    text = ' [\n' + ' ,\n '.join(json.dumps(row) for row in rows) + '\n] '
+
+    assert list(iter_json_array(io.StringIO(text), read_size)) == rows
+
+
+def test_iter_json_array_errors():
+    assert list(iter_json_array(io.StringIO('[ ]'))) == []
+
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('{"id": 1}')))
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('[{"id": 1} {"id": 2}]')))
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('[{"id": 1'), 2))
+
+
+def test_iter_json_array_raises_malformed_rows_early():
+    text = '[{"id": 1}, {"id": x}' + ', {"id": 2}' * 100000 + ']'
+    handle = io.StringIO(text)
+
+    with pytest.raises(ValueError):
+        list(iter_json_array(handle, 64))
+
+    assert handle.tell() < 1024, \
+        "A malformed row shouldn't read the rest of the file"
+
+
+def test_csv_row_stream():
+    columns = [ColumnDefinition(name='id', type='bigint'),
+               ColumnDefinition(name='label', type='text'),
+               ColumnDefinition(name='flag', type='boolean'),
+               ColumnDefinition(name='data', type='jsonb'),
+               ColumnDefinition(name='tags', type='text[]')]
+    rows = iter([{'id': 1, 'label': '', 'flag': True,
+                  'data': {'a': '"b"'}, 'tags': ['x', 'y "z"']},
+                 [2, None, False]])
+
+    assert CsvRowStream(rows, columns).read() == (
+        '1,"",\"true\","{""a"": ""\\""b\\""""}","{""x"",""y \\""z\\""""}"\n'
+        '2,,"false",,\n')
+
+
+def test_csv_row_stream_booleans():
+    columns = [ColumnDefinition(name='flag', type='bool')]
+    rows = iter([[True], ['false'], ['0'], [None]])
+
+    assert CsvRowStream(rows, columns).read() \
+        == '"true"\n"false"\n"0"\n\n', \
+        "Strings should be left for PostgreSQL to parse, not truth tested"
+
+    with pytest.raises(ValueError):
+        CsvRowStream(iter([[2]]), columns).read()
+
+
+def write_seed_file(path, count):
+    with open(path, 'w') as handle:
+        handle.write('[\n')
+        for i in range(count):
+            handle.write(('' if i == 0 else ',\n') + json.dumps(
+                {"id": i, "label": "label {}".format(i) * 4, "amount": i}))
+        handle.write('\n]\n')
+
+
+@pytest.mark.usefixtures("setup_db")
+class TestSeedTable:
+    def create_table(self):
+        db = get_connection()
+        cursor = db.cursor()
+        cursor.execute("DROP TABLE IF EXISTS "
+                       "pjs_pytest_testing.migrate_table")
+        db.commit()
+
+        return db
+
+    def test_seed_table_memory_stays_flat(self, tmp_path):
+        db = self.create_table()
+        spec = prepare_table_definition()
+        spec.seed = str(tmp_path / 'seed.json')
+        write_seed_file(spec.seed, 50000)
+
+        CompareSchema(spec, db, 'pjs_pytest_testing').run(seed=False)
+
+        tracemalloc.start()
+        rows = seed_table(spec, db)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        db.commit()
+
+        cursor = db.cursor()
+        cursor.execute("SELECT count(*), sum(amount) "
+                       "FROM pjs_pytest_testing.migrate_table")
+
+        assert rows == 50000
+        assert cursor.fetchone() == (50000, sum(range(50000)))
+        assert peak < (tmp_path / 'seed.json').stat().st_size / 4, \
+            "The seed file should be streamed, not held in memory"
+
+    def test_run_seeds_new_tables(self, tmp_path):
+        db = self.create_table()
+        seed_path = tmp_path / 'seed.json'
+        seed_path.write_text('[[1, "one"], [2, null]]')
+        spec_path = tmp_path / 'migrate_table.json'
+        spec_path.write_text(json.dumps({
+            "seed": "seed.json",
+            "schema": {
+                "id": {"type": "bigint"},
+                "label": {"type": "text", "nullable": True},
+                "amount": {"type": "int", "default_value": "0"}
+            },
+            "primary_key": {"fields": ["id"]}
+        }))
+
+        spec = JsonSpec(filepath=str(spec_path))
+        assert spec.TableDefinition.seed == str(seed_path)
+
+        CompareSchema(spec, db, 'pjs_pytest_testing').run()
+
+        cursor = db.cursor()
+        cursor.execute("SELECT id, label, amount "
+                       "FROM pjs_pytest_testing.migrate_table ORDER BY id")
+        assert cursor.fetchall() == [(1, 'one', 0), (2, None, 0)], \
+            "Columns missing from the seed should take their defaults"
+
+        CompareSchema(spec, db, 'pjs_pytest_testing').run()
+        cursor.execute("SELECT count(*) FROM pjs_pytest_testing.migrate_table")
+        assert cursor.fetchone()[0] == 2, "Only new tables are seeded"
@@ -0,0 +1,211 @@
+import json
+from decimal import Decimal
+
+import pytest
+
+from jsonspec import JsonSpec
+from sync import sync_table
+
+from test.helpers import get_connection
+
+
+@pytest.mark.usefixtures("setup_db")
+class TestSyncTable:
+    def prepare(self, tmp_path, spec_changes=None):
+        db = get_connection()
+        cursor = db.cursor()
+        cursor.execute("DROP TABLE IF EXISTS pjs_pytest_testing.sync_source")
+        cursor.execute("DROP TABLE IF EXISTS pjs_pytest_testing.sync_target")
+        cursor.execute("DROP TABLE IF EXISTS "
+                       "pjs_pytest_testing.pjs_sync_state")
+        cursor.execute("""CREATE TABLE pjs_pytest_testing.sync_source (
+            id int, label text, amount numeric(10, 2),
+            updated_at timestamp)""")
+        cursor.execute("INSERT INTO pjs_pytest_testing.sync_source "
+                       "SELECT i, 'label ' || i, i, "
+                       "'2020-01-01'::timestamp + i * interval '1 second' "
+                       "FROM generate_series(1, 2500) i")
+        cursor.execute("""CREATE TABLE pjs_pytest_testing.sync_target (
+            id int PRIMARY KEY, label text, amount numeric(10, 2),
+            updated_at timestamp)""")
+        cursor.execute("INSERT INTO pjs_pytest_testing.sync_target "
+                       "VALUES (1, 'stale', 0, NULL), (9999, 'kept', 0, NULL)")
+        db.commit()
+
+        spec = {
+            "name": "sync_target",
+            "source": "local.pjs_pytest_testing.sync_source",
+            "schema": {
+                "id": {"type": "int"},
+                "label": {"type": "text", "nullable": True,
+                          "parse_with_function": "str.upper"},
+                "amount": {"type": "numeric(10, 2)", "nullable": True},
+                "updated_at": {"type": "timestamp", "nullable": True}
+            },
+            "primary_key": {"fields": ["id"]}
+        }
+        spec.update(spec_changes or dict())
+        if "query" in spec:
+            del spec["source"]
+        path = tmp_path / 'sync_target.json'
+        path.write_text(json.dumps(spec))
+
+        return db, JsonSpec(filepath=str(path)).TableDefinition
+
+    def test_sync_table(self, tmp_path):
+        db, definition = self.prepare(tmp_path)
+        source = get_connection()
+
+        result = sync_table(definition, db, source,
+                            namespace='pjs_pytest_testing', fetch_size=1000)
+        source.close()
+
+        assert (result.fetched, result.upserted, result.batches) \
+            == (2500, 2500, 3)
+
+        cursor = db.cursor()
+        cursor.execute("SELECT count(*), sum(amount) "
+                       "FROM pjs_pytest_testing.sync_target")
+        assert cursor.fetchone() == (2501, Decimal(sum(range(2501))))
+
+        cursor.execute("SELECT label FROM pjs_pytest_testing.sync_target "
+                       "WHERE id = 9999")
+        assert cursor.fetchone() == ('kept',), \
+            "Rows missing from the source should be left alone"
+
+        cursor.execute("SELECT label FROM pjs_pytest_testing.sync_target "
+                       "WHERE id = 1")
+        assert cursor.fetchone() == ('LABEL 1',), \
+            "Existing rows should be updated on the primary key"
+
+    def test_sync_table_from_query(self, tmp_path):
+        (tmp_path / 'sync.sql').write_text(
+            "SELECT id, label, amount * 10 AS amount, updated_at "
+            "FROM pjs_pytest_testing.sync_source WHERE id <= 10;")
+        db, definition = self.prepare(tmp_path, {"query": "sync.sql"})
+        source = get_connection()
+
+        result = sync_table(definition, db, source,
+                            namespace='pjs_pytest_testing')
+        source.close()
+
+        assert result.fetched == 10
+        cursor = db.cursor()
+        cursor.execute("SELECT amount FROM pjs_pytest_testing.sync_target "
+                       "WHERE id = 10")
+        assert cursor.fetchone() == (Decimal('100.00'),)
+
+    def test_sync_table_requires_a_source(self, tmp_path):
+        db, definition = self.prepare(tmp_path)
+        definition.source = None
+
+        with pytest.raises(NameError):
+            sync_table(definition, db, None)
+
+    def test_sync_table_incrementally(self, tmp_path):
+        db, definition = self.prepare(tmp_path, {"incremental": {
+            "fields": ["updated_at", "id"]}})
+        source = get_connection()
+
+        def sync(**kwargs):
+            return sync_table(definition, db, source,
+                              namespace='pjs_pytest_testing',
+                              fetch_size=1000, **kwargs)
+
+        result = sync()
+        assert (result.fetched, result.batches) == (2500, 3)
+        assert result.watermark == ['2020-01-01 00:41:40', '2500']
+
+        cursor = source.cursor()
+        cursor.execute("UPDATE pjs_pytest_testing.sync_source "
+                       "SET label = 'changed', updated_at = '2021-01-01' "
+                       "WHERE id = 5")
+        cursor.execute("INSERT INTO pjs_pytest_testing.sync_source "
+                       "VALUES (2501, 'new', 0, '2020-06-01')")
+        source.commit()
+
+        result = sync()
+        assert (result.fetched, result.deleted, result.reconciled) \
+            == (2, 0, False), "Only rows beyond the watermark should sync"
+        assert sync().fetched == 0
+
+        cursor = db.cursor()
+        cursor.execute("SELECT label FROM pjs_pytest_testing.sync_target "
+                       "WHERE id IN (5, 2501) ORDER BY id")
+        assert cursor.fetchall() == [('CHANGED',), ('NEW',)]
+
+        result = sync(reconcile=True)
+        assert (result.fetched, result.deleted, result.reconciled) \
+            == (2501, 1, True), "Rows missing from the source are deleted"
+        source.close()
+
+    def test_sync_table_reconciles_every(self, tmp_path):
+        db, definition = self.prepare(tmp_path, {"incremental": {
+            "fields": ["id"], "reconcile_every": 2}})
+        source = get_connection()
+
+        results = [sync_table(definition, db, source,
+                              namespace='pjs_pytest_testing')
+                   for _ in range(4)]
+        source.close()
+
+        assert [result.reconciled for result in results] \
+            == [False, False, True, False]
+        assert [result.fetched for result in results] == [2500, 0, 2500, 0]
+
+        cursor = db.cursor()
+        cursor.execute("SELECT watermark, incremental_syncs "
+                       "FROM pjs_pytest_testing.pjs_sync_state "
+                       "WHERE table_name = 'sync_target'")
+        assert cursor.fetchone() == (['2500'], 1)
+
+    def test_sync_table_incrementally_with_ties(self, tmp_path):
+        db, definition = self.prepare(tmp_path, {"incremental": {
+            "fields": ["updated_at"]}})
+        source = get_connection()
+        cursor = source.cursor()
+        cursor.execute("UPDATE pjs_pytest_testing.sync_source "
+                       "SET updated_at = '2020-01-01'")
+        source.commit()
+
+        result = sync_table(definition, db, source,
+                            namespace='pjs_pytest_testing', fetch_size=1000)
+        source.close()
+
+        assert (result.fetched, result.batches) == (2500, 3), \
+            "Rows tied on the watermark across pages should all sync"
+        assert result.watermark == ['2020-01-01 00:00:00', '2500']
+
+    def test_sync_table_keeps_the_latest_duplicate(self, tmp_path):
+        (tmp_path / 'sync.sql').write_text(
+            "SELECT * FROM (VALUES "
+            "(1, 'first', 1.0, '2020-01-03'::timestamp), "
+            "(2, 'old', 2.0, '2020-01-01'::timestamp), "
+            "(1, 'second', 1.0, '2020-01-03'::timestamp), "
+            "(2, 'new', 2.0, '2020-01-02'::timestamp), "
+            "(2, 'older', 2.0, '2019-12-31'::timestamp)"
+            ") AS v (id, label, amount, updated_at)")
+        db, definition = self.prepare(tmp_path, {"query": "sync.sql"})
+        source = get_connection()
+
+        result = sync_table(definition, db, source,
+                            namespace='pjs_pytest_testing')
+        assert (result.fetched, result.upserted) == (5, 2)
+
+        cursor = db.cursor()
+        cursor.execute("SELECT label FROM pjs_pytest_testing.sync_target "
+                       "WHERE id IN (1, 2) ORDER BY id")
+        assert cursor.fetchall() == [('SECOND',), ('OLDER',)], \
+            "The last row read for a key should win without a watermark"
+
+        definition.watermark_fields = ['updated_at']
+        cursor.execute("DROP TABLE IF EXISTS "
+                       "pjs_pytest_testing.pjs_sync_state")
+        db.commit()
+        sync_table(definition, db, source, namespace='pjs_pytest_testing')
+        source.close()
+
+        cursor.execute("SELECT label FROM pjs_pytest_testing.sync_target "
+                       "WHERE id = 2")
+        assert cursor.fetchone() == ('NEW',), \
+            "The row with the latest watermark for a key should win"